@@ -1,89 +1,223 @@
 import os
 import logging
-from flask import Flask, render_template, request, jsonify, session
-from utils.openai_helper import get_chat_response
-import json
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
+# （APIキーやログ設定は各モジュールの読み込み時に参照されるため、最初に読み込む）
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from utils.logging_config import setup_logging, begin_request_sampling, log_payload
+
+# Configure logging（JSON形式・キュー経由で別スレッドから出力する）
+setup_logging()
+
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, url_for, g, send_from_directory
+from utils.openai_helper import get_chat_response, get_exchange_response, stream_chat_response, DEFAULT_MAX_TOKENS, JOINT_EXCHANGE
+from utils.tts_helper import get_tts_audio, audio_cache_key, tts_available, audio_mimetype, TTS_MAX_TEXT_LENGTH
+from utils.lipsync import get_lipsync_timeline
+from utils.tts_pipeline import submit_tts_chunk
+from utils.sentences import SentenceChunker
+from utils.conversation_store import create_conversation_store
+from utils.conversation_summary import summarizer
+from utils.speaker_registry import speaker_registry
+from utils.static_assets import asset_manifest, ASSET_DIST_DIR, ASSET_MAX_AGE
+from utils.rooms import generate_room_replies, validate_room
+from utils.turns import turn_registry, TurnCancelled
+from utils.executors import LazyThreadPoolExecutor
+from utils.warmup import start_warm_up, warmup_status
+from utils.chat_channel import ChatChannel, TurnAudio, CHAT_WEBSOCKET, CHAT_WEBSOCKET_PING_SECONDS
+from utils.metrics import span, render_metrics, HTTP_REQUEST_SECONDS
+from utils.admission import AdmissionRejected, check_capacity, should_degrade, LLM_DEGRADED_MAX_TOKENS
+from utils.dialogue_helper import choose_response_pattern, build_speaker_b_request, build_exchange_instruction, is_independent_pattern, SECOND_PERSON_INSTRUCTION
+import json
+import queue
+import time
+import threading
+import secrets
+import mimetypes
+import contextvars
+from concurrent.futures import CancelledError
+
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "a-very-secret-key")
 
+# 話者A/Bの並行生成（CONCURRENT_SPEAKERS=0 で従来どおり逐次実行）
+CONCURRENT_SPEAKERS = os.environ.get("CONCURRENT_SPEAKERS", "1") != "0"
+speaker_executor = LazyThreadPoolExecutor(int(os.environ.get("SPEAKER_WORKERS", "8")), "speaker")
+# /chat/stream の差分の読み出しはストリームが終わるまでスレッドを占有するので、話者の生成とは別のプールにする
+stream_executor = LazyThreadPoolExecutor(int(os.environ.get("STREAM_WORKERS", "32")), "stream")
+
+# 会話履歴はサーバー側に保存し、Cookieには不透明な会話IDだけを持たせる
+conversation_store = create_conversation_store(app)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    begin_request_sampling(request.endpoint)
+
+@app.after_request
+def observe_request_latency(response):
+    started = g.pop('request_started', None)
+    # /ws は接続している間の時間になるので除く（/healthz は監視からの問い合わせなので除く）
+    if started is not None and request.endpoint not in ('metrics', 'chat_socket', 'healthz'):
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'unknown',
+            status=response.status_code
+        )
+    return response
+
+def timed_chat_response(stage, *args, **kwargs):
+    """get_chat_response の所要時間を段階別に記録する"""
+    with span(stage):
+        return get_chat_response(*args, **kwargs)
+
+def optional_chat_response(stage, *args, **kwargs):
+    """混雑で枠が取れなければ None を返す（話者Bを省略して縮退するため）"""
+    try:
+        return timed_chat_response(stage, *args, **kwargs)
+    except AdmissionRejected as e:
+        logger.warning("Skipping %s: %s", stage, e)
+        return None
+
+def busy_response(error):
+    """混雑時の 503 応答（Retry-After つき）"""
+    return jsonify({
+        'error': 'Server is busy, please retry later',
+        'retry_after': error.retry_after
+    }), 503, {'Retry-After': str(error.retry_after)}
+
+def cancelled_response(turn):
+    """新しいメッセージで取り消されたターンの応答"""
+    return jsonify({'error': 'Superseded by a newer message', 'cancelled': True, 'turn_id': turn.id}), 409
+
+def idempotency_key(scope, conversation_id, data):
+    """Idempotency-Key ヘッダー（または本文の idempotency_key）を会話ごとのキーにする"""
+    key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if not key:
+        return None
+    return f"{scope}:{conversation_id}:{key}"
+
+def get_conversation_id():
+    """セッションの会話IDを返す（なければ発行する）"""
+    conversation_id = session.get('conversation_id')
+    if not conversation_id:
+        conversation_id = secrets.token_urlsafe(32)
+        session['conversation_id'] = conversation_id
+    return conversation_id
+
 # 話者ポジション判定用の関数
 def determine_speaker_position(speaker_id):
     """
     話者IDに基づいて、その話者が位置A(左側)かB(右側)かを判定する
-    通常の表示順序に基づいて判定
+    通常の表示順序に基づいて判定（utils/speaker_registry.py の CHARACTER_POSITIONS）
     """
-    # 通常のキャラクター表示順序
-    # 左側（話者A): ずんだもん、春日部つむぎ 
-    # 右側（話者B): 四国めたん、雨晴はう、WhiteCUL
-    speaker_a_list = [
-        "388f246b-8c41-4ac1-8e2d-5d79f3ff56d9",  # ずんだもん
-        "35b2c544-660e-401e-b503-0e14c635303a",  # 春日部つむぎ
-    ]
-    
-    speaker_b_list = [
-        "7ffcb7ce-00ec-4bdc-82cd-45a8889e43ff",  # 四国めたん  
-        "3474ee95-c274-47f9-aa1a-8322163d96f1",  # 雨晴はう
-        "67d5d8da-acd7-4207-bb10-692f330a6e70",  # WhiteCUL
-    ]
-    
-    if speaker_id in speaker_a_list:
-        return "A"
-    elif speaker_id in speaker_b_list:
-        return "B"
+    return speaker_registry.position(speaker_id)
+
+def precomputed_response(document):
+    """事前にシリアライズしたJSONを返す（gzip対応・ETagが一致すれば 304）"""
+    if request.if_none_match.contains(document.etag):
+        response = Response(status=304)
+    elif request.accept_encodings['gzip']:
+        response = Response(document.gzip_body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
     else:
-        # デフォルトは話者Aとして扱う
-        return "A"
-
-# Load VOICEVOX speaker data
-try:
-    with open('attached_assets/voicebox_speakerID.json', 'r', encoding='utf-8') as f:
-        VOICEVOX_SPEAKERS = json.load(f)
-        logger.info("Successfully loaded VOICEVOX speaker data")
-except Exception as e:
-    logger.error(f"Error loading VOICEVOX speaker data: {str(e)}")
-    VOICEVOX_SPEAKERS = []
+        response = Response(document.body, mimetype='application/json')
+    response.set_etag(document.etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # 話者データはデプロイ時にしか変わらないが、更新を拾えるよう毎回ETagで確認させる
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+@app.template_global()
+def asset_url(path):
+    """ビルド済み（ハッシュつき）のファイルがあればそのURL、なければ static/ のURL"""
+    built = asset_manifest.file(path)
+    if built:
+        return url_for('dist_asset', filename=built)
+    return url_for('static', filename=path)
 
 @app.route('/')
 def index():
-    # Initialize conversation history if not exists
-    if 'conversation_history' not in session:
-        session['conversation_history'] = []
-    return render_template('index.html')
-
-@app.route('/get-tts-key')
-def get_tts_key():
-    voicevox_key = os.environ.get('VOICEVOX_API_KEY')
-    logger.debug(f"VOICEVOX API key available: {bool(voicevox_key)}")
-    if not voicevox_key:
-        logger.error("VOICEVOX API key not configured")
-        return jsonify({'error': 'VOICEVOX API key not configured'}), 500
-    return jsonify({'key': voicevox_key})
+    # 会話IDを発行しておく（履歴本体はサーバー側のストアに保存）
+    get_conversation_id()
+    return render_template('index.html', asset_manifest=asset_manifest.client_manifest(), chat_websocket=CHAT_WEBSOCKET)
+
+@app.route('/dist/<path:filename>')
+def dist_asset(filename):
+    """tools/build_assets.py で作ったファイル（名前に内容のハッシュを含むので無期限にキャッシュさせる）"""
+    if filename in asset_manifest.precompressed and request.accept_encodings['gzip']:
+        response = send_from_directory(ASSET_DIST_DIR, filename + '.gz',
+                                       mimetype=mimetypes.guess_type(filename)[0], max_age=ASSET_MAX_AGE)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_from_directory(ASSET_DIST_DIR, filename, max_age=ASSET_MAX_AGE)
+    if filename in asset_manifest.precompressed:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/tts-status')
+def tts_status():
+    """音声合成が利用可能かどうかを返す（APIキーそのものはクライアントに渡さない）"""
+    available = tts_available()
+    logger.debug("TTS available: %s", available)
+    return jsonify({'available': available})
+
+@app.route('/tts')
+def tts():
+    """サーバー側で音声を合成して返す（内容ベースのディスクキャッシュつき）"""
+    text = request.args.get('text', '').strip()
+    style_id = request.args.get('speaker', type=int)
+
+    if not text or style_id is None:
+        return jsonify({'error': 'text and speaker are required'}), 400
+    if len(text) > TTS_MAX_TEXT_LENGTH:
+        return jsonify({'error': 'Text too long'}), 400
+
+    # キーは内容から決まるため、同じURLの音声は変わらない。再検証は合成もキャッシュの読み込みもせずに返す
+    key = audio_cache_key(text, style_id)
+    if request.if_none_match.contains(key):
+        response = Response(status=304)
+        response.set_etag(key)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+    try:
+        key, audio = get_tts_audio(text, style_id)
+    except Exception as e:
+        logger.error("Error in TTS endpoint: %s", e)
+        return jsonify({'error': str(e)}), 502
+
+    # 口の開き具合のタイムライン（クライアントは再生位置で引くだけ。なければ従来どおり音声を解析する）
+    try:
+        timeline = get_lipsync_timeline(key, audio)
+    except Exception as e:
+        logger.debug("Lip-sync timeline unavailable: %s", e)
+        timeline = None
+
+    response = Response(audio, mimetype=audio_mimetype(audio))
+    response.set_etag(key)
+    if timeline:
+        response.headers['X-Lip-Sync-FPS'] = str(timeline['fps'])
+        response.headers['X-Lip-Sync-Frames'] = timeline['frames']
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 @app.route('/get-speakers')
 def get_speakers():
-    speakers = [{
-        'speaker_uuid': speaker['speaker_uuid'],
-        'name': speaker['name'],
-        'styles': speaker['styles']
-    } for speaker in VOICEVOX_SPEAKERS]
-    return jsonify(speakers)
+    return precomputed_response(speaker_registry.speakers_json)
 
-@app.route('/chat', methods=['POST'])
-def chat():
+@app.route('/speaker-styles')
+def speaker_styles():
+    """スタイルID → キャラクター（名前・表示位置・口の画像）の対応表"""
+    return precomputed_response(speaker_registry.styles_json)
+
+def chat_turn(data, conversation_id, turn):
+    """/chat の1ターン分の処理（新しいメッセージでターンが取り消されたら 409 を返す）"""
     try:
-        data = request.json
         user_message = data.get('message')
         speaker_a = data.get('speaker_a')
         speaker_b = data.get('speaker_b')
@@ -96,196 +230,590 @@ def chat():
         if not user_message:
             return jsonify({'error': 'No message provided'}), 400
 
+        # 待機列まで埋まっていれば履歴を読む前に断る
+        check_capacity()
+        # 混雑時は話者Aだけ・短めの応答にする
+        degraded = should_degrade('chat')
+        max_tokens = LLM_DEGRADED_MAX_TOKENS if degraded else DEFAULT_MAX_TOKENS
+
         # 旧APIと新APIの両方をサポート
         if speaker_id:
             # 新しいAPIフォーマット
-            logger.debug(f"New API format - message: {user_message}, speaker_id: {speaker_id}")
+            logger.debug("New API format - speaker_id: %s", speaker_id)
 
             # Get conversation history from session or request
-            conversation_history = history if history else session.get('conversation_history', [])
+            conversation_summary = None
+            if history:
+                conversation_history = history
+            else:
+                with span('history_load'):
+                    conversation_history = conversation_store.get_history(conversation_id)
+                    conversation_summary = conversation_store.get_summary(conversation_id)
 
             # 二人称の設定を追加
-            additional_instruction = """
-            重要：あなたがどのキャラクターであるかに応じて、ユーザーへの呼びかけ方を必ず守ってください：
-            - 四国めたんの場合は「アンタ」
-            - 雨晴はうの場合は「あなた」
-            - 春日部つむぎの場合は「きみ」
-            - WhiteCULの場合は「あなた」
-            """
-            
+            additional_instruction = SECOND_PERSON_INSTRUCTION
+
             # 新しいAPIでも話者B（右側）でClaudeを使用する
             # 話者UUIDリストを使用してポジションを判定
             speaker_position = determine_speaker_position(speaker_id)
             use_claude = (speaker_position == "B")
             
             # Get response for speaker
-            response = get_chat_response(user_message, conversation_history, speaker_id, additional_instruction=additional_instruction, use_claude=use_claude)
-            logger.debug(f"Speaker ({speaker_id}) response: {response}")
+            response = timed_chat_response('speaker', user_message, conversation_history, speaker_id, additional_instruction=additional_instruction, use_claude=use_claude, max_tokens=max_tokens, conversation_summary=conversation_summary)
+            log_payload(logger, "Speaker response", response)
+            turn.check()
 
             # 応答を返す
-            return jsonify({
-                'content': response['content']
-            })
+            result = {'content': response['content']}
+            if degraded:
+                result['degraded'] = True
+            return jsonify(result)
 
         elif speaker_a and speaker_b:
             # 従来のAPIフォーマット
-            logger.debug(f"Legacy API format - message: {user_message}, speaker_a: {speaker_a}, speaker_b: {speaker_b}")
+            logger.debug("Legacy API format - speaker_a: %s, speaker_b: %s", speaker_a, speaker_b)
 
-            # Get conversation history from session
-            conversation_history = session.get('conversation_history', [])
+            # Get conversation history from the server-side store
+            with span('history_load'):
+                conversation_history = conversation_store.get_history(conversation_id)
+                conversation_summary = conversation_store.get_summary(conversation_id)
 
-            # Get response for speaker A
-            response_a = get_chat_response(user_message, conversation_history, speaker_a)
-            logger.debug(f"Speaker A ({speaker_a}) response: {response_a}")
+            # パターンに基づいて話者Bへの指示を変更する（utils/dialogue_helper.py を参照）
+            pattern = choose_response_pattern()
+            instruction, speaker_a_info = build_speaker_b_request(speaker_a, speaker_b, pattern)
 
-            # 話者Aの応答を履歴に追加
-            conversation_history.append({"role": "user", "content": user_message})
-            conversation_history.append({"role": "assistant", "content": response_a['content']})
-
-            # Get response for speaker B
-            # パターンに基づいて指示を変更する
-            # パターンA(30%): 話者Aの回答に同調
-            # パターンB(10%): 話者Aの回答に反対
-            # パターンC(40%): ユーザーの問いかけに独立して返答
-            # パターンD(20%): 別の話題を提供
-            import random
-            
-            pattern_choice = random.random()
-            
-            # 選ばれたキャラクターの名前と呼称を取得
-            speaker_a_profile = None
-            speaker_b_profile = None
-            
-            try:
-                from utils.openai_helper import CHARACTER_PROFILES
-                for uuid, profile in CHARACTER_PROFILES.items():
-                    if uuid == speaker_a:
-                        speaker_a_profile = profile
-                    if uuid == speaker_b:
-                        speaker_b_profile = profile
-            except Exception as e:
-                logger.error(f"Error getting character profiles: {str(e)}")
-            
-            speaker_a_name = speaker_a_profile['name'] if speaker_a_profile else "話者A"
-            speaker_b_name = speaker_b_profile['name'] if speaker_b_profile else "話者B"
-            
-            # キャラクター間の呼称マッピングを定義
-            character_nicknames = {
-                # WhiteCUL から見た他のキャラクターの呼び方
-                ("WhiteCUL", "四国めたん"): "めたんちゃん",
-                ("WhiteCUL", "春日部つむぎ"): "つむぎ",
-                ("WhiteCUL", "雨晴はう"): "はうちゃん",
-                
-                # 四国めたん から見た他のキャラクターの呼び方
-                ("四国めたん", "春日部つむぎ"): "つむぎさん",
-                ("四国めたん", "雨晴はう"): "はうさん",
-                ("四国めたん", "WhiteCUL"): "雪さん",
-                
-                # 春日部つむぎ から見た他のキャラクターの呼び方
-                ("春日部つむぎ", "四国めたん"): "めたん先輩",
-                ("春日部つむぎ", "雨晴はう"): "はうちゃん",
-                ("春日部つむぎ", "WhiteCUL"): "雪さん",
-                
-                # 雨晴はう から見た他のキャラクターの呼び方
-                ("雨晴はう", "四国めたん"): "めたんさん",
-                ("雨晴はう", "春日部つむぎ"): "つむぎちゃん",
-                ("雨晴はう", "WhiteCUL"): "ゆきさん",
-            }
-            
-            # 適切な呼称を取得
-            nickname_key = (speaker_b_name, speaker_a_name)
-            speaker_a_nickname = character_nicknames.get(nickname_key, speaker_a_name)
-            
-            # 話者A情報を準備
-            speaker_a_info = {
-                'name': speaker_a_name,
-                'nickname': speaker_a_nickname
-            }
-            
-            if pattern_choice < 0.3:  # パターンA(30%): 同調
-                logger.debug(f"Using pattern A: Speaker B agrees with Speaker A")
-                instruction = f"""あなたは{speaker_a_nickname}の意見に同意または肯定する返答をしてください。
-                他のキャラクターとの会話では、{speaker_a_name}のことを「{speaker_a_nickname}」と呼んでください。
-                例: 「{speaker_a_nickname}の意見に賛成！」「{speaker_a_nickname}の考え方はいいね！」など
-                {speaker_a_nickname}の発言を引用しつつ、それに賛同する形で返答してください。
-                
-                重要：あなたがどのキャラクターであるかに応じて、ユーザーへの呼びかけ方を必ず守ってください：
-                - 四国めたんの場合は「アンタ」
-                - 雨晴はうの場合は「あなた」
-                - 春日部つむぎの場合は「きみ」
-                - WhiteCULの場合は「あなた」"""
-                
-                response_b = get_chat_response(user_message, conversation_history, speaker_b, additional_instruction=instruction, use_claude=True, speaker_a_info=speaker_a_info)
-            
-            elif pattern_choice < 0.4:  # パターンB(10%): 反対
-                logger.debug(f"Using pattern B: Speaker B disagrees with Speaker A")
-                instruction = f"""あなたは{speaker_a_nickname}の意見に反対または異なる見解を述べる返答をしてください。
-                他のキャラクターとの会話では、{speaker_a_name}のことを「{speaker_a_nickname}」と呼んでください。
-                例: 「{speaker_a_nickname}と私の考えはちょっと違うかな～」「いや、私は～だと思うよ」など
-                {speaker_a_nickname}の発言を引用しつつ、それとは異なる視点や考えを丁寧に述べてください。
-                
-                重要：あなたがどのキャラクターであるかに応じて、ユーザーへの呼びかけ方を必ず守ってください：
-                - 四国めたんの場合は「アンタ」
-                - 雨晴はうの場合は「あなた」
-                - 春日部つむぎの場合は「きみ」
-                - WhiteCULの場合は「あなた」"""
-                
-                response_b = get_chat_response(user_message, conversation_history, speaker_b, additional_instruction=instruction, use_claude=True, speaker_a_info=speaker_a_info)
-            
-            elif pattern_choice < 0.8:  # パターンC(40%): 独立した返答
-                logger.debug(f"Using pattern C: Speaker B gives independent response")
-                instruction = f"""あなたはユーザーの質問に独立して返答してください。
-                他のキャラクターとの会話が発生する場合は、{speaker_a_name}のことを「{speaker_a_nickname}」と呼んでください。
-                ユーザーの質問に直接答えることを主な目的としてください。
-                
-                重要：あなたがどのキャラクターであるかに応じて、ユーザーへの呼びかけ方を必ず守ってください：
-                - 四国めたんの場合は「アンタ」
-                - 雨晴はうの場合は「あなた」
-                - 春日部つむぎの場合は「きみ」
-                - WhiteCULの場合は「あなた」"""
-                
-                response_b = get_chat_response(user_message, conversation_history, speaker_b, additional_instruction=instruction, use_claude=True, speaker_a_info=speaker_a_info)
-            
-            else:  # パターンD(20%): 別の話題を提供
-                logger.debug(f"Using pattern D: Speaker B introduces a new topic")
-                instruction = f"""あなたはユーザーの質問とは少し離れた別の話題を提供してください。
-                他のキャラクターとの会話では、{speaker_a_name}のことを「{speaker_a_nickname}」と呼んでください。
-                例: 「ところでさ、～ってどう思う？」「その話もいいけど、私も最近思うことがあってさ」など
-                自然な会話の流れを損なわない程度に、新しい話題や視点を導入してください。
-                可能であれば、{speaker_a_nickname}に質問するような形で新しい話題を振ってみるのも良いでしょう。
-                
-                重要：あなたがどのキャラクターであるかに応じて、ユーザーへの呼びかけ方を必ず守ってください：
-                - 四国めたんの場合は「アンタ」
-                - 雨晴はうの場合は「あなた」
-                - 春日部つむぎの場合は「きみ」
-                - WhiteCULの場合は「あなた」"""
-                
-                response_b = get_chat_response(user_message, conversation_history, speaker_b, additional_instruction=instruction, use_claude=True, speaker_a_info=speaker_a_info)
-            
-            logger.debug(f"Speaker B ({speaker_b}) response: {response_b}")
+            exchange = None
+            if JOINT_EXCHANGE and not degraded:
+                # 話者A/Bを1回の呼び出しでまとめて生成する（失敗したら下の2回に分けた生成に戻る）
+                with span('exchange'):
+                    exchange = get_exchange_response(
+                        user_message, conversation_history, speaker_a, speaker_b,
+                        build_exchange_instruction(speaker_a, speaker_b, pattern), conversation_summary=conversation_summary
+                    )
+
+            if exchange is not None:
+                response_a, response_b = exchange
+                log_payload(logger, "Speaker A response", response_a)
+            elif degraded:
+                response_a = timed_chat_response('speaker_a', user_message, conversation_history, speaker_a, max_tokens=max_tokens, conversation_summary=conversation_summary)
+                log_payload(logger, "Speaker A response", response_a)
+                response_b = None
+            elif CONCURRENT_SPEAKERS and is_independent_pattern(pattern):
+                # パターンC/Dは話者Aの回答を参照しないため、話者Bを並行して生成する
+                logger.debug("Generating speaker A and B concurrently (pattern %s)", pattern)
+                future_b = speaker_executor.submit(
+                    contextvars.copy_context().run, optional_chat_response, 'speaker_b', user_message, list(conversation_history), speaker_b,
+                    additional_instruction=instruction, use_claude=True, speaker_a_info=speaker_a_info, conversation_summary=conversation_summary
+                )
+                turn.track(future_b)
+
+                # Get response for speaker A
+                try:
+                    response_a = timed_chat_response('speaker_a', user_message, conversation_history, speaker_a, conversation_summary=conversation_summary)
+                except Exception:
+                    # 話者Aが失敗したらこのターンは返さないので、まだ始まっていない話者Bの生成はやめる
+                    future_b.cancel()
+                    raise
+                log_payload(logger, "Speaker A response", response_a)
+                try:
+                    response_b = future_b.result()
+                except CancelledError:
+                    # 話者Aの生成中に新しいメッセージが届いた
+                    turn.check()
+                    raise
+
+                # 話者Aの応答を履歴に追加
+                conversation_history.append({"role": "user", "content": user_message})
+                conversation_history.append({"role": "assistant", "content": response_a['content']})
+            else:
+                # Get response for speaker A
+                response_a = timed_chat_response('speaker_a', user_message, conversation_history, speaker_a, conversation_summary=conversation_summary)
+                log_payload(logger, "Speaker A response", response_a)
+
+                # 話者Aの応答を履歴に追加
+                conversation_history.append({"role": "user", "content": user_message})
+                conversation_history.append({"role": "assistant", "content": response_a['content']})
+
+                # 新しいメッセージが届いていれば話者Bは生成しない
+                turn.check()
+
+                # Get response for speaker B
+                response_b = optional_chat_response('speaker_b', user_message, conversation_history, speaker_b, additional_instruction=instruction, use_claude=True, speaker_a_info=speaker_a_info, conversation_summary=conversation_summary)
+
+            log_payload(logger, "Speaker B response", response_b)
+            # 取り消されたターンは履歴に残さない
+            turn.check()
 
             # 最終的な会話履歴を保存
-            conversation_history.append({"role": "assistant", "content": response_b['content']})
-            session['conversation_history'] = conversation_history
+            new_messages = [
+                {"role": "user", "content": user_message},
+                {"role": "assistant", "content": response_a['content']}
+            ]
+            if response_b is not None:
+                new_messages.append({"role": "assistant", "content": response_b['content']})
+            with span('history_save'):
+                conversation_store.append_messages(conversation_id, new_messages)
+            # 履歴から外れた古い発言の要約は応答後に裏で行う
+            summarizer.schedule(conversation_store, conversation_id)
 
-            return jsonify({
+            result = {
                 'speaker_a': response_a['content'],
-                'speaker_b': response_b['content']
-            })
+                'speaker_b': response_b['content'] if response_b is not None else None
+            }
+            if response_b is None:
+                result['degraded'] = True
+            return jsonify(result)
         else:
             return jsonify({'error': 'Either speaker_id or both speaker_a and speaker_b must be specified'}), 400
 
+    except TurnCancelled as e:
+        logger.info("Dropped superseded chat turn: %s", e)
+        return cancelled_response(turn)
+    except AdmissionRejected as e:
+        logger.warning("Rejected chat request: %s", e)
+        return busy_response(e)
+    except Exception as e:
+        logger.error("Error in chat endpoint: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+def run_turn(handler, data, conversation_id):
+    """同じ会話で実行中の前のターンを取り消してから handler を実行し、(本文, ステータス, ヘッダー) を返す
+
+    冪等キーが同じ再送には、この結果をそのまま返す（レスポンスは要求ごとに作り直す）。
+    """
+    turn = turn_registry.begin(conversation_id)
+    try:
+        response = app.make_response(handler(data, conversation_id, turn))
+    finally:
+        turn_registry.finish(turn)
+    headers = [(name, value) for name, value in response.headers if name != 'Content-Length']
+    return response.get_data(), response.status_code, headers
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    data = request.json or {}
+    conversation_id = get_conversation_id()
+    # 同じ冪等キーの再送は最初の実行の結果を返す
+    key = idempotency_key('chat', conversation_id, data)
+    body, status, headers = turn_registry.coalesce(key, lambda: run_turn(chat_turn, data, conversation_id)) if key \
+        else run_turn(chat_turn, data, conversation_id)
+    return Response(body, status=status, headers=headers)
+
+def room_turn(data, conversation_id, turn):
+    """/room/chat の1ターン分の処理"""
+    try:
+        user_message = data.get('message')
+        characters = data.get('characters')
+
+        if not user_message:
+            return jsonify({'error': 'No message provided'}), 400
+        error = validate_room(characters)
+        if error:
+            return jsonify({'error': error}), 400
+
+        check_capacity()
+        # 混雑時は先頭のキャラクターだけ・短めの応答にする
+        degraded = should_degrade('room_chat')
+        max_tokens = LLM_DEGRADED_MAX_TOKENS if degraded else DEFAULT_MAX_TOKENS
+
+        with span('history_load'):
+            conversation_history = conversation_store.get_history(conversation_id)
+            conversation_summary = conversation_store.get_summary(conversation_id)
+
+        replies = generate_room_replies(
+            user_message, conversation_history, characters, turn, degraded=degraded,
+            max_tokens=max_tokens, conversation_summary=conversation_summary
+        )
+        log_payload(logger, "Room replies", replies)
+        turn.check()
+
+        new_messages = [{"role": "user", "content": user_message}]
+        new_messages.extend({"role": "assistant", "content": reply['content']} for reply in replies)
+        with span('history_save'):
+            conversation_store.append_messages(conversation_id, new_messages)
+        summarizer.schedule(conversation_store, conversation_id)
+
+        result = {'replies': replies}
+        if len(replies) < len(characters):
+            result['degraded'] = True
+        return jsonify(result)
+
+    except TurnCancelled as e:
+        logger.info("Dropped superseded room turn: %s", e)
+        return cancelled_response(turn)
+    except AdmissionRejected as e:
+        logger.warning("Rejected room chat request: %s", e)
+        return busy_response(e)
     except Exception as e:
-        logger.error(f"Error in chat endpoint: {str(e)}")
+        logger.error("Error in room chat endpoint: %s", e)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/room/chat', methods=['POST'])
+def room_chat():
+    """複数のキャラクター（characters の先頭が最初に答える）での会話"""
+    data = request.json or {}
+    conversation_id = get_conversation_id()
+    key = idempotency_key('room_chat', conversation_id, data)
+    body, status, headers = turn_registry.coalesce(key, lambda: run_turn(room_turn, data, conversation_id)) if key \
+        else run_turn(room_turn, data, conversation_id)
+    return Response(body, status=status, headers=headers)
+
+def _merge_streams(streams):
+    """複数の差分ストリームを並行して読み出し、(話者, 差分) を届いた順に返す
+
+    各話者のストリームが終わった時点で (話者, None) を返す。読み出しをやめたら
+    （ターンの取り消しなど）、まだ続いているストリームも閉じる。
+    """
+    events = queue.Queue()
+    stopped = threading.Event()
+
+    def pump(speaker, factory):
+        try:
+            for delta in factory():
+                if stopped.is_set():
+                    break
+                events.put((speaker, delta, None))
+        except Exception as e:
+            events.put((speaker, None, e))
+        finally:
+            events.put((speaker, None, None))
+
+    for speaker, factory in streams.items():
+        stream_executor.submit(contextvars.copy_context().run, pump, speaker, factory)
+
+    remaining = len(streams)
+    try:
+        while remaining:
+            speaker, delta, error = events.get()
+            if error is not None:
+                raise error
+            if delta is None:
+                remaining -= 1
+            yield speaker, delta
+    finally:
+        stopped.set()
+
+def _sse_event(event, data):
+    """Server-Sent Events形式の1イベントを組み立てる"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def validate_chat_request(data):
+    """/chat/stream と /ws のリクエストの検証（問題があればエラーメッセージを返す）"""
+    if not data.get('message'):
+        return 'No message provided'
+    if not data.get('speaker_id') and not (data.get('speaker_a') and data.get('speaker_b')):
+        return 'Either speaker_id or both speaker_a and speaker_b must be specified'
+    return None
+
+def chat_turn_events(data, conversation_id, turn, degraded, on_sentence=None):
+    """1ターン分のイベント (イベント名, データ) を順に返す（/chat/stream と /ws で共通）
+
+    文ごとの音声合成を開始したときは on_sentence(話者, 文の番号, 音声のURL, 合成のFuture) を呼ぶ
+    （文が長すぎて先行合成しない場合の Future は None）。ターンが取り消されたら、その時点で
+    LLMのストリームを閉じ、cancelled を返して終わる（履歴には残さない）。
+    """
+    user_message = data.get('message')
+    speaker_a = data.get('speaker_a')
+    speaker_b = data.get('speaker_b')
+    speaker_id = data.get('speaker_id')
+    history = data.get('history', [])
+    max_tokens = LLM_DEGRADED_MAX_TOKENS if degraded else DEFAULT_MAX_TOKENS
+
+    # 文ごとの音声合成に使うスタイルID（指定がなければ文イベントは送らない）
+    style_ids = {
+        'A': data.get('style_a', data.get('style_id')),
+        'B': data.get('style_b')
+    }
+
+    chunkers = {speaker: SentenceChunker() for speaker, style_id in style_ids.items() if style_id is not None}
+    sentence_counts = {'A': 0, 'B': 0}
+
+    def sentence_events(speaker, sentences):
+        # 完成した文はすぐに合成を開始し、再生用URLをクライアントに知らせる
+        for sentence in sentences:
+            future = submit_tts_chunk(sentence, style_ids[speaker])
+            turn.track(future)
+            audio_url = url_for('tts', text=sentence, speaker=style_ids[speaker])
+            yield 'sentence', {
+                'speaker': speaker,
+                'index': sentence_counts[speaker],
+                'text': sentence,
+                'audio_url': audio_url
+            }
+            if on_sentence:
+                on_sentence(speaker, sentence_counts[speaker], audio_url, future)
+            sentence_counts[speaker] += 1
+
+    def delta_events(speaker, delta):
+        turn.check()
+        yield 'delta', {'speaker': speaker, 'text': delta}
+        if speaker in chunkers:
+            yield from sentence_events(speaker, chunkers[speaker].feed(delta))
+
+    def end_events(speaker):
+        if speaker in chunkers:
+            yield from sentence_events(speaker, chunkers[speaker].flush())
+        yield 'speaker_end', {'speaker': speaker, 'sentences': sentence_counts[speaker]}
+
+    yield 'turn', {'turn_id': turn.id}
+    try:
+        if speaker_id:
+            logger.debug("New API format (stream) - speaker_id: %s", speaker_id)
+            conversation_summary = None
+            if history:
+                conversation_history = history
+            else:
+                with span('history_load'):
+                    conversation_history = conversation_store.get_history(conversation_id)
+                    conversation_summary = conversation_store.get_summary(conversation_id)
+            use_claude = (determine_speaker_position(speaker_id) == "B")
+
+            parts = []
+            for delta in stream_chat_response(user_message, conversation_history, speaker_id, additional_instruction=SECOND_PERSON_INSTRUCTION, use_claude=use_claude, max_tokens=max_tokens, conversation_summary=conversation_summary):
+                parts.append(delta)
+                yield from delta_events('A', delta)
+            yield from end_events('A')
+
+            yield 'done', {'content': ''.join(parts)}
+            return
+
+        logger.debug("Legacy API format (stream) - speaker_a: %s, speaker_b: %s", speaker_a, speaker_b)
+        with span('history_load'):
+            conversation_history = conversation_store.get_history(conversation_id)
+            conversation_summary = conversation_store.get_summary(conversation_id)
+
+        pattern = choose_response_pattern()
+        instruction, speaker_a_info = build_speaker_b_request(speaker_a, speaker_b, pattern)
+
+        stream_a = lambda: stream_chat_response(user_message, conversation_history, speaker_a, max_tokens=max_tokens, conversation_summary=conversation_summary)
+        parts = {'A': [], 'B': []}
+        skipped_b = []
+
+        def stream_b(history_b):
+            # 混雑で枠が取れなければ話者Bは省略する
+            try:
+                yield from stream_chat_response(user_message, history_b, speaker_b, additional_instruction=instruction, use_claude=True, speaker_a_info=speaker_a_info, conversation_summary=conversation_summary)
+            except AdmissionRejected as e:
+                logger.warning("Skipping speaker B stream: %s", e)
+                skipped_b.append(e)
+
+        if degraded:
+            for delta in stream_a():
+                parts['A'].append(delta)
+                yield from delta_events('A', delta)
+            yield from end_events('A')
+            yield from end_events('B')
+            response_a = ''.join(parts['A'])
+        elif CONCURRENT_SPEAKERS and is_independent_pattern(pattern):
+            # 話者Bも同時に生成し、届いた順に差分を送る
+            logger.debug("Streaming speaker A and B concurrently (pattern %s)", pattern)
+            history_b = list(conversation_history)
+            for speaker, delta in _merge_streams({'A': stream_a, 'B': lambda: stream_b(history_b)}):
+                if delta is None:
+                    yield from end_events(speaker)
+                    continue
+                parts[speaker].append(delta)
+                yield from delta_events(speaker, delta)
+            response_a = ''.join(parts['A'])
+
+            conversation_history.append({"role": "user", "content": user_message})
+            conversation_history.append({"role": "assistant", "content": response_a})
+        else:
+            for delta in stream_a():
+                parts['A'].append(delta)
+                yield from delta_events('A', delta)
+            yield from end_events('A')
+            response_a = ''.join(parts['A'])
+
+            conversation_history.append({"role": "user", "content": user_message})
+            conversation_history.append({"role": "assistant", "content": response_a})
+
+            for delta in stream_b(conversation_history):
+                parts['B'].append(delta)
+                yield from delta_events('B', delta)
+            yield from end_events('B')
+        response_b = None if degraded or skipped_b else ''.join(parts['B'])
+
+        new_messages = [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": response_a}
+        ]
+        if response_b is not None:
+            new_messages.append({"role": "assistant", "content": response_b})
+        turn.check()
+        with span('history_save'):
+            conversation_store.append_messages(conversation_id, new_messages)
+        # 履歴から外れた古い発言の要約は応答後に裏で行う
+        summarizer.schedule(conversation_store, conversation_id)
+
+        # 最終イベントに確定したテキストを載せる
+        done = {
+            'speaker_a': response_a,
+            'speaker_b': response_b
+        }
+        if response_b is None:
+            done['degraded'] = True
+        yield 'done', done
+    except TurnCancelled as e:
+        logger.info("Stopped superseded chat stream: %s", e)
+        yield 'cancelled', {'turn_id': turn.id}
+    except AdmissionRejected as e:
+        logger.warning("Rejected chat stream: %s", e)
+        yield 'error', {'error': 'Server is busy, please retry later', 'retry_after': e.retry_after}
+    except Exception as e:
+        logger.error("Error in chat stream: %s", e)
+        yield 'error', {'error': str(e)}
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """/chat のストリーミング版。LLMの差分を話者A/B別のSSEイベントとして送る"""
+    data = request.json or {}
+    error = validate_chat_request(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    # 待機列まで埋まっていればストリームを開始せずに断る
+    try:
+        check_capacity()
+    except AdmissionRejected as e:
+        logger.warning("Rejected chat stream: %s", e)
+        return busy_response(e)
+    degraded = should_degrade('chat_stream')
+
+    # 会話IDはレスポンス開始前に確定させる（Cookieはストリーム開始時に送られる）
+    conversation_id = get_conversation_id()
+
+    # 同じ冪等キーの再送は実行しない（最初のストリームがそのまま続く）
+    key = idempotency_key('chat_stream', conversation_id, data)
+    if key and not turn_registry.claim(key):
+        return jsonify({'error': 'Duplicate request', 'duplicate': True}), 409
+    # 同じ会話で実行中の前のターンは取り消す
+    turn = turn_registry.begin(conversation_id)
+
+    def generate():
+        try:
+            for event, payload in chat_turn_events(data, conversation_id, turn, degraded):
+                yield _sse_event(event, payload)
+        finally:
+            turn_registry.finish(turn)
+            if key:
+                turn_registry.release(key)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def run_socket_turn(channel, data, conversation_id):
+    """/ws で受け取った1ターンを処理し、イベントと音声の準備状況を送る
+
+    送るメッセージにはクライアントの冪等キー（request）をつけ、どのターンのものか区別できるようにする。
+    """
+    request_key = data.get('idempotency_key')
+
+    def send(event, payload):
+        channel.send(event, {**payload, 'request': request_key})
+
+    error = validate_chat_request(data)
+    if error:
+        send('error', {'error': error})
+        return
+    try:
+        check_capacity()
+    except AdmissionRejected as e:
+        logger.warning("Rejected chat socket turn: %s", e)
+        send('error', {'error': 'Server is busy, please retry later', 'retry_after': e.retry_after})
+        return
+    degraded = should_degrade('chat_socket')
+
+    # 再送されたメッセージは実行しない（最初のターンの結果がそのまま届く）
+    key = f"chat_socket:{conversation_id}:{request_key}" if request_key else None
+    if key and not turn_registry.claim(key):
+        logger.debug("Ignoring duplicate chat socket turn: %s", key)
+        return
+    turn = turn_registry.begin(conversation_id)
+
+    def send_audio(event, payload):
+        # 取り消されたターンの音声は知らせない
+        if not turn.cancelled:
+            send(event, payload)
+
+    turn_audio = TurnAudio(send_audio)
+    try:
+        for event, payload in chat_turn_events(data, conversation_id, turn, degraded, on_sentence=turn_audio.add):
+            send(event, payload)
+            if event == 'speaker_end':
+                turn_audio.end(payload['speaker'], payload['sentences'])
+    finally:
+        turn_registry.finish(turn)
+        if key:
+            turn_registry.release(key)
+
+if CHAT_WEBSOCKET:
+    from flask_sock import Sock
+
+    app.config['SOCK_SERVER_OPTIONS'] = {'ping_interval': CHAT_WEBSOCKET_PING_SECONDS}
+    sock = Sock(app)
+
+    @sock.route('/ws')
+    def chat_socket(ws):
+        """常時接続のチャット。/chat/stream と同じイベントに加え、音声の準備完了と話者Bの開始を送る"""
+        # Cookieはここでは更新できないので、会話IDがなければこの接続の間だけのIDを使う
+        conversation_id = session.get('conversation_id')
+        if not conversation_id:
+            logger.warning("WebSocket connected without a conversation id, history will not persist")
+            conversation_id = secrets.token_urlsafe(32)
+
+        channel = ChatChannel(ws)
+        try:
+            while not channel.closed:
+                raw = ws.receive()
+                try:
+                    message = json.loads(raw)
+                except (TypeError, ValueError):
+                    message = None
+                if not isinstance(message, dict):
+                    channel.send('error', {'error': 'Invalid message'})
+                    continue
+                if message.get('type') == 'chat':
+                    # 受信を続けながら処理し、次のメッセージが届いたら前のターンを取り消せるようにする
+                    threading.Thread(
+                        target=contextvars.copy_context().run, args=(run_socket_turn, channel, message, conversation_id),
+                        name="chat-socket-turn", daemon=True
+                    ).start()
+                elif message.get('type') == 'cancel':
+                    turn_registry.cancel_current(conversation_id)
+                else:
+                    channel.send('error', {'error': f"Unknown message type: {message.get('type')}"})
+        finally:
+            # 切断されたら実行中のターンも止める
+            turn_registry.cancel_current(conversation_id)
+
+@app.route('/healthz')
+def healthz():
+    """起動確認（readiness）。温め（utils/warmup.py）が済むまでは 503 を返し、裏で温めを始める"""
+    status = warmup_status()
+    if not status['warm']:
+        start_warm_up()
+    status['tts'] = tts_available()
+    return jsonify({'status': 'ok' if status['warm'] else 'warming', **status}), 200 if status['warm'] else 503
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus形式のメトリクス（ワーカープロセスごとの値）"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/reset-conversation', methods=['POST'])
 def reset_conversation():
     try:
-        session['conversation_history'] = []
+        conversation_store.clear(get_conversation_id())
         return jsonify({'message': 'Conversation history reset successfully'})
     except Exception as e:
-        logger.error(f"Error resetting conversation: {str(e)}")
+        logger.error("Error resetting conversation: %s", e)
         return jsonify({'error': str(e)}), 500
 
 # Server startup configuration
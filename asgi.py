@@ -0,0 +1,408 @@
+"""非同期サービングモード
+
+`uvicorn asgi:application` または
+`gunicorn asgi:application -k uvicorn.workers.UvicornWorker` で起動する。
+
+LLMの応答待ちが最も長い /chat はイベントループ上でネイティブに処理し、
+待機中にワーカーを占有しない。その他のルートは既存のFlaskアプリに委譲し、専用のスレッドプール
+（ASGI_FLASK_WORKERS）で並行して処理する。
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import secrets
+import logging
+from http.cookies import SimpleCookie
+
+from asgiref.sync import sync_to_async, AsyncToSync
+
+from app import app, conversation_store, determine_speaker_position, CONCURRENT_SPEAKERS
+from utils.openai_helper import get_chat_response_async, get_exchange_response_async, DEFAULT_MAX_TOKENS, JOINT_EXCHANGE
+from utils.admission import AdmissionRejected, check_capacity, should_degrade, LLM_DEGRADED_MAX_TOKENS
+from utils.metrics import span, HTTP_REQUEST_SECONDS
+from utils.conversation_summary import summarizer
+from utils.logging_config import begin_request_sampling
+from utils.turns import turn_registry, TurnCancelled
+from utils.executors import LazyThreadPoolExecutor
+from utils.dialogue_helper import choose_response_pattern, build_speaker_b_request, build_exchange_instruction, is_independent_pattern, SECOND_PERSON_INSTRUCTION
+
+logger = logging.getLogger(__name__)
+
+# Flaskアプリに委譲するルートを処理するスレッド数（/chat/stream のSSEは応答が終わるまで1つ占有する）
+ASGI_FLASK_WORKERS = int(os.environ.get("ASGI_FLASK_WORKERS", "32"))
+
+flask_executor = LazyThreadPoolExecutor(ASGI_FLASK_WORKERS, "flask")
+
+
+def build_environ(scope, body):
+    """ASGI の scope とリクエスト本文（ファイルオブジェクト）から WSGI の environ を作る"""
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name in ('content-length', 'content-type'):
+            key = name.upper().replace('-', '_')
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        # 同じ名前のヘッダーはカンマでつなぐ
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class WsgiRequest:
+    """Flaskアプリで1リクエストを処理する（スレッドプール上で実行し、応答はイベントループ経由で送る）"""
+
+    def __init__(self, wsgi_application, scope, send):
+        self.wsgi_application = wsgi_application
+        self.scope = scope
+        self.sync_send = AsyncToSync(send)
+        self.response_start = None
+        self.response_started = False
+
+    def start_response(self, status, response_headers, exc_info=None):
+        if exc_info and self.response_started:
+            raise exc_info[1].with_traceback(exc_info[2])
+        self.response_start = {
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response_headers],
+        }
+
+    def _send_start(self):
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+
+    def run(self, body):
+        result = self.wsgi_application(build_environ(self.scope, body), self.start_response)
+        try:
+            # ストリーミング（SSE）は届いた分ずつ送る
+            for output in result:
+                self._send_start()
+                if output:
+                    self.sync_send({'type': 'http.response.body', 'body': output, 'more_body': True})
+        finally:
+            # ジェネレーターの後始末（stream_with_context のコンテキストなど）をこのスレッドで行う
+            if hasattr(result, 'close'):
+                result.close()
+        self._send_start()
+        self.sync_send({'type': 'http.response.body'})
+
+
+async def flask_application(scope, receive, send):
+    """Flaskアプリ（/chat 以外のルート）
+
+    asgiref の WsgiToAsgi は既定で全リクエストを1本の共有スレッドで順に処理する（thread_sensitive）ため、
+    ストリーミング中の /chat/stream が他のルートを止めてしまう。専用のスレッドプールで処理する。
+    """
+    body = io.BytesIO(await read_body(receive))
+    request = WsgiRequest(app, scope, send)
+    await sync_to_async(request.run, thread_sensitive=False, executor=flask_executor)(body)
+
+
+class ChatError(Exception):
+    """クライアントに返すエラー（ステータスコードつき）"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class TaskCanceller:
+    """Turn.track に渡す。別スレッドで取り消されてもイベントループ上でタスクを止める"""
+
+    def __init__(self, task):
+        self.task = task
+        self.loop = task.get_loop()
+
+    def cancel(self):
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        return True
+
+
+def _session_serializer():
+    return app.session_interface.get_signing_serializer(app)
+
+
+def load_session(scope):
+    """Flaskの署名付きセッションCookieを読み込む"""
+    cookie_header = ''
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookie_header = value.decode('latin-1')
+            break
+
+    cookies = SimpleCookie()
+    cookies.load(cookie_header)
+    morsel = cookies.get(app.config['SESSION_COOKIE_NAME'])
+    if not morsel:
+        return {}
+
+    try:
+        max_age = int(app.permanent_session_lifetime.total_seconds())
+        return _session_serializer().loads(morsel.value, max_age=max_age)
+    except Exception:
+        return {}
+
+
+def session_cookie_header(session_data):
+    """セッションをFlaskと同じ形式で署名し、Set-Cookieヘッダーを作る"""
+    value = _session_serializer().dumps(dict(session_data))
+    parts = [f"{app.config['SESSION_COOKIE_NAME']}={value}", f"Path={app.config['SESSION_COOKIE_PATH'] or '/'}"]
+    if app.config['SESSION_COOKIE_HTTPONLY']:
+        parts.append('HttpOnly')
+    if app.config['SESSION_COOKIE_SECURE']:
+        parts.append('Secure')
+    if app.config['SESSION_COOKIE_SAMESITE']:
+        parts.append(f"SameSite={app.config['SESSION_COOKIE_SAMESITE']}")
+    return (b'set-cookie', '; '.join(parts).encode('latin-1'))
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            *headers
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def timed_chat_response(stage, *args, **kwargs):
+    """get_chat_response_async の所要時間を段階別に記録する"""
+    with span(stage):
+        return await get_chat_response_async(*args, **kwargs)
+
+
+async def optional_chat_response(stage, *args, **kwargs):
+    """混雑で枠が取れなければ None を返す（話者Bを省略して縮退するため）"""
+    try:
+        return await timed_chat_response(stage, *args, **kwargs)
+    except AdmissionRejected as e:
+        logger.warning("Skipping %s: %s", stage, e)
+        return None
+
+
+def request_header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def handle_chat(data, session_data, turn):
+    """/chat の非同期版。app.chat() と同じ入出力"""
+    user_message = data.get('message')
+    speaker_a = data.get('speaker_a')
+    speaker_b = data.get('speaker_b')
+    speaker_id = data.get('speaker_id')
+    history = data.get('history', [])
+
+    if not user_message:
+        raise ChatError('No message provided')
+
+    check_capacity()
+    degraded = should_degrade('chat')
+    max_tokens = LLM_DEGRADED_MAX_TOKENS if degraded else DEFAULT_MAX_TOKENS
+
+    if speaker_id:
+        logger.debug("New API format (async) - speaker_id: %s", speaker_id)
+        conversation_summary = None
+        if history:
+            conversation_history = history
+        else:
+            with span('history_load'):
+                conversation_history = await asyncio.to_thread(conversation_store.get_history, session_data['conversation_id'])
+                conversation_summary = await asyncio.to_thread(conversation_store.get_summary, session_data['conversation_id'])
+        use_claude = (determine_speaker_position(speaker_id) == "B")
+
+        response = await timed_chat_response('speaker', user_message, conversation_history, speaker_id, additional_instruction=SECOND_PERSON_INSTRUCTION, use_claude=use_claude, max_tokens=max_tokens, conversation_summary=conversation_summary)
+        turn.check()
+        result = {'content': response['content']}
+        if degraded:
+            result['degraded'] = True
+        return result
+
+    if not (speaker_a and speaker_b):
+        raise ChatError('Either speaker_id or both speaker_a and speaker_b must be specified')
+
+    logger.debug("Legacy API format (async) - speaker_a: %s, speaker_b: %s", speaker_a, speaker_b)
+    conversation_id = session_data['conversation_id']
+    with span('history_load'):
+        conversation_history = await asyncio.to_thread(conversation_store.get_history, conversation_id)
+        conversation_summary = await asyncio.to_thread(conversation_store.get_summary, conversation_id)
+
+    pattern = choose_response_pattern()
+    instruction, speaker_a_info = build_speaker_b_request(speaker_a, speaker_b, pattern)
+
+    exchange = None
+    if JOINT_EXCHANGE and not degraded:
+        # 話者A/Bを1回の呼び出しでまとめて生成する（失敗したら2回に分けて生成する）
+        with span('exchange'):
+            exchange = await get_exchange_response_async(
+                user_message, conversation_history, speaker_a, speaker_b,
+                build_exchange_instruction(speaker_a, speaker_b, pattern), conversation_summary=conversation_summary
+            )
+
+    if exchange is not None:
+        response_a, response_b = exchange
+    elif degraded:
+        # 混雑時は話者Aだけ・短めの応答にする
+        response_a = await timed_chat_response('speaker_a', user_message, conversation_history, speaker_a, max_tokens=max_tokens, conversation_summary=conversation_summary)
+        response_b = None
+    elif CONCURRENT_SPEAKERS and is_independent_pattern(pattern):
+        # パターンC/Dは話者Aの回答を参照しないため、同時に待つ
+        response_a, response_b = await asyncio.gather(
+            timed_chat_response('speaker_a', user_message, list(conversation_history), speaker_a, conversation_summary=conversation_summary),
+            optional_chat_response('speaker_b', user_message, list(conversation_history), speaker_b, additional_instruction=instruction, use_claude=True, speaker_a_info=speaker_a_info, conversation_summary=conversation_summary)
+        )
+        conversation_history.append({"role": "user", "content": user_message})
+        conversation_history.append({"role": "assistant", "content": response_a['content']})
+    else:
+        response_a = await timed_chat_response('speaker_a', user_message, conversation_history, speaker_a, conversation_summary=conversation_summary)
+        conversation_history.append({"role": "user", "content": user_message})
+        conversation_history.append({"role": "assistant", "content": response_a['content']})
+        response_b = await optional_chat_response('speaker_b', user_message, conversation_history, speaker_b, additional_instruction=instruction, use_claude=True, speaker_a_info=speaker_a_info, conversation_summary=conversation_summary)
+
+    new_messages = [
+        {"role": "user", "content": user_message},
+        {"role": "assistant", "content": response_a['content']}
+    ]
+    if response_b is not None:
+        new_messages.append({"role": "assistant", "content": response_b['content']})
+    # 取り消されたターンは履歴に残さない
+    turn.check()
+    with span('history_save'):
+        await asyncio.to_thread(conversation_store.append_messages, conversation_id, new_messages)
+    summarizer.schedule(conversation_store, conversation_id)
+
+    result = {
+        'speaker_a': response_a['content'],
+        'speaker_b': response_b['content'] if response_b is not None else None
+    }
+    if response_b is None:
+        result['degraded'] = True
+    return result
+
+
+async def chat_endpoint(scope, receive, send):
+    started = time.perf_counter()
+    status = 200
+    begin_request_sampling('chat')
+    try:
+        status = await _chat_endpoint(scope, receive, send)
+    finally:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint='chat', status=status)
+
+
+async def run_chat(data, session_data):
+    """前のターンを取り消してから /chat の1ターンを実行し、(ステータス, 本文, 追加ヘッダー) を返す
+
+    取り消されたときは実行中のタスクごと止めるので、待っているLLMの呼び出しも打ち切られる。
+    """
+    turn = turn_registry.begin(session_data['conversation_id'])
+    task = asyncio.ensure_future(handle_chat(data, session_data, turn))
+    turn.track(TaskCanceller(task))
+    try:
+        return 200, await task, []
+    except (asyncio.CancelledError, TurnCancelled):
+        if not turn.cancelled:
+            raise
+        return 409, {'error': 'Superseded by a newer message', 'cancelled': True, 'turn_id': turn.id}, []
+    except ChatError as e:
+        return e.status, {'error': str(e)}, []
+    except AdmissionRejected as e:
+        logger.warning("Rejected async chat request: %s", e)
+        return 503, {'error': 'Server is busy, please retry later', 'retry_after': e.retry_after}, \
+            [(b'retry-after', str(e.retry_after).encode())]
+    except Exception as e:
+        logger.error("Error in async chat endpoint: %s", e)
+        return 500, {'error': str(e)}, []
+    finally:
+        turn_registry.finish(turn)
+
+
+async def _chat_endpoint(scope, receive, send):
+    """/chat を処理し、返したステータスコードを返す"""
+    session_data = load_session(scope)
+    headers = []
+    if not session_data.get('conversation_id'):
+        # app.get_conversation_id() と同じく会話IDを発行する
+        session_data['conversation_id'] = secrets.token_urlsafe(32)
+        headers.append(session_cookie_header(session_data))
+    try:
+        data = json.loads(await read_body(receive) or b'{}')
+    except ValueError as e:
+        await send_json(send, 400, {'error': f'Invalid JSON: {e}'}, headers=headers)
+        return 400
+    if not isinstance(data, dict):
+        await send_json(send, 400, {'error': 'Request body must be a JSON object'}, headers=headers)
+        return 400
+
+    # 同じ冪等キーの再送は最初の実行の結果を返す（app.idempotency_key() と同じキー）
+    key = request_header(scope, b'idempotency-key') or data.get('idempotency_key')
+    if key:
+        status, payload, extra_headers = await turn_registry.coalesce_async(
+            f"chat:{session_data['conversation_id']}:{key}", lambda: run_chat(data, session_data)
+        )
+    else:
+        status, payload, extra_headers = await run_chat(data, session_data)
+    await send_json(send, status, payload, headers=headers + extra_headers)
+    return status
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/chat' and scope['method'] == 'POST':
+        await chat_endpoint(scope, receive, send)
+    else:
+        await flask_application(scope, receive, send)
@@ -0,0 +1,244 @@
+"""/chat と /get-speakers の負荷試験
+
+仮想ユーザーごとにセッションCookieを保持し、指定した比率でシナリオを実行する。
+スループットとレイテンシ（p50/p95/p99）をシナリオ別に表示する。
+
+    python benchmarks/load_chat.py --url http://127.0.0.1:5000 --users 20 --duration 60 \
+        --mix legacy=6,single=3,speakers=1
+
+--max-p95 / --max-error-rate を指定すると、閾値を超えた場合に終了コード1を返す
+（デプロイ前の回帰検出用）。
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import http.cookiejar
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+# 話者の組み合わせ（左側: 話者A、右側: 話者B）
+SPEAKERS_A = [
+    "388f246b-8c41-4ac1-8e2d-5d79f3ff56d9",  # ずんだもん
+    "35b2c544-660e-401e-b503-0e14c635303a",  # 春日部つむぎ
+]
+SPEAKERS_B = [
+    "7ffcb7ce-00ec-4bdc-82cd-45a8889e43ff",  # 四国めたん
+    "3474ee95-c274-47f9-aa1a-8322163d96f1",  # 雨晴はう
+]
+
+MESSAGES = [
+    "こんにちは！今日は何してた？",
+    "最近ハマってるアニメってある？",
+    "今日のお昼ごはん、カレーにしようか迷ってるんだ。",
+    "雨の日って何して過ごすのが好き？",
+    "在宅ワークで疲れちゃった…",
+    "週末どこかに出かけたいな。おすすめある？",
+]
+
+SCENARIOS = ('legacy', 'single', 'speakers')
+
+
+def percentile(values, fraction):
+    """線形補間による百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, scenario, elapsed, status, ok):
+        with self._lock:
+            self.statuses[scenario][status] += 1
+            if ok:
+                self.latencies[scenario].append(elapsed)
+            else:
+                self.errors[scenario] += 1
+
+    def summary(self, wall_time):
+        rows = {}
+        for scenario in sorted(set(self.latencies) | set(self.errors)):
+            latencies = self.latencies[scenario]
+            total = len(latencies) + self.errors[scenario]
+            rows[scenario] = {
+                'requests': total,
+                'errors': self.errors[scenario],
+                'error_rate': self.errors[scenario] / total if total else 0.0,
+                'throughput': len(latencies) / wall_time if wall_time else 0.0,
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+                'max': max(latencies) if latencies else 0.0,
+                'statuses': dict(self.statuses[scenario]),
+            }
+
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        total = len(all_latencies) + sum(self.errors.values())
+        rows['total'] = {
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'error_rate': sum(self.errors.values()) / total if total else 0.0,
+            'throughput': len(all_latencies) / wall_time if wall_time else 0.0,
+            'p50': percentile(all_latencies, 0.50),
+            'p95': percentile(all_latencies, 0.95),
+            'p99': percentile(all_latencies, 0.99),
+            'max': max(all_latencies) if all_latencies else 0.0,
+        }
+        return rows
+
+
+class VirtualUser:
+    """1人の利用者（セッションCookieを保持する）"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.speaker_a = random.choice(SPEAKERS_A)
+        self.speaker_b = random.choice(SPEAKERS_B)
+
+    def _request(self, path, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if data else {}
+        request = urllib.request.Request(f"{self.base_url}{path}", data=data, headers=headers)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def start(self):
+        """トップページを開いて会話IDを発行してもらう"""
+        self._request('/')
+
+    def run(self, scenario):
+        if scenario == 'speakers':
+            return self._request('/get-speakers')
+        message = random.choice(MESSAGES)
+        if scenario == 'single':
+            return self._request('/chat', {'message': message, 'speaker_id': random.choice(SPEAKERS_A + SPEAKERS_B)})
+        return self._request('/chat', {'message': message, 'speaker_a': self.speaker_a, 'speaker_b': self.speaker_b})
+
+
+def parse_mix(spec):
+    weights = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name} (choose from {', '.join(SCENARIOS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def worker(args, results, deadline, counter, counter_lock):
+    user = VirtualUser(args.url, args.timeout)
+    try:
+        user.start()
+    except Exception as e:
+        print(f"Failed to start session: {e}", file=sys.stderr)
+        return
+
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    while time.monotonic() < deadline:
+        if args.requests:
+            with counter_lock:
+                if counter[0] >= args.requests:
+                    return
+                counter[0] += 1
+
+        scenario = random.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            status = user.run(scenario)
+        except Exception:
+            status = 'exception'
+        elapsed = time.perf_counter() - started
+        results.record(scenario, elapsed, status, status == 200 or status == 304)
+
+        if args.think_time:
+            time.sleep(random.uniform(0, args.think_time))
+
+
+def print_report(rows, wall_time):
+    print(f"\nDuration: {wall_time:.1f}s")
+    print(f"{'scenario':<10} {'reqs':>6} {'errors':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, row in rows.items():
+        print(f"{name:<10} {row['requests']:>6} {row['errors']:>6} {row['throughput']:>8.2f} "
+              f"{row['p50'] * 1000:>7.0f}ms {row['p95'] * 1000:>6.0f}ms {row['p99'] * 1000:>6.0f}ms {row['max'] * 1000:>6.0f}ms")
+        if row.get('statuses'):
+            print(f"{'':<10} statuses: {row['statuses']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test /chat and /get-speakers")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=10, help="同時に動かす仮想ユーザー数")
+    parser.add_argument('--duration', type=float, default=30.0, help="実行時間（秒）")
+    parser.add_argument('--requests', type=int, default=0, help="総リクエスト数の上限（0で無制限）")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('legacy=6,single=3,speakers=1'),
+                        help="シナリオの比率（legacy / single / speakers）")
+    parser.add_argument('--think-time', type=float, default=0.0, help="リクエスト間の最大待ち時間（秒）")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', metavar='FILE', help="結果をJSONで保存する")
+    parser.add_argument('--max-p95', type=float, help="全体のp95がこの秒数を超えたら失敗にする")
+    parser.add_argument('--max-error-rate', type=float, help="全体のエラー率がこの値を超えたら失敗にする")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    results = Results()
+    counter = [0]
+    counter_lock = threading.Lock()
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(args, results, deadline, counter, counter_lock), daemon=True)
+        for _ in range(args.users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.monotonic() - started
+
+    rows = results.summary(wall_time)
+    print_report(rows, wall_time)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'duration': wall_time, 'users': args.users, 'mix': args.mix, 'results': rows}, f, indent=2)
+
+    failed = False
+    total = rows['total']
+    if args.max_p95 is not None and total['p95'] > args.max_p95:
+        print(f"FAIL: p95 {total['p95']:.3f}s exceeds {args.max_p95:.3f}s", file=sys.stderr)
+        failed = True
+    if args.max_error_rate is not None and total['error_rate'] > args.max_error_rate:
+        print(f"FAIL: error rate {total['error_rate']:.3%} exceeds {args.max_error_rate:.3%}", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
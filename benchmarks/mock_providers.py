@@ -0,0 +1,490 @@
+"""OpenAI / Anthropic / tts.quest / VOICEVOX エンジンのモックサーバー
+
+本物のAPIキーなしでアプリの負荷試験を行うための代替サーバー。
+1つのポートで4つのプロトコルを提供する。
+
+    python benchmarks/mock_providers.py --port 8100 --latency lognormal:-1.5,0.5 --error-rate 0.02
+
+アプリ側は次の環境変数で接続先を切り替える:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8100
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8100
+    TTS_QUEST_BASE_URL=http://127.0.0.1:8100
+    OPENAI_API_KEY=mock ANTHROPIC_API_KEY=mock VOICEVOX_API_KEY=mock
+
+VOICEVOX エンジン（audio_query / synthesis / multi_synthesis）として使う場合は
+TTS_BACKEND=voicevox VOICEVOX_ENGINE_URLS=http://127.0.0.1:8100,http://127.0.0.1:8101
+のようにし、ポートごとにこのサーバーを起動する（1台ずつ遅延や停止を試せる）。
+
+--record DIR で本物のLLM APIへ中継して応答を保存し、--replay DIR で保存した応答を返す
+（決定的な再現実行用。tts.quest は常にモックの無音MP3を返す）。
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import wave
+import base64
+import zipfile
+import random
+import hashlib
+import argparse
+import logging
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+logger = logging.getLogger("mock_providers")
+
+# 記録モードでの中継先
+UPSTREAMS = {
+    'openai': "https://api.openai.com",
+    'anthropic': "https://api.anthropic.com",
+}
+
+# 応答に使う定型文
+CANNED_REPLIES = [
+    "そうなんだ！それはとても面白そうな話だね。もっと詳しく聞かせてほしいな。",
+    "なるほど、そういうことだったのね。ワタシもちょっと気になってきたわ。",
+    "今日は天気がいいから、お散歩でもしたい気分なのだ。",
+    "わかるー！あーしもそういうの大好きなんだよね。",
+    "それは大変でしたね。少し休憩してくださいね。",
+]
+
+# 無音のMPEG-1 Layer III フレーム（128kbps / 44.1kHz、約26ms）
+SILENT_MP3_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+
+# VOICEVOX エンジンの出力（24kHz / 16bit / モノラル）と、1文字あたりの音声の長さ
+ENGINE_SAMPLE_RATE = 24000
+ENGINE_SECONDS_PER_CHAR = 0.12
+
+# 日時はプロンプトに毎分埋め込まれるため、再生キーからは取り除く
+DATETIME_PATTERN = re.compile(r'\d+年\d+月\d+日（.）\s*\d{2}時\d{2}分')
+
+
+class LatencyModel:
+    """応答遅延の分布（fixed:秒 / uniform:最小,最大 / normal:平均,標準偏差 / lognormal:mu,sigma）"""
+
+    def __init__(self, spec):
+        kind, _, params = spec.partition(':')
+        self.kind = kind
+        self.params = [float(value) for value in params.split(',')] if params else []
+        if kind not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self):
+        if self.kind == 'fixed':
+            return self.params[0]
+        if self.kind == 'uniform':
+            return random.uniform(*self.params)
+        if self.kind == 'normal':
+            return max(0.0, random.gauss(*self.params))
+        return random.lognormvariate(*self.params)
+
+    def sleep(self):
+        time.sleep(self.sample())
+
+
+class MockConfig:
+    def __init__(self, args):
+        self.latency = LatencyModel(args.latency)
+        self.token_interval = LatencyModel(args.token_interval)
+        self.tts_latency = LatencyModel(args.tts_latency)
+        self.engine_latency = LatencyModel(args.engine_latency)
+        self.error_rate = args.error_rate
+        self.reply_chars = args.reply_chars
+        self.record_dir = args.record
+        self.replay_dir = args.replay
+        self.audio_frames = args.audio_frames
+
+
+class RecordStore:
+    """記録した応答をディレクトリに保存する（1応答1ファイル）"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                record = json.load(f)
+        except OSError:
+            return None
+        record['body'] = base64.b64decode(record['body'])
+        return record
+
+    def save(self, key, status, content_type, body):
+        record = {
+            'status': status,
+            'content_type': content_type,
+            'body': base64.b64encode(body).decode('ascii')
+        }
+        with self._lock:
+            with open(self._path(key), 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+
+
+def replay_key(method, path, query, body):
+    """リクエストから再生用のキーを作る（APIキーと日時は除く）"""
+    params = sorted((k, v) for k, v in parse_qsl(query) if k != 'key')
+    text = body.decode('utf-8', errors='replace') if body else ''
+    text = DATETIME_PATTERN.sub('<datetime>', text)
+    digest = hashlib.sha256(f"{method} {path}?{urlencode(params)}\n{text}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _reply_text(config):
+    text = ""
+    while len(text) < config.reply_chars:
+        text += random.choice(CANNED_REPLIES)
+    return text[:config.reply_chars]
+
+
+def _split_tokens(text, size=3):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _silent_wav(seconds):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(ENGINE_SAMPLE_RATE)
+        f.writeframes(b'\x00\x00' * int(seconds * ENGINE_SAMPLE_RATE))
+    return buffer.getvalue()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MockProviders/1.0'
+
+    # ---- 共通処理 ----
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'), headers=headers)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+    def _write_event(self, data, event=None):
+        chunk = f"event: {event}\n" if event else ""
+        chunk += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        self.wfile.write(chunk.encode('utf-8'))
+        self.wfile.flush()
+
+    def _inject_error(self):
+        """設定した確率で 429/500/503 を返す。返した場合は True"""
+        if random.random() >= self.config.error_rate:
+            return False
+        status = random.choice([429, 500, 503])
+        headers = {'Retry-After': '1'} if status == 429 else None
+        self._send_json(status, {'error': {'type': 'mock_error', 'message': f'Injected {status}'}}, headers=headers)
+        return True
+
+    def _route(self, method):
+        parts = urlsplit(self.path)
+        body = self._read_body() if method == 'POST' else b''
+        provider = self._provider(parts.path)
+        if provider is None:
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        # 記録・再生の対象はLLMの応答のみ（音声は合成応答を返す）
+        recordable = provider in ('openai', 'anthropic')
+        key = replay_key(method, parts.path, parts.query, body)
+        if self.config.replay_dir and recordable:
+            record = self.server.replay_store.load(key)
+            if record is not None:
+                self.config.latency.sleep()
+                self._send(record['status'], record['body'], record['content_type'])
+                return
+            logger.warning(f"No recording for {method} {parts.path}; falling back to synthetic response")
+
+        if self.config.record_dir and recordable:
+            self._forward(method, provider, parts, body, key)
+            return
+
+        if self._inject_error():
+            return
+
+        if provider == 'openai':
+            self._openai(json.loads(body or b'{}'))
+        elif provider == 'anthropic':
+            self._anthropic(json.loads(body or b'{}'))
+        elif provider == 'tts_quest':
+            self._tts_synthesis(dict(parse_qsl(parts.query)))
+        elif provider == 'tts_status':
+            self._send_json(200, {'success': True, 'isAudioReady': True, 'isAudioError': False})
+        elif provider == 'tts_audio':
+            self._send(200, SILENT_MP3_FRAME * self.config.audio_frames, 'audio/mpeg')
+        elif provider == 'engine_version':
+            self._send_json(200, "0.14.0-mock")
+        elif provider == 'engine_audio_query':
+            self._engine_audio_query(dict(parse_qsl(parts.query)))
+        elif provider == 'engine_synthesis':
+            self._engine_synthesis(json.loads(body or b'{}'))
+        elif provider == 'engine_multi_synthesis':
+            self._engine_multi_synthesis(json.loads(body or b'[]'))
+
+    @staticmethod
+    def _provider(path):
+        if path == '/v1/chat/completions':
+            return 'openai'
+        if path == '/v1/messages':
+            return 'anthropic'
+        if path == '/v3/voicevox/synthesis':
+            return 'tts_quest'
+        if path.startswith('/mock/audio/status/'):
+            return 'tts_status'
+        if path.startswith('/mock/audio/'):
+            return 'tts_audio'
+        if path == '/version':
+            return 'engine_version'
+        if path == '/audio_query':
+            return 'engine_audio_query'
+        if path == '/synthesis':
+            return 'engine_synthesis'
+        if path == '/multi_synthesis':
+            return 'engine_multi_synthesis'
+        return None
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    # ---- 記録モード ----
+
+    def _forward(self, method, provider, parts, body, key):
+        """本物のAPIへ中継し、応答を保存してから返す"""
+        upstream = UPSTREAMS[provider]
+        url = f"{upstream}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+        headers = {name: value for name, value in self.headers.items()
+                   if name.lower() in ('authorization', 'x-api-key', 'anthropic-version', 'anthropic-beta', 'content-type')}
+        request = urllib.request.Request(url, data=body or None, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                status, content_type, data = response.status, response.headers.get('Content-Type', ''), response.read()
+        except urllib.error.HTTPError as e:
+            status, content_type, data = e.code, e.headers.get('Content-Type', ''), e.read()
+        if status < 400:
+            self.server.record_store.save(key, status, content_type, data)
+        self._send(status, data, content_type or 'application/octet-stream')
+
+    # ---- OpenAI Chat Completions ----
+
+    def _openai(self, request):
+        text = _reply_text(self.config)
+        prompt_tokens = sum(len(m.get('content') or '') for m in request.get('messages', []))
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(text),
+            'total_tokens': prompt_tokens + len(text),
+            'prompt_tokens_details': {'cached_tokens': 0}
+        }
+        base = {'id': f"chatcmpl-{uuid.uuid4().hex}", 'created': int(time.time()), 'model': request.get('model', 'mock')}
+
+        self.config.latency.sleep()
+        if not request.get('stream'):
+            self._send_json(200, {
+                **base,
+                'object': 'chat.completion',
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': usage
+            })
+            return
+
+        self._start_stream()
+        chunk = {**base, 'object': 'chat.completion.chunk'}
+        self._write_event({**chunk, 'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': ''}}]})
+        for token in _split_tokens(text):
+            self.config.token_interval.sleep()
+            self._write_event({**chunk, 'choices': [{'index': 0, 'delta': {'content': token}}]})
+        self._write_event({**chunk, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+        if (request.get('stream_options') or {}).get('include_usage'):
+            self._write_event({**chunk, 'choices': [], 'usage': usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    # ---- Anthropic Messages ----
+
+    def _anthropic(self, request):
+        text = _reply_text(self.config)
+        system = request.get('system') or ''
+        if isinstance(system, list):
+            system = ''.join(block.get('text', '') for block in system)
+        input_tokens = len(system) + sum(len(m.get('content') or '') for m in request.get('messages', []) if isinstance(m.get('content'), str))
+        message = {
+            'id': f"msg_{uuid.uuid4().hex}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': request.get('model', 'mock'),
+            'content': [],
+            'stop_reason': None,
+            'stop_sequence': None,
+            'usage': {'input_tokens': input_tokens, 'output_tokens': 0,
+                      'cache_read_input_tokens': 0, 'cache_creation_input_tokens': 0}
+        }
+
+        self.config.latency.sleep()
+        if not request.get('stream'):
+            message['content'] = [{'type': 'text', 'text': text}]
+            message['stop_reason'] = 'end_turn'
+            message['usage']['output_tokens'] = len(text)
+            self._send_json(200, message)
+            return
+
+        self._start_stream()
+        self._write_event({'type': 'message_start', 'message': message}, 'message_start')
+        self._write_event({'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}}, 'content_block_start')
+        for token in _split_tokens(text):
+            self.config.token_interval.sleep()
+            self._write_event({'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': token}}, 'content_block_delta')
+        self._write_event({'type': 'content_block_stop', 'index': 0}, 'content_block_stop')
+        self._write_event({'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                           'usage': {'output_tokens': len(text)}}, 'message_delta')
+        self._write_event({'type': 'message_stop'}, 'message_stop')
+
+    # ---- tts.quest ----
+
+    def _tts_synthesis(self, params):
+        if not params.get('text'):
+            self._send_json(200, {'success': False, 'errorMessage': 'text is required'})
+            return
+        self.config.tts_latency.sleep()
+        audio_id = uuid.uuid4().hex
+        host = self.headers.get('Host')
+        self._send_json(200, {
+            'success': True,
+            'isApiKeyValid': True,
+            'speakerName': f"mock:{params.get('speaker')}",
+            'audioStatusUrl': f"http://{host}/mock/audio/status/{audio_id}",
+            'mp3DownloadUrl': f"http://{host}/mock/audio/{audio_id}.mp3",
+            'mp3StreamingUrl': f"http://{host}/mock/audio/{audio_id}.mp3",
+            'retryAfter': None
+        })
+
+
+    # ---- VOICEVOX エンジン ----
+
+    def _engine_audio_query(self, params):
+        if not params.get('text') or not params.get('speaker'):
+            self._send_json(422, {'detail': 'text and speaker are required'})
+            return
+        # 本物の AudioQuery のうち、合成の長さに使う値だけを返す
+        self._send_json(200, {
+            'accent_phrases': [],
+            'speedScale': 1.0,
+            'pitchScale': 0.0,
+            'intonationScale': 1.0,
+            'volumeScale': 1.0,
+            'prePhonemeLength': 0.1,
+            'postPhonemeLength': 0.1,
+            'outputSamplingRate': ENGINE_SAMPLE_RATE,
+            'outputStereo': False,
+            'kana': params['text']
+        })
+
+    def _engine_wav(self, query):
+        """1文の合成（文字数に比例した長さの無音WAV）"""
+        self.config.engine_latency.sleep()
+        seconds = query.get('prePhonemeLength', 0) + query.get('postPhonemeLength', 0)
+        return _silent_wav(seconds + len(query.get('kana', '')) * ENGINE_SECONDS_PER_CHAR)
+
+    def _engine_synthesis(self, query):
+        self._send(200, self._engine_wav(query), 'audio/wav')
+
+    def _engine_multi_synthesis(self, queries):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for i, query in enumerate(queries, 1):
+                archive.writestr(f"{i:03}.wav", self._engine_wav(query))
+        self._send(200, buffer.getvalue(), 'application/zip')
+
+
+def create_server(host, port, config):
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.config = config
+    server.record_store = RecordStore(config.record_dir) if config.record_dir else None
+    server.replay_store = RecordStore(config.replay_dir) if config.replay_dir else None
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI / Anthropic / tts.quest / VOICEVOX engine providers")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', default='lognormal:-1.2,0.4',
+                        help="LLMの最初の応答までの遅延分布（例: fixed:0.3, uniform:0.1,0.5, lognormal:-1.2,0.4）")
+    parser.add_argument('--token-interval', default='fixed:0.02', help="ストリーミング時のトークン間隔の分布")
+    parser.add_argument('--tts-latency', default='uniform:0.2,0.6', help="tts.quest 合成の遅延分布")
+    parser.add_argument('--engine-latency', default='uniform:0.05,0.15',
+                        help="VOICEVOX エンジンの1文あたりの合成の遅延分布")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="429/500/503 を返す確率（0〜1）")
+    parser.add_argument('--reply-chars', type=int, default=80, help="LLM応答の文字数")
+    parser.add_argument('--audio-frames', type=int, default=40, help="返す無音MP3のフレーム数")
+    parser.add_argument('--seed', type=int, help="乱数シード（再現実行用）")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', metavar='DIR', help="本物のAPIへ中継して応答を保存する")
+    group.add_argument('--replay', metavar='DIR', help="保存した応答を返す（未記録のリクエストは合成応答）")
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    server = create_server(args.host, args.port, MockConfig(args))
+    logger.info(f"Mock providers listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
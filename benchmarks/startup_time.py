@@ -0,0 +1,100 @@
+"""起動時間（モジュールの読み込みと温め）の計測
+
+新しいプロセスでアプリを読み込む時間と、utils/warmup.py の温めにかかる時間を繰り返し測り、
+中央値を表示する。最後の回の `python -X importtime` の結果から、読み込みに時間のかかっている
+モジュールも表示する。
+
+    python benchmarks/startup_time.py --runs 5 --target app --top 15
+
+--max-import を指定すると、読み込み時間の中央値が閾値を超えた場合に終了コード1を返す
+（デプロイ前の回帰検出用）。
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子プロセスで実行し、計測結果をJSONの1行で出力する
+PROBE = """
+import json, time
+started = time.perf_counter()
+import {target}
+imported = time.perf_counter()
+from utils.warmup import warm_up
+warm_up()
+warmed = time.perf_counter()
+print(json.dumps({{'import': imported - started, 'warm_up': warmed - imported}}))
+"""
+
+
+def run_once(target):
+    """1回分の (読み込み秒, 温め秒, importtime の行) を返す"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(target=target)],
+        cwd=ROOT, capture_output=True, text=True, timeout=300
+    )
+    if result.returncode != 0:
+        raise Exception(f"Probe failed: {result.stderr.strip().splitlines()[-1:]}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    import_lines = [line for line in result.stderr.splitlines() if line.startswith('import time:')]
+    return timings['import'], timings['warm_up'], import_lines
+
+
+def slowest_imports(import_lines, top):
+    """importtime の出力から、累積時間の長いモジュールを (モジュール名, 累積秒, 自身の秒) で返す"""
+    rows = []
+    for line in import_lines[1:]:  # 1行目は見出し
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        rows.append((name.strip(), int(cumulative_us) / 1e6, int(self_us) / 1e6))
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return rows[:top]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold start (import and warm-up) time")
+    parser.add_argument('--runs', type=int, default=5, help="計測する回数")
+    parser.add_argument('--target', default='app', help="読み込むモジュール（app / asgi）")
+    parser.add_argument('--top', type=int, default=15, help="表示する遅いモジュールの数")
+    parser.add_argument('--max-import', type=float, help="読み込み時間の中央値の上限（秒）")
+    parser.add_argument('--json', metavar='FILE', help="結果をJSONで保存する")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    import_seconds, warm_up_seconds = [], []
+    for i in range(args.runs):
+        imported, warmed, import_lines = run_once(args.target)
+        import_seconds.append(imported)
+        warm_up_seconds.append(warmed)
+        print(f"run {i + 1}: import {imported * 1000:.0f}ms, warm-up {warmed * 1000:.0f}ms")
+
+    result = {
+        'target': args.target,
+        'runs': args.runs,
+        'import': statistics.median(import_seconds),
+        'warm_up': statistics.median(warm_up_seconds),
+        'slowest_imports': slowest_imports(import_lines, args.top),
+    }
+    print(f"\nmedian: import {result['import'] * 1000:.0f}ms, warm-up {result['warm_up'] * 1000:.0f}ms")
+    print(f"\n{'cumulative':>10} {'self':>8}  module")
+    for name, cumulative, own in result['slowest_imports']:
+        print(f"{cumulative * 1000:>8.0f}ms {own * 1000:>6.0f}ms  {name}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+    if args.max_import is not None and result['import'] > args.max_import:
+        print(f"FAIL: import {result['import']:.3f}s exceeds {args.max_import:.3f}s", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
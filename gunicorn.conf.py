@@ -0,0 +1,29 @@
+"""gunicorn の設定（起動したディレクトリのこのファイルが自動で読み込まれる）
+
+アプリはマスタープロセスで1回だけ読み込み（preload_app）、読み取り専用のデータを温めてから
+ワーカーを fork する。ワーカーは温まった状態で始まり、プロバイダのクライアントや接続は
+ワーカーごとに初めて使うときに作る。ポートとワーカー数は gunicorn が PORT / WEB_CONCURRENCY から決める。
+"""
+import os
+
+# /chat/stream（SSE）や /ws は応答が終わるまでワーカーを1つ占有するので、スレッドを使うワーカーにする。
+# sync ワーカーだと、ストリーム中に画面から来る文ごとの /tts が前の応答の終わりを待つことになる
+# （-k uvicorn.workers.UvicornWorker などコマンドラインの指定がこちらより優先される）
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "16"))
+
+# GUNICORN_PRELOAD=0 でワーカーごとに読み込む（コードの変更をワーカーの再起動だけで反映したいときなど）
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    # preload ならアプリは読み込み済み。fork する前に温めておく
+    if preload_app:
+        from utils.warmup import warm_up
+        warm_up()
+
+
+def post_worker_init(worker):
+    # preload しない場合は、リクエストを受け付ける前にワーカーで温める（温め済みなら何もしない）
+    from utils.warmup import warm_up
+    warm_up()
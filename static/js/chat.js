@@ -6,9 +6,17 @@ async function preparedBuffer(voice_path) {
     if (!res.ok) {
         throw new Error(`Failed to fetch audio data: ${res.status} ${res.statusText}`);
     }
+    const timeline = lipTimeline(res);
     const arrayBuffer = await res.arrayBuffer();
     const audioBuffer = await ctx.decodeAudioData(arrayBuffer);
-    return {audioBuffer, ctx};
+    return {audioBuffer, ctx, timeline};
+}
+
+/* /tts のレスポンスに付いている口の開き具合のタイムライン（サーバーで計算したもの。なければ null） */
+function lipTimeline(res) {
+    const fps = parseInt(res.headers.get('X-Lip-Sync-FPS'));
+    const frames = res.headers.get('X-Lip-Sync-Frames');
+    return fps && frames ? {fps, frames} : null;
 }
 
 /* 入力ノード、Analyserノードを生成し、出力層に接続 */
@@ -20,127 +28,139 @@ function buildNodes(audioBuffer, ctx) {
     return {audioSrc, analyser};
 }
 
-/* スペクトルをもとにリップシンクを行う */
-function syncLip(spectrums, voicevox_id, currentSpeaker) {
-    const vocalRangeSpectrums = spectrums.slice(0, spectrums.length / 2);
-    const totalSpectrum = vocalRangeSpectrums.reduce((a, x) => a + x, 0);
+/* スタイルIDに対応するキャラクターの口の画像（/speaker-styles の mouth） */
+function mouthPrefix(voicevox_id) {
+    const character = styleCharacters[parseInt(voicevox_id)];
+    return character ? character.mouth : null;
+}
 
-    console.log("Current total spectrum:", totalSpectrum);
-    console.log("Previous spectrum:", prevSpec);
-    console.log("Difference:", prevSpec - totalSpectrum);
-    console.log("Current voicevox_id:", voicevox_id);
-
-    // 四国めたん用のリップシンク
-    if ([0, 2, 4, 6, 36, 37].includes(parseInt(voicevox_id))) {
-        const leftMouseElement = document.querySelector('.standing-character.left .character-mouth');
-        if (leftMouseElement && currentSpeaker === 'A') {
-            if (totalSpectrum > prevSpec) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/metan_mouse_open.png')";
-            } else if (prevSpec - totalSpectrum < 250) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/metan_mouse_open_middle.png')";
-            } else if (prevSpec - totalSpectrum < 500) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/metan_mouse_close_middle.png')";
-            } else {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/metan_mouse_close.png')";
-            }
-        }
+// タイムラインの値（0〜3）に対応する口の画像
+const MOUTH_FRAMES = ['mouse_close', 'mouse_close_middle', 'mouse_open_middle', 'mouse_open'];
+
+/* 再生開始から elapsed 秒の位置の口の形をタイムラインから引いて表示する */
+function showTimelineMouth(timeline, elapsed, voicevox_id, currentSpeaker) {
+    const mouth = mouthPrefix(voicevox_id);
+    const side = currentSpeaker === 'A' ? 'left' : 'right';
+    const mouthElement = document.querySelector(`.standing-character.${side} [data-part="mouth"]`);
+    if (!mouth || !mouthElement) return;
+    const index = Math.floor(elapsed * timeline.fps);
+    const level = index >= 0 && index < timeline.frames.length ? Number(timeline.frames[index]) : 0;
+    showFrame(mouthElement, mouth, MOUTH_FRAMES[level]);
+}
 
-        const rightMouseElement = document.querySelector('.standing-character.right .character-mouth');
-        if (rightMouseElement && currentSpeaker === 'B') {
-            if (totalSpectrum > prevSpec) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/metan_mouse_open.png')";
-            } else if (prevSpec - totalSpectrum < 250) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/metan_mouse_open_middle.png')";
-            } else if (prevSpec - totalSpectrum < 500) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/metan_mouse_close_middle.png')";
-            } else {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/metan_mouse_close.png')";
-            }
-        }
-    }
-    // 雨晴はう用のリップシンク
-    else if (parseInt(voicevox_id) === 10) {  // 雨晴はうのボイスID
-        const leftMouseElement = document.querySelector('.standing-character.left .character-mouth');
-        if (leftMouseElement && currentSpeaker === 'A') {
-            if (totalSpectrum > prevSpec) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/hau_mouse_open.png')";
-            } else if (prevSpec - totalSpectrum < 250) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/hau_mouse_open_middle.png')";
-            } else if (prevSpec - totalSpectrum < 500) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/hau_mouse_close_middle.png')";
-            } else {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/hau_mouse_close.png')";
-            }
-        }
+/* ビルド済みアセット（tools/build_assets.py の manifest）。なければ static/assets の個別PNGを使う */
+const IMAGE_FORMATS = ['avif', 'webp', 'png'];
+const LEGACY_FRAME_FILES = {
+    hau: {eye_open: 'hau_open_eyes.png', eye_close: 'hau_close_eyes.png'}
+};
+const LEGACY_STANDING_FILES = {
+    metan: 'standing_metan.png',
+    hau: 'hau_standing.png',
+    tsumugi: 'standing_tsumugi.png',
+    whiteCul: 'whiteCul_standing.png'
+};
+
+function builtCharacter(character) {
+    const manifest = window.ASSET_MANIFEST;
+    return manifest && manifest.characters ? manifest.characters[character] : null;
+}
 
-        const rightMouseElement = document.querySelector('.standing-character.right .character-mouth');
-        if (rightMouseElement && currentSpeaker === 'B') {
-            if (totalSpectrum > prevSpec) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/hau_mouse_open.png')";
-            } else if (prevSpec - totalSpectrum < 250) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/hau_mouse_open_middle.png')";
-            } else if (prevSpec - totalSpectrum < 500) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/hau_mouse_close_middle.png')";
-            } else {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/hau_mouse_close.png')";
-            }
-        }
+/* 形式ごとのファイルを優先順（AVIF → WebP → PNG）のURLにする */
+function builtImageUrls(files) {
+    return IMAGE_FORMATS.filter(format => files[format]).map(format => `/dist/${files[format]}`);
+}
+
+function legacyFrameUrl(character, frame) {
+    const file = (LEGACY_FRAME_FILES[character] || {})[frame] || `${character}_${frame}.png`;
+    return `/static/assets/${file}`;
+}
+
+/* 目・口のフレームを切り替える（アトラスならその位置を表示し、なければ個別のPNGに差し替える） */
+function showFrame(element, character, frame) {
+    if (element.dataset.frame === frame) return;
+    element.dataset.frame = frame;
+    const built = builtCharacter(character);
+    const rect = built && built.frames[frame];
+    if (rect && element.dataset.sprite) {
+        const [, , , height, top] = rect;
+        const range = built.atlas_size[1] - height;
+        element.style.backgroundPosition = `0 ${range > 0 ? top / range * 100 : 0}%`;
+    } else if (element.tagName === 'IMG') {
+        element.src = legacyFrameUrl(character, frame);
+    } else {
+        element.style.backgroundImage = `url('${legacyFrameUrl(character, frame)}')`;
     }
-    // 春日部つむぎ用のリップシンク部分を修正
-    else if (parseInt(voicevox_id) === 8) {  // 春日部つむぎのボイスID
-        const leftMouseElement = document.querySelector('.standing-character.left[data-character="tsumugi"] .character-mouth');
-        if (leftMouseElement && currentSpeaker === 'A') {
-            if (totalSpectrum > prevSpec) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/tsumugi_mouse_open.png')";
-            } else if (prevSpec - totalSpectrum < 250) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/tsumugi_mouse_open_middle.png')";
-            } else if (prevSpec - totalSpectrum < 500) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/tsumugi_mouse_close_middle.png')";
-            } else {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/tsumugi_mouse_close.png')";
-            }
-        }
+}
 
-        const rightMouseElement = document.querySelector('.standing-character.right[data-character="tsumugi"] .character-mouth');
-        if (rightMouseElement && currentSpeaker === 'B') {
-            if (totalSpectrum > prevSpec) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/tsumugi_mouse_open.png')";
-            } else if (prevSpec - totalSpectrum < 250) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/tsumugi_mouse_open_middle.png')";
-            } else if (prevSpec - totalSpectrum < 500) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/tsumugi_mouse_close_middle.png')";
-            } else {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/tsumugi_mouse_close.png')";
-            }
-        }
+/* アトラスの一部を表示する要素（位置と大きさは立ち絵に対する割合） */
+function spriteMarkup(built, part, frame) {
+    const [canvasWidth, canvasHeight] = built.canvas;
+    const [atlasWidth, atlasHeight] = built.atlas_size;
+    const [x, y, width, height] = built.frames[frame];
+    const urls = builtImageUrls(built.atlas);
+    const imageSet = IMAGE_FORMATS.filter(format => built.atlas[format])
+        .map(format => `url('/dist/${built.atlas[format]}') type('image/${format}')`).join(', ');
+    const style = [
+        `left: ${x / canvasWidth * 100}%`,
+        `top: ${y / canvasHeight * 100}%`,
+        `width: ${width / canvasWidth * 100}%`,
+        `height: ${height / canvasHeight * 100}%`,
+        `background-image: url('${urls[urls.length - 1]}')`,
+        // image-set() に対応していないブラウザは上の PNG のまま
+        `background-image: image-set(${imageSet})`,
+        `background-size: ${atlasWidth / width * 100}% ${atlasHeight / height * 100}%`
+    ].join('; ');
+    return `<div class="character-sprite ${part}" data-part="${part}" data-sprite="1" style="${style}"></div>`;
+}
+
+/* 立ち絵（ベース・目・口）のHTML */
+function standingMarkup(character, name) {
+    const built = builtCharacter(character);
+    if (!built) {
+        return `
+            <div class="character-container">
+                <img class="standing-character-base" src="/static/assets/${LEGACY_STANDING_FILES[character]}" alt="${name}">
+                <img class="standing-character-eyes" data-part="eyes" src="${legacyFrameUrl(character, 'eye_open')}" alt="${name}目">
+                <div class="character-mouth" data-part="mouth" style="background-image: url('${legacyFrameUrl(character, 'mouse_close')}')"></div>
+            </div>
+        `;
     }
-    // WhiteCUL用のリップシンク
-    else if ([23, 24, 25, 26].includes(parseInt(voicevox_id))) {  // WhiteCULのボイスID
-        const leftMouseElement = document.querySelector('.standing-character.left[data-character="whitecul"] .character-mouth');
-        if (leftMouseElement && currentSpeaker === 'A') {
-            if (totalSpectrum > prevSpec) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/whiteCul_mouse_open.png')";
-            } else if (prevSpec - totalSpectrum < 250) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/whiteCul_mouse_open_middle.png')";
-            } else if (prevSpec - totalSpectrum < 500) {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/whiteCul_mouse_close_middle.png')";
-            } else {
-                leftMouseElement.style.backgroundImage = "url('/static/assets/whiteCul_mouse_close.png')";
-            }
-        }
 
-        const rightMouseElement = document.querySelector('.standing-character.right[data-character="whitecul"] .character-mouth');
-        if (rightMouseElement && currentSpeaker === 'B') {
-            if (totalSpectrum > prevSpec) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/whiteCul_mouse_open.png')";
-            } else if (prevSpec - totalSpectrum < 250) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/whiteCul_mouse_open_middle.png')";
-            } else if (prevSpec - totalSpectrum < 500) {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/whiteCul_mouse_close_middle.png')";
-            } else {
-                rightMouseElement.style.backgroundImage = "url('/static/assets/whiteCul_mouse_close.png')";
-            }
+    const sources = IMAGE_FORMATS.filter(format => format !== 'png' && built.standing[format])
+        .map(format => `<source type="image/${format}" srcset="/dist/${built.standing[format]}">`).join('');
+    const fallback = builtImageUrls(built.standing).pop();
+    return `
+        <div class="character-container">
+            <div class="character-canvas" style="--canvas-ratio: ${built.canvas[0] / built.canvas[1]}">
+                <picture>${sources}<img class="character-layer" src="${fallback}" alt="${name}"></picture>
+                ${spriteMarkup(built, 'eyes', 'eye_open')}
+                ${spriteMarkup(built, 'mouth', 'mouse_close')}
+            </div>
+        </div>
+    `;
+}
+
+/* スペクトルをもとにリップシンクを行う（サーバーのタイムラインがない音声用） */
+function syncLip(spectrums, voicevox_id, currentSpeaker) {
+    const vocalRangeSpectrums = spectrums.slice(0, spectrums.length / 2);
+    const totalSpectrum = vocalRangeSpectrums.reduce((a, x) => a + x, 0);
+
+    // 口の画像があるキャラクターだけリップシンクする
+    const mouth = mouthPrefix(voicevox_id);
+    const side = currentSpeaker === 'A' ? 'left' : 'right';
+    const mouthElement = document.querySelector(`.standing-character.${side} [data-part="mouth"]`);
+    if (mouth && mouthElement) {
+        let state;
+        if (totalSpectrum > prevSpec) {
+            state = 'open';
+        } else if (prevSpec - totalSpectrum < 250) {
+            state = 'open_middle';
+        } else if (prevSpec - totalSpectrum < 500) {
+            state = 'close_middle';
+        } else {
+            state = 'close';
         }
+        showFrame(mouthElement, mouth, `mouse_${state}`);
     }
 
     prevSpec = totalSpectrum;
@@ -164,7 +184,7 @@ async function playVoice(voice_path, voicevox_id, message, currentSpeaker) {
     let audioDuration = 0;  // 関数スコープで宣言
 
     try {
-        const {audioBuffer, ctx: newCtx} = await preparedBuffer(voice_path);
+        const {audioBuffer, ctx: newCtx, timeline} = await preparedBuffer(voice_path);
         console.log("Audio buffer prepared successfully");
 
         ctx = newCtx;
@@ -183,15 +203,23 @@ async function playVoice(voice_path, voicevox_id, message, currentSpeaker) {
         }
 
         console.log("Starting audio playback");
+        const startedAt = ctx.currentTime;
         audioSrc.start();
 
-        // 40ms毎に音声のサンプリング→解析→リップシンクを行う
-        sampleInterval = setInterval(() => {
-            let spectrums = new Uint8Array(analyser.fftSize);
-            analyser.getByteFrequencyData(spectrums);
-            console.log('Frequency Data:', Array.from(spectrums.slice(0, 10)));
-            syncLip(spectrums, voicevox_id, currentSpeaker);
-        }, 40);
+        if (timeline) {
+            // サーバーで計算したタイムラインを再生位置で引く
+            const playingCtx = ctx;
+            sampleInterval = setInterval(() => {
+                showTimelineMouth(timeline, playingCtx.currentTime - startedAt, voicevox_id, currentSpeaker);
+            }, 1000 / timeline.fps);
+        } else {
+            // 40ms毎に音声のサンプリング→解析→リップシンクを行う
+            sampleInterval = setInterval(() => {
+                let spectrums = new Uint8Array(analyser.fftSize);
+                analyser.getByteFrequencyData(spectrums);
+                syncLip(spectrums, voicevox_id, currentSpeaker);
+            }, 40);
+        }
 
         // 音声終了時のコールバック
         audioSrc.onended = () => {
@@ -218,32 +246,7 @@ async function playVoice(voice_path, voicevox_id, message, currentSpeaker) {
             }
 
             // 口を閉じた状態に戻す
-            const leftMouseElement = document.querySelector('.standing-character.left .character-mouth');
-            const rightMouseElement = document.querySelector('.standing-character.right .character-mouth');
-
-            // キャラクター別の口の画像設定
-            if (leftMouseElement && currentSpeaker === 'A') {
-                if (speakerASelect.value === '四国めたん') {
-                    leftMouseElement.style.backgroundImage = "url('/static/assets/metan_mouse_close.png')";
-                } else if (speakerASelect.value === '雨晴はう') {
-                    leftMouseElement.style.backgroundImage = "url('/static/assets/hau_mouse_close.png')";
-                } else if (speakerASelect.value === '春日部つむぎ') {
-                    leftMouseElement.style.backgroundImage = "url('/static/assets/tsumugi_mouse_close.png')";
-                } else if (speakerASelect.value === 'WhiteCUL') {
-                    leftMouseElement.style.backgroundImage = "url('/static/assets/whiteCul_mouse_close.png')";
-                }
-            }
-            if (rightMouseElement && currentSpeaker === 'B') {
-                if (speakerBSelect.value === '四国めたん') {
-                    rightMouseElement.style.backgroundImage = "url('/static/assets/metan_mouse_close.png')";
-                } else if (speakerBSelect.value === '雨晴はう') {
-                    rightMouseElement.style.backgroundImage = "url('/static/assets/hau_mouse_close.png')";
-                } else if (speakerBSelect.value === '春日部つむぎ') {
-                    rightMouseElement.style.backgroundImage = "url('/static/assets/tsumugi_mouse_close.png')";
-                } else if (speakerBSelect.value === 'WhiteCUL') {
-                    rightMouseElement.style.backgroundImage = "url('/static/assets/whiteCul_mouse_close.png')";
-                }
-            }
+            resetMouth(currentSpeaker);
         };
     } catch (error) {
         console.error('Error in playVoice:', error);
@@ -277,6 +280,125 @@ async function playVoice(voice_path, voicevox_id, message, currentSpeaker) {
     return audioDuration;
 }
 
+/* 文ごとに合成された音声を順番どおり、隙間なく再生する */
+class ChunkPlayer {
+    constructor(voicevox_id, currentSpeaker, startAfter = Promise.resolve()) {
+        this.voicevox_id = voicevox_id;
+        this.currentSpeaker = currentSpeaker;
+        this.ctx = new AudioContext();
+        this.analyser = new AnalyserNode(this.ctx);
+        this.analyser.fftSize = 512;
+        this.analyser.connect(this.ctx.destination);
+        this.nextStartTime = 0;
+        this.activeSources = 0;
+        this.allScheduled = false;
+        this.closed = false;
+        this.lipInterval = null;
+        this.segments = []; // 予約済みの音声の {start, end, timeline}（開始順）
+        // 先行する話者の再生が終わるまで予約を始めない
+        this.pending = startAfter.catch(() => {});
+        this.drained = new Promise(resolve => { this.resolveDrained = resolve; });
+    }
+
+    // 取得・デコードはすぐに並行して始め、再生の予約だけを到着順に行う
+    // （/ws の audio_ready ではタイムラインが先に届くので、それを使う）
+    enqueue(url, knownTimeline = null) {
+        if (this.closed) return;
+        const bufferPromise = fetch(url)
+            .then(res => {
+                if (!res.ok) {
+                    throw new Error(`Failed to fetch audio data: ${res.status} ${res.statusText}`);
+                }
+                const timeline = knownTimeline || lipTimeline(res);
+                return res.arrayBuffer()
+                    .then(arrayBuffer => this.ctx.decodeAudioData(arrayBuffer))
+                    .then(audioBuffer => ({audioBuffer, timeline}));
+            });
+
+        this.pending = this.pending
+            .then(() => bufferPromise)
+            .then(({audioBuffer, timeline}) => this.schedule(audioBuffer, timeline))
+            .catch(error => {
+                if (!this.closed) console.error('Error in chunk playback:', error);
+            });
+    }
+
+    schedule(audioBuffer, timeline) {
+        if (this.closed) return;
+        const source = new AudioBufferSourceNode(this.ctx, { buffer: audioBuffer });
+        source.connect(this.analyser);
+
+        // 前の文の終了時刻にぴったり続けて再生する
+        const startAt = Math.max(this.ctx.currentTime + 0.05, this.nextStartTime);
+        source.start(startAt);
+        this.nextStartTime = startAt + audioBuffer.duration;
+        this.activeSources++;
+        this.segments.push({start: startAt, end: this.nextStartTime, timeline});
+
+        if (!this.lipInterval) {
+            this.lipInterval = setInterval(() => this.updateMouth(), 40);
+        }
+
+        source.onended = () => {
+            this.segments.shift();
+            this.activeSources--;
+            this.checkDrained();
+        };
+    }
+
+    // 再生中の文にタイムラインがあればそれを引き、なければ音声を解析する
+    updateMouth() {
+        const now = this.ctx.currentTime;
+        const segment = this.segments.find(s => now >= s.start && now < s.end);
+        if (segment && segment.timeline) {
+            showTimelineMouth(segment.timeline, now - segment.start, this.voicevox_id, this.currentSpeaker);
+            return;
+        }
+        const spectrums = new Uint8Array(this.analyser.fftSize);
+        this.analyser.getByteFrequencyData(spectrums);
+        syncLip(spectrums, this.voicevox_id, this.currentSpeaker);
+    }
+
+    // これ以上文が追加されないことを通知する
+    finish() {
+        this.pending.then(() => {
+            this.allScheduled = true;
+            this.checkDrained();
+        });
+        return this.drained;
+    }
+
+    // 新しいメッセージを送ったときに、予約済みの分も含めて再生をやめる
+    stop() {
+        this.allScheduled = true;
+        this.activeSources = 0;
+        this.segments = [];
+        this.checkDrained();
+    }
+
+    checkDrained() {
+        if (this.closed || !this.allScheduled || this.activeSources > 0) return;
+        this.closed = true;
+        clearInterval(this.lipInterval);
+        this.lipInterval = null;
+        prevSpec = 0;
+        this.ctx.close();
+        resetMouth(this.currentSpeaker);
+        this.resolveDrained();
+    }
+}
+
+// 口を閉じた状態に戻す
+function resetMouth(currentSpeaker) {
+    const styleSelect = currentSpeaker === 'A' ? styleASelect : styleBSelect;
+    const side = currentSpeaker === 'A' ? 'left' : 'right';
+    const mouthElement = document.querySelector(`.standing-character.${side} [data-part="mouth"]`);
+    const mouth = mouthPrefix(styleSelect.value);
+    if (mouthElement && mouth) {
+        showFrame(mouthElement, mouth, 'mouse_close');
+    }
+}
+
 // createAudioControl関数の修正部分
 function createAudioControl(text, styleId, currentSpeaker) {
     const audioControl = document.createElement('div');
@@ -284,7 +406,7 @@ function createAudioControl(text, styleId, currentSpeaker) {
 
     const playButton = document.createElement('button');
     playButton.innerHTML = '<i class="fas fa-paper-plane"></i>';
-    playButton.disabled = !TTS_QUEST_API_KEY;
+    playButton.disabled = !TTS_AVAILABLE;
 
     const statusIndicator = document.createElement('span');
     statusIndicator.classList.add('status-indicator');
@@ -324,49 +446,13 @@ function createAudioControl(text, styleId, currentSpeaker) {
 
 async function play(text, styleId, currentSpeaker) {
     console.log("Starting play function with:", {text, styleId, currentSpeaker});
-    var ttsQuestApiKey = TTS_QUEST_API_KEY;  // グローバル変数から取得
-    var audio = new TtsQuestV3Voicevox(styleId, text, ttsQuestApiKey);
-
-    return new Promise((resolve, reject) => {
-        const timeout = setTimeout(() => {
-            reject(new Error('音声生成がタイムアウトしました'));
-        }, 30000);
-
-        audio.addEventListener('tts-ready', async () => {
-            clearTimeout(timeout);
-            try {
-                const mp3Url = await audio.play();
-                console.log("Received MP3 URL:", mp3Url);
-                if (mp3Url) {
-                    const duration = await playVoice(mp3Url, styleId, text, currentSpeaker);
-                    resolve(duration);
-                } else {
-                    throw new Error('音声URLの取得に失敗しました');
-                }
-            } catch (error) {
-                console.error("Error playing audio:", error);
-                if (currentStatusIndicator) {
-                    currentStatusIndicator.textContent = '再生エラー';
-                }
-                isPlaying = false;
-                reject(error);
-            }
-        });
-
-        audio.addEventListener('tts-error', (event) => {
-            clearTimeout(timeout);
-            console.error("TTS Error:", event.detail);
-            if (currentStatusIndicator) {
-                currentStatusIndicator.textContent = '再生エラー';
-            }
-            isPlaying = false;
-            reject(new Error(event.detail));
-        });
-    });
+    // 音声合成はサーバー側（/tts）で行い、同じ文章はキャッシュから返される
+    const query = new URLSearchParams({text: text, speaker: styleId});
+    return await playVoice(`/tts?${query.toString()}`, styleId, text, currentSpeaker);
 }
 
 // メッセージ表示関数の修正
-function addMessage(text, type) {
+function addMessage(text, type, withAudio = true) {
     if (!chatMessages) {
         chatMessages = document.getElementById('chat-messages');
     }
@@ -445,16 +531,184 @@ function addMessage(text, type) {
     timestamp.textContent = getCurrentTime();
     messageDiv.appendChild(timestamp);
 
-    if (type !== 'user' && TTS_QUEST_API_KEY) {
+    if (withAudio) {
+        attachAudioControl(messageDiv, text, type);
+    }
+
+    chatMessages.appendChild(messageDiv);
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+    return messageDiv;
+}
+
+// メッセージに音声コントロールを追加する（ストリーミング完了後にも使用）
+function attachAudioControl(messageDiv, text, type) {
+    if (type !== 'user' && TTS_AVAILABLE) {
         const styleId = type === 'ai-message-a' ? styleASelect.value : styleBSelect.value;
         const currentSpeaker = type === 'ai-message-a' ? 'A' : 'B';
         const audioControl = createAudioControl(text, styleId, currentSpeaker);
         messageDiv.appendChild(audioControl);
     }
+}
 
-    chatMessages.appendChild(messageDiv);
+// ストリーミング中のメッセージにテキストの差分を追記する
+function appendMessageText(messageDiv, delta) {
+    const contentDiv = messageDiv.querySelector('.message-content');
+    contentDiv.textContent += delta;
     chatMessages.scrollTop = chatMessages.scrollHeight;
-    return messageDiv;
+}
+
+/* 混雑（503）時に表示するメッセージ */
+/* 1回の送信を表す冪等キー（同じ送信の再送はサーバーで1回にまとめられる） */
+function newRequestKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+/* 新しいメッセージで取り消されたターンのエラー（表示しない） */
+function supersededError() {
+    return new DOMException('Superseded by a newer message', 'AbortError');
+}
+
+function busyMessage(retryAfter) {
+    const seconds = parseInt(retryAfter) || 1;
+    return `サーバーが混雑しています。${seconds}秒ほど待ってからもう一度送信してください`;
+}
+
+/* /chat/stream のSSEを読み取り、イベントごとにコールバックを呼ぶ */
+async function streamChat(body, onEvent, signal) {
+    const response = await fetch('/chat/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Idempotency-Key': body.idempotency_key
+        },
+        body: JSON.stringify(body),
+        signal: signal
+    });
+
+    if (!response.ok) {
+        const data = await response.json();
+        // 取り消されたターンと再送の重複は表示しない
+        if (response.status === 409 && (data.cancelled || data.duplicate)) {
+            throw supersededError();
+        }
+        const error = new Error(data.error || `HTTP error! status: ${response.status}`);
+        if (response.status === 503) {
+            error.userMessage = busyMessage(data.retry_after || response.headers.get('Retry-After'));
+        }
+        throw error;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const {value, done} = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, {stream: true});
+
+        // イベントは空行で区切られる
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            const dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            if (dataLines.length > 0) {
+                onEvent(eventName, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
+/* /ws の常時接続。1ターンずつ送り、届いたイベントはそのターンのコールバックに渡す
+   （音声の準備完了はテキストの done の後にも届くので、次のターンまで同じコールバックを使う） */
+class ChatSocket {
+    constructor(url) {
+        this.url = url;
+        this.ws = null;
+        this.connecting = null;
+        this.handler = null;
+        this.rejectTurn = null;
+        this.request = null; // 実行中のターンの冪等キー
+    }
+
+    // 接続済みならそのまま使い、切れていればつなぎ直す
+    connect() {
+        if (this.ws && this.ws.readyState === WebSocket.OPEN) return Promise.resolve(this.ws);
+        if (this.connecting) return this.connecting;
+        this.connecting = new Promise((resolve, reject) => {
+            const ws = new WebSocket(this.url);
+            ws.onopen = () => {
+                this.ws = ws;
+                this.connecting = null;
+                resolve(ws);
+            };
+            ws.onerror = () => {
+                this.connecting = null;
+                reject(new Error('WebSocket connection failed'));
+            };
+            ws.onmessage = event => {
+                const data = JSON.parse(event.data);
+                // 取り消した前のターンのメッセージは捨てる
+                if (data.request && data.request !== this.request) return;
+                if (this.handler) this.handler(data.type, data);
+            };
+            ws.onclose = () => {
+                if (this.ws === ws) this.ws = null;
+                if (this.rejectTurn) this.rejectTurn(new Error('WebSocket closed during the turn'));
+            };
+        });
+        return this.connecting;
+    }
+
+    // テキストの応答が終わる（done か error か cancelled が届く）と解決する
+    // 前のターンが終わっていなければ取り消しとして終わらせる（サーバー側も新しいターンで取り消す）
+    async send(body, onEvent) {
+        const ws = await this.connect();
+        if (this.rejectTurn) this.rejectTurn(supersededError());
+        return new Promise((resolve, reject) => {
+            this.request = body.idempotency_key;
+            this.rejectTurn = reject;
+            this.handler = (type, data) => {
+                onEvent(type, data);
+                if (type === 'done' || type === 'error' || type === 'cancelled') {
+                    this.rejectTurn = null;
+                    resolve();
+                }
+            };
+            ws.send(JSON.stringify({type: 'chat', ...body}));
+        });
+    }
+}
+
+let chatSocket = null;
+// 最後に送ったターン（新しいメッセージを送ったら応答待ちと再生を止める）
+let currentTurn = null;
+
+/* /ws が有効で接続できればその ChatSocket を、できなければ null を返す（/chat/stream を使う） */
+async function openChatSocket() {
+    if (!window.CHAT_WEBSOCKET || !window.WebSocket) return null;
+    if (!chatSocket) {
+        const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        chatSocket = new ChatSocket(`${protocol}//${location.host}/ws`);
+    }
+    try {
+        await chatSocket.connect();
+        return chatSocket;
+    } catch (error) {
+        console.warn('WebSocket unavailable, falling back to /chat/stream:', error);
+        return null;
+    }
 }
 
 // グローバル変数の定義
@@ -464,7 +718,8 @@ let speakerBSelect;
 let styleASelect;
 let styleBSelect;
 let speakers = [];
-let TTS_QUEST_API_KEY = '';
+let styleCharacters = {}; // スタイルID → キャラクター（/speaker-styles）
+let TTS_AVAILABLE = false;
 let currentTheme = localStorage.getItem('theme') || 'light';
 let audio = null;
 let isPlaying = false;
@@ -489,170 +744,53 @@ function showUserMessage(message) {
     addMessage(message, 'user');
 }
 
-class TtsQuestV3Voicevox extends Audio {
-    constructor(styleId, text, ttsQuestApiKey) {
-        super();
-        this.speakerId = styleId;  // スタイルIDをそのまま使用
-        this.text = text;
-        this.ttsQuestApiKey = ttsQuestApiKey;
-        this.isInitialized = false;
-        this.retryCount = 0;
-        this.maxRetries = 5;
-        this.initialize();
-    }
-
-    initialize() {
-        const params = {
-            key: this.ttsQuestApiKey,
-            speaker: this.speakerId,
-            text: this.text,
-            format: 'mp3'
-        };
-        const query = new URLSearchParams(params);
-        this.startGeneration(query);
-    }
-
-    startGeneration(query) {
-        if (this.src && this.src.length > 0) return;
-
-        const apiUrl = 'https://api.tts.quest/v3/voicevox/synthesis';
-        this.dispatchEvent(new CustomEvent('tts-loading'));
-        console.log('Starting TTS generation...', {
-            url: apiUrl,
-            params: Object.fromEntries(query)
-        });
-
-        fetch(apiUrl + '?' + query.toString())
-            .then(response => {
-                if (!response.ok) {
-                    return response.json().then(errResponse => {
-                        console.error('API Error Response:', errResponse);
-                        throw new Error(`HTTP error! status: ${response.status}, message: ${errResponse.message || 'Unknown error'}`);
-                    }).catch(jsonError => {
-                        throw new Error(`HTTP error! status: ${response.status}`);
-                    });
-                }
-                return response.json();
-            })
-            .then(response => {
-                console.log('TTS API Response:', response);
-                this.handleApiResponse(response, query);
-            })
-            .catch(error => {
-                console.error('TTS API Error:', error);
-                this.handleError(error);
-            });
-    }
-
-    handleApiResponse(response, query) {
-        if (response.retryAfter !== undefined) {
-            if (this.retryCount >= this.maxRetries) {
-                throw new Error('最大リトライ回数を超えました');
-            }
-            console.log(`Retrying after ${response.retryAfter} seconds...`);
-            this.retryCount++;
-            setTimeout(() => this.startGeneration(query), 1000 * (1 + response.retryAfter));
-        } else if (response.mp3StreamingUrl) {
-            console.log('Received MP3 URL:', response.mp3StreamingUrl);
-            this.src = response.mp3StreamingUrl;
-            this.preload = 'auto';
-
-            this.oncanplaythrough = () => {
-                console.log('Audio is ready to play');
-                if (!this.isInitialized) {
-                    this.isInitialized = true;
-                    this.dispatchEvent(new CustomEvent('tts-ready'));
-                }
-            };
-        } else if (response.errorMessage) {
-            throw new Error(response.errorMessage);
-        } else {
-            throw new Error('不明なサーバーエラー');
-        }
-    }
-
-    handleError(error) {
-        console.error('Error in TTS generation:', error);
-        this.dispatchEvent(new CustomEvent('tts-error', {
-            detail: error.message || '音声生成中にエラーが発生しました'
-        }));
-    }
-
-    play() {
-        return new Promise((resolve, reject) => {
-            if (!this.src) {
-                reject(new Error('音声URLが設定されていません'));
-                return;
-            }
-
-            console.log('Playing audio with URL:', this.src);
-            resolve(this.src);
-        });
-    }
-}
-
 // 画像をプリロードする関数
 function preloadImages() {
     console.log("Starting image preload...");
 
-    // プリロードする画像のリスト
-    const imageUrls = [
-        '/static/assets/metan_eye_open.png',
-        '/static/assets/metan_eye_close.png',
-        '/static/assets/metan_mouse_open.png',
-        '/static/assets/metan_mouse_open_middle.png',
-        '/static/assets/metan_mouse_close_middle.png',
-        '/static/assets/metan_mouse_close.png',
-        '/static/assets/hau_open_eyes.png',
-        '/static/assets/hau_close_eyes.png',
-        '/static/assets/hau_mouse_open.png',
-        '/static/assets/hau_mouse_open_middle.png',
-        '/static/assets/hau_mouse_close_middle.png',
-        '/static/assets/hau_mouse_close.png',
-        '/static/assets/tsumugi_eye_open.png',
-        '/static/assets/tsumugi_eye_close.png',
-        '/static/assets/tsumugi_mouse_open.png',
-        '/static/assets/tsumugi_mouse_open_middle.png',
-        '/static/assets/tsumugi_mouse_close_middle.png',
-        '/static/assets/tsumugi_mouse_close.png',
-        '/static/assets/standing_metan.png',
-        '/static/assets/hau_standing.png',
-        '/static/assets/standing_tsumugi.png',
-        '/static/assets/whiteCul_standing.png',
-        '/static/assets/whiteCul_eye_open.png',
-        '/static/assets/whiteCul_eye_close.png',
-        '/static/assets/whiteCul_mouse_open.png',
-        '/static/assets/whiteCul_mouse_open_middle.png',
-        '/static/assets/whiteCul_mouse_close_middle.png',
-        '/static/assets/whiteCul_mouse_close.png',
-        '/static/assets/whiteCul_icon.png'
-    ];
+    // ビルド済みならキャラクターごとに立ち絵とアトラスの2枚（形式は対応しているものを順に試す）
+    const built = window.ASSET_MANIFEST ? Object.values(window.ASSET_MANIFEST.characters || {}) : [];
+    const imageSets = built.length
+        ? built.flatMap(character => [builtImageUrls(character.standing), builtImageUrls(character.atlas)])
+        : Object.keys(LEGACY_STANDING_FILES).flatMap(character => [
+            `/static/assets/${LEGACY_STANDING_FILES[character]}`,
+            ...['eye_open', 'eye_close', 'mouse_open', 'mouse_open_middle', 'mouse_close_middle', 'mouse_close']
+                .map(frame => legacyFrameUrl(character, frame))
+        ]).map(url => [url]);
+    imageSets.push(['/static/assets/whiteCul_icon.png']);
 
     // すべての画像をプリロード
     let loadedCount = 0;
-    imageUrls.forEach(url => {
-        console.log(`Preloading image: ${url}`);
-        const img = new Image();
-        img.onload = () => {
-            loadedCount++;
-            console.log(`Loaded image ${loadedCount}/${imageUrls.length}: ${url}`);
-            preloadedImages[url] = img;
-
-            if (loadedCount === imageUrls.length) {
-                console.log("All images preloaded successfully!");
-                isPreloadComplete = true;
-            }
-        };
-        img.onerror = (err) => {
-            console.error(`Failed to load image: ${url}`, err);
-            loadedCount++;
-            // エラーがあっても続行
-            if (loadedCount === imageUrls.length) {
-                console.log("Image preloading completed with some errors");
-                isPreloadComplete = true;
-            }
+    function finished() {
+        loadedCount++;
+        if (loadedCount === imageSets.length) {
+            console.log("Image preloading completed");
+            isPreloadComplete = true;
+        }
+    }
+
+    imageSets.forEach(urls => {
+        const tryLoad = index => {
+            const url = urls[index];
+            console.log(`Preloading image: ${url}`);
+            const img = new Image();
+            img.onload = () => {
+                console.log(`Loaded image ${loadedCount + 1}/${imageSets.length}: ${url}`);
+                preloadedImages[url] = img;
+                finished();
+            };
+            img.onerror = (err) => {
+                // この形式に対応していなければ次の形式を試す（エラーがあっても続行）
+                if (index + 1 < urls.length) {
+                    tryLoad(index + 1);
+                    return;
+                }
+                console.error(`Failed to load image: ${url}`, err);
+                finished();
+            };
+            img.src = url;
         };
-        img.src = url;
+        tryLoad(0);
     });
 }
 
@@ -717,13 +855,7 @@ document.addEventListener('DOMContentLoaded', async function () {
         if (speakerA) {
             if (speakerA.name === '四国めたん') {
                 leftCharacter.setAttribute('data-character', 'metan');
-                leftCharacter.innerHTML = `
-                    <div class="character-container">
-                        <img class="standing-character-base" src="/static/assets/standing_metan.png" alt="四国めたん">
-                        <img class="standing-character-eyes" src="/static/assets/metan_eye_open.png" alt="四国めたん目">
-                        <div class="character-mouth" style="background-image: url('/static/assets/metan_mouse_close.png')"></div>
-                    </div>
-                `;
+                leftCharacter.innerHTML = standingMarkup('metan', '四国めたん');
                 // 瞬き処理を設定
                 setTimeout(() => {
                     console.log("Setting up left character blinking");
@@ -731,13 +863,7 @@ document.addEventListener('DOMContentLoaded', async function () {
                 }, 100);
             } else if (speakerA.name === '雨晴はう') {
                 leftCharacter.setAttribute('data-character', 'hau');
-                leftCharacter.innerHTML = `
-                    <div class="character-container">
-                        <img class="standing-character-base" src="/static/assets/hau_standing.png" alt="雨晴はう">
-                        <img class="standing-character-eyes" src="/static/assets/hau_open_eyes.png" alt="雨晴はう目">
-                        <div class="character-mouth" style="background-image: url('/static/assets/hau_mouse_close.png')"></div>
-                    </div>
-                `;
+                leftCharacter.innerHTML = standingMarkup('hau', '雨晴はう');
                 // 瞬き処理を設定
                 setTimeout(() => {
                     console.log("Setting up left character blinking for Hau");
@@ -745,13 +871,7 @@ document.addEventListener('DOMContentLoaded', async function () {
                 }, 100);
             } else if (speakerA.name === '春日部つむぎ') {
                 leftCharacter.setAttribute('data-character', 'tsumugi');
-                leftCharacter.innerHTML = `
-                    <div class="character-container">
-                        <img class="standing-character-base" src="/static/assets/standing_tsumugi.png" alt="春日部つむぎ">
-                        <img class="standing-character-eyes" src="/static/assets/tsumugi_eye_open.png" alt="春日部つむぎ目">
-                        <div class="character-mouth" style="background-image: url('/static/assets/tsumugi_mouse_close.png')"></div>
-                    </div>
-                `;
+                leftCharacter.innerHTML = standingMarkup('tsumugi', '春日部つむぎ');
                 // 瞬き処理を設定
                 setTimeout(() => {
                     console.log("Setting up left character blinking for Tsumugi");
@@ -759,13 +879,7 @@ document.addEventListener('DOMContentLoaded', async function () {
                 }, 100);
             } else if (speakerA.name === 'WhiteCUL') {
                 leftCharacter.setAttribute('data-character', 'whitecul');
-                leftCharacter.innerHTML = `
-                    <div class="character-container">
-                        <img class="standing-character-base" src="/static/assets/whiteCul_standing.png" alt="WhiteCUL">
-                        <img class="standing-character-eyes" src="/static/assets/whiteCul_eye_open.png" alt="WhiteCUL目">
-                        <div class="character-mouth" style="background-image: url('/static/assets/whiteCul_mouse_close.png')"></div>
-                    </div>
-                `;
+                leftCharacter.innerHTML = standingMarkup('whiteCul', 'WhiteCUL');
                 // 瞬き処理を設定
                 setTimeout(() => {
                     console.log("Setting up left character blinking for WhiteCUL");
@@ -781,13 +895,7 @@ document.addEventListener('DOMContentLoaded', async function () {
         if (speakerB) {
             if (speakerB.name === '四国めたん') {
                 rightCharacter.setAttribute('data-character', 'metan');
-                rightCharacter.innerHTML = `
-                    <div class="character-container">
-                        <img class="standing-character-base" src="/static/assets/standing_metan.png" alt="四国めたん">
-                        <img class="standing-character-eyes" src="/static/assets/metan_eye_open.png" alt="四国めたん目">
-                        <div class="character-mouth" style="background-image: url('/static/assets/metan_mouse_close.png')"></div>
-                    </div>
-                `;
+                rightCharacter.innerHTML = standingMarkup('metan', '四国めたん');
                 // 瞬き処理を設定
                 setTimeout(() => {
                     console.log("Setting up right character blinking");
@@ -795,13 +903,7 @@ document.addEventListener('DOMContentLoaded', async function () {
                 }, 100);
             } else if (speakerB.name === '雨晴はう') {
                 rightCharacter.setAttribute('data-character', 'hau');
-                rightCharacter.innerHTML = `
-                    <div class="character-container">
-                        <img class="standing-character-base" src="/static/assets/hau_standing.png" alt="雨晴はう">
-                        <img class="standing-character-eyes" src="/static/assets/hau_open_eyes.png" alt="雨晴はう目">
-                        <div class="character-mouth" style="background-image: url('/static/assets/hau_mouse_close.png')"></div>
-                    </div>
-                `;
+                rightCharacter.innerHTML = standingMarkup('hau', '雨晴はう');
                 // 瞬き処理を設定
                 setTimeout(() => {
                     console.log("Setting up right character blinking for Hau");
@@ -809,13 +911,7 @@ document.addEventListener('DOMContentLoaded', async function () {
                 }, 100);
             } else if (speakerB.name === '春日部つむぎ') {
                 rightCharacter.setAttribute('data-character', 'tsumugi');
-                rightCharacter.innerHTML = `
-                    <div class="character-container">
-                        <img class="standing-character-base" src="/static/assets/standing_tsumugi.png" alt="春日部つむぎ">
-                        <img class="standing-character-eyes" src="/static/assets/tsumugi_eye_open.png" alt="春日部つむぎ目">
-                        <div class="character-mouth" style="background-image: url('/static/assets/tsumugi_mouse_close.png')"></div>
-                    </div>
-                `;
+                rightCharacter.innerHTML = standingMarkup('tsumugi', '春日部つむぎ');
                 // 瞬き処理を設定
                 setTimeout(() => {
                     console.log("Setting up right character blinking for Tsumugi");
@@ -823,13 +919,7 @@ document.addEventListener('DOMContentLoaded', async function () {
                 }, 100);
             } else if (speakerB.name === 'WhiteCUL') {
                 rightCharacter.setAttribute('data-character', 'whitecul');
-                rightCharacter.innerHTML = `
-                    <div class="character-container">
-                        <img class="standing-character-base" src="/static/assets/whiteCul_standing.png" alt="WhiteCUL">
-                        <img class="standing-character-eyes" src="/static/assets/whiteCul_eye_open.png" alt="WhiteCUL目">
-                        <div class="character-mouth" style="background-image: url('/static/assets/whiteCul_mouse_close.png')"></div>
-                    </div>
-                `;
+                rightCharacter.innerHTML = standingMarkup('whiteCul', 'WhiteCUL');
                 // 瞬き処理を設定
                 setTimeout(() => {
                     console.log("Setting up right character blinking for WhiteCUL");
@@ -887,15 +977,14 @@ document.addEventListener('DOMContentLoaded', async function () {
     });
 
     try {
-        const response = await fetch('/get-tts-key');
+        const response = await fetch('/tts-status');
         const data = await response.json();
-        if (data.error) {
-            console.error('Failed to get TTS API key:', data.error);
-        } else {
-            TTS_QUEST_API_KEY = data.key;
+        TTS_AVAILABLE = data.available;
+        if (!TTS_AVAILABLE) {
+            console.error('TTS is not available: VOICEVOX API key not configured');
         }
     } catch (error) {
-        console.error('Error fetching TTS API key:', error);
+        console.error('Error fetching TTS status:', error);
     }
 
     function updateStyles(speakerId, styleSelect) {
@@ -912,8 +1001,12 @@ document.addEventListener('DOMContentLoaded', async function () {
     }
 
     try {
-        const response = await fetch('/get-speakers');
-        speakers = await response.json();
+        const [speakersResponse, stylesResponse] = await Promise.all([
+            fetch('/get-speakers'),
+            fetch('/speaker-styles')
+        ]);
+        speakers = await speakersResponse.json();
+        styleCharacters = await stylesResponse.json();
 
         const populateSpeakerSelect = (select) => {
             speakers.forEach(speaker => {
@@ -977,47 +1070,99 @@ document.addEventListener('DOMContentLoaded', async function () {
         addMessage(message, 'user');
         userInput.value = '';
 
+        // 前のターンの応答待ちと再生をやめる
+        if (currentTurn) {
+            currentTurn.controller.abort();
+            Object.values(currentTurn.players).forEach(player => player.stop());
+        }
+        const turn = {controller: new AbortController(), players: {}};
+        currentTurn = turn;
+
         try {
-            const response = await fetch('/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    message: message,
-                    speaker_a: speakerASelect.value,
-                    speaker_b: speakerBSelect.value
-                })
-            });
+            // 話者ごとのメッセージ要素（最初の差分を受け取った時点で作成）
+            const streamingMessages = {A: null, B: null};
+            let finalData = null;
+
+            // /ws では合成済みの音声だけが届き、話者Bの開始もサーバーが知らせる
+            const socket = await openChatSocket();
+            let resolveCue;
+            const cue = new Promise(resolve => { resolveCue = resolve; });
+
+            // 文ごとの音声は届いた順に再生する（話者Bは話者Aの再生完了後に開始）
+            const players = turn.players;
+            if (TTS_AVAILABLE) {
+                players.A = new ChunkPlayer(styleASelect.value, 'A');
+                players.B = new ChunkPlayer(styleBSelect.value, 'B',
+                    socket ? cue.then(() => players.A.drained) : players.A.drained);
+            }
 
-            const data = await response.json();
-            if (response.ok) {
-                // 話者Aのメッセージを追加して再生
-                const speakerAMessage = addMessage(data.speaker_a, 'ai-message-a');
-                if (speakerAMessage) {
-                    await play(data.speaker_a, styleASelect.value, 'A');
+            const body = {
+                message: message,
+                speaker_a: speakerASelect.value,
+                speaker_b: speakerBSelect.value,
+                style_a: TTS_AVAILABLE ? parseInt(styleASelect.value) : null,
+                style_b: TTS_AVAILABLE ? parseInt(styleBSelect.value) : null,
+                idempotency_key: newRequestKey()
+            };
+            const send = socket ? socket.send.bind(socket) : streamChat;
+            await send(body, (eventName, data) => {
+                if (eventName === 'delta') {
+                    // 話者Bが先に届いた場合も表示順は話者A→話者Bに揃える
+                    if (data.speaker === 'B' && !streamingMessages.A) {
+                        streamingMessages.A = addMessage('', 'ai-message-a', false);
+                    }
+                    if (!streamingMessages[data.speaker]) {
+                        const type = data.speaker === 'A' ? 'ai-message-a' : 'ai-message-b';
+                        streamingMessages[data.speaker] = addMessage('', type, false);
+                    }
+                    appendMessageText(streamingMessages[data.speaker], data.text);
+                } else if (eventName === 'sentence' && !socket) {
+                    if (players[data.speaker]) {
+                        players[data.speaker].enqueue(data.audio_url);
+                    }
+                } else if (eventName === 'audio_ready') {
+                    if (players[data.speaker]) {
+                        players[data.speaker].enqueue(data.audio_url, data.timeline);
+                    }
+                } else if (eventName === (socket ? 'audio_end' : 'speaker_end')) {
+                    if (players[data.speaker]) {
+                        players[data.speaker].finish();
+                    }
+                } else if (eventName === 'cue') {
+                    resolveCue();
+                } else if (eventName === 'done') {
+                    finalData = data;
+                } else if (eventName === 'error') {
+                    if (data.retry_after) {
+                        addMessage(busyMessage(data.retry_after), 'error');
+                    } else {
+                        addMessage('エラーが発生しました: ' + data.error, 'error');
+                    }
                 }
+            }, turn.controller.signal);
 
-                // 話者Bのメッセージを追加して再生（話者Aのテキスト長に基づいて遅延）
-                const speakerBMessage = addMessage(data.speaker_b, 'ai-message-b');
-                if (speakerBMessage) {
-                    // 文字数 × 100ms（以前の180msより短縮）
-                    const delay = data.speaker_a.length * 100;
-                    setTimeout(async () => {
-                        try {
-                            await play(data.speaker_b, styleBSelect.value, 'B');
-                        } catch (error) {
-                            console.error('Error playing speaker B:', error);
-                            addMessage('話者Bの再生エラーが発生しました', 'error');
-                        }
-                    }, delay);
-                }
-            } else {
-                addMessage('エラーが発生しました: ' + data.error, 'error');
+            if (!finalData) {
+                Object.values(players).forEach(player => player.finish());
+                return;
+            }
+
+            // 再生ボタン（聞き直し用）を追加
+            const speakerAMessage = streamingMessages.A || addMessage(finalData.speaker_a, 'ai-message-a', false);
+            attachAudioControl(speakerAMessage, finalData.speaker_a, 'ai-message-a');
+            // 混雑時（degraded）は話者Bの応答が省略される
+            if (finalData.speaker_b) {
+                const speakerBMessage = streamingMessages.B || addMessage(finalData.speaker_b, 'ai-message-b', false);
+                attachAudioControl(speakerBMessage, finalData.speaker_b, 'ai-message-b');
+            } else if (players.B) {
+                players.B.finish();
             }
         } catch (error) {
+            if (error.name === 'AbortError') {
+                console.log('Turn superseded by a newer message');
+                return;
+            }
             console.error('Error in sendMessage:', error);
-            addMessage('通信エラーが発生しました', 'error');
+            addMessage(error.userMessage || '通信エラーが発生しました', 'error');
         }
     }
 
@@ -1038,7 +1183,7 @@ document.addEventListener('DOMContentLoaded', async function () {
             characterElement.cleanup();
         }
 
-        const eyesImage = characterElement.querySelector('.standing-character-eyes');
+        const eyesImage = characterElement.querySelector('[data-part="eyes"]');
         if (!eyesImage) {
             console.log("No eyes image found, returning");
             return;
@@ -1065,12 +1210,12 @@ document.addEventListener('DOMContentLoaded', async function () {
             console.log("Eyes closed at:", startTime.toISOString());
 
             // 目を閉じる
-            eyesImage.src = '/static/assets/metan_eye_close.png';
+            showFrame(eyesImage, 'metan', 'eye_close');
 
             // 目を閉じている時間を自然な長さに調整（200-300ms）
             setTimeout(() => {
                 if (eyesImage && eyesImage.parentNode && characterElement.contains(eyesImage)) {
-                    eyesImage.src = '/static/assets/metan_eye_open.png';
+                    showFrame(eyesImage, 'metan', 'eye_open');
                     const endTime = new Date();
                     console.log("Eyes opened at:", endTime.toISOString());
                     isBlinking = false;
@@ -1112,7 +1257,7 @@ document.addEventListener('DOMContentLoaded', async function () {
             characterElement.cleanup();
         }
 
-        const eyesImage = characterElement.querySelector('.standing-character-eyes');
+        const eyesImage = characterElement.querySelector('[data-part="eyes"]');
         if (!eyesImage) {
             console.log("No eyes image found for Hau, returning");
             return;
@@ -1138,12 +1283,12 @@ document.addEventListener('DOMContentLoaded', async function () {
             console.log("Hau eyes closed at:", new Date().toISOString());
 
             // 目を閉じる
-            eyesImage.src = '/static/assets/hau_close_eyes.png';
+            showFrame(eyesImage, 'hau', 'eye_close');
 
             // 目を閉じている時間を自然な長さに調整（200-300ms）
             setTimeout(() => {
                 if (eyesImage && eyesImage.parentNode && characterElement.contains(eyesImage)) {
-                    eyesImage.src = '/static/assets/hau_open_eyes.png';
+                    showFrame(eyesImage, 'hau', 'eye_open');
                     console.log("Hau eyes opened at:", new Date().toISOString());
                     isBlinking = false;
                 }
@@ -1184,7 +1329,7 @@ document.addEventListener('DOMContentLoaded', async function () {
             characterElement.cleanup();
         }
 
-        const eyesImage = characterElement.querySelector('.standing-character-eyes');
+        const eyesImage = characterElement.querySelector('[data-part="eyes"]');
         if (!eyesImage) {
             console.log("No eyes image found for Tsumugi, returning");
             return;
@@ -1211,12 +1356,12 @@ document.addEventListener('DOMContentLoaded', async function () {
             console.log("Executing blink for Tsumugi at:", new Date().toISOString());
 
             // 目を閉じる
-            eyesImage.src = '/static/assets/tsumugi_eye_close.png';
+            showFrame(eyesImage, 'tsumugi', 'eye_close');
 
             // 目を閉じている時間を自然な長さに調整（200-300ms）
             setTimeout(() => {
                 if (eyesImage && eyesImage.parentNode && characterElement.contains(eyesImage)) {
-                    eyesImage.src = '/static/assets/tsumugi_eye_open.png';
+                    showFrame(eyesImage, 'tsumugi', 'eye_open');
                     console.log("Tsumugi eyes opened at:", new Date().toISOString());
                     isBlinking = false;
                 }
@@ -1269,7 +1414,7 @@ document.addEventListener('DOMContentLoaded', async function () {
             characterElement.cleanup();
         }
 
-        const eyesImage = characterElement.querySelector('.standing-character-eyes');
+        const eyesImage = characterElement.querySelector('[data-part="eyes"]');
         if (!eyesImage) {
             console.log("No eyes image found for WhiteCUL, returning");
             return;
@@ -1296,12 +1441,12 @@ document.addEventListener('DOMContentLoaded', async function () {
             console.log("WhiteCUL eyes closed at:", new Date().toISOString());
 
             // 目を閉じる
-            eyesImage.src = '/static/assets/whiteCul_eye_close.png';
+            showFrame(eyesImage, 'whiteCul', 'eye_close');
 
             // 目を閉じている時間を自然な長さに調整（200-300ms）
             setTimeout(() => {
                 if (eyesImage && eyesImage.parentNode && characterElement.contains(eyesImage)) {
-                    eyesImage.src = '/static/assets/whiteCul_eye_open.png';
+                    showFrame(eyesImage, 'whiteCul', 'eye_open');
                     console.log("WhiteCUL eyes opened at:", new Date().toISOString());
                     isBlinking = false;
                 }
@@ -0,0 +1,134 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from utils import admission
+from utils.admission import ConcurrencyLimiter, TokenBucket, AdmissionRejected
+
+
+def test_acquire_async_waits_for_release_without_threads():
+    limiter = ConcurrencyLimiter('test', 2, max_queue=10, queue_timeout=2)
+
+    async def job():
+        await limiter.acquire_async()
+        try:
+            await asyncio.sleep(0.05)
+        finally:
+            limiter.release()
+
+    async def main():
+        threads = threading.active_count()
+        await asyncio.gather(*[job() for _ in range(6)])
+        return threads
+
+    threads = asyncio.run(main())
+    assert (limiter.active, limiter.waiting) == (0, 0)
+    assert threading.active_count() <= threads
+
+
+def test_acquire_async_is_woken_by_sync_release():
+    limiter = ConcurrencyLimiter('test', 1, max_queue=10, queue_timeout=2)
+    limiter.acquire()
+
+    async def main():
+        threading.Timer(0.05, limiter.release).start()
+        started = time.monotonic()
+        await limiter.acquire_async()
+        return time.monotonic() - started
+
+    assert asyncio.run(main()) < 1
+    assert limiter.active == 1
+
+
+def test_acquire_async_rejects_when_queue_is_full_or_times_out():
+    limiter = ConcurrencyLimiter('test', 1, max_queue=1, queue_timeout=0.1)
+
+    async def main():
+        await limiter.acquire_async()
+        return await asyncio.gather(limiter.acquire_async(), limiter.acquire_async(), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, AdmissionRejected) for result in results)
+    assert (limiter.active, limiter.waiting) == (1, 0)
+
+
+def test_cancelled_acquire_async_leaves_no_waiter():
+    limiter = ConcurrencyLimiter('test', 1, max_queue=5, queue_timeout=5)
+    limiter.acquire()
+
+    async def main():
+        task = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert (limiter.active, limiter.waiting, limiter._async_waiters) == (1, 0, [])
+
+
+def test_acquire_waits_for_release_and_times_out():
+    limiter = ConcurrencyLimiter('test', 1, max_queue=1, queue_timeout=1)
+    limiter.acquire()
+    threading.Timer(0.05, limiter.release).start()
+    limiter.acquire()
+    assert (limiter.active, limiter.waiting) == (1, 0)
+
+    limiter.queue_timeout = 0.05
+    with pytest.raises(AdmissionRejected):
+        limiter.acquire()
+    assert (limiter.active, limiter.waiting) == (1, 0)
+
+
+def test_acquire_rejects_when_queue_is_full():
+    limiter = ConcurrencyLimiter('test', 1, max_queue=0, queue_timeout=1)
+    limiter.acquire()
+    assert limiter.saturated()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        limiter.acquire()
+    assert excinfo.value.retry_after == 1
+    assert not limiter.try_acquire()
+
+
+def test_zero_limit_is_unlimited():
+    limiter = ConcurrencyLimiter('test', 0)
+    for _ in range(100):
+        limiter.acquire()
+    assert limiter.load() == 0.0
+    assert not limiter.saturated()
+
+
+def test_token_bucket_allows_burst_then_spaces_requests():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve(0) == 0.0
+    assert bucket.reserve(0) == 0.0
+    # バーストを使い切ったら次のトークンまで約 0.1 秒
+    assert bucket.reserve(0) is None
+    wait = bucket.reserve(1)
+    assert 0.05 < wait <= 0.1
+    assert bucket.retry_after() > wait
+
+
+def test_llm_slot_rejects_over_rate_limit(monkeypatch):
+    monkeypatch.setattr(admission, 'rate_limits', {'openai': TokenBucket(rate=1, burst=1)})
+    monkeypatch.setattr(admission, 'LLM_QUEUE_TIMEOUT', 0.1)
+    with admission.llm_slot('openai'):
+        pass
+    with pytest.raises(AdmissionRejected):
+        with admission.llm_slot('openai'):
+            pass
+    assert admission.limiters['openai'].active == 0
+
+
+def test_should_degrade_follows_global_load(monkeypatch):
+    limiter = ConcurrencyLimiter('global', 10)
+    monkeypatch.setattr(admission, 'limiters', {'global': limiter})
+    monkeypatch.setattr(admission, 'LLM_MAX_CONCURRENCY', 10)
+    monkeypatch.setattr(admission, 'LLM_DEGRADE_AT', 0.8)
+    for _ in range(7):
+        limiter.acquire()
+    assert not admission.should_degrade('test')
+    limiter.acquire()
+    assert admission.should_degrade('test')
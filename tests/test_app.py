@@ -0,0 +1,189 @@
+import json
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip('flask')
+
+import app as app_module
+from utils.conversation_store import MemoryConversationStore
+
+SPEAKER_A = '388f246b-8c41-4ac1-8e2d-5d79f3ff56d9'
+SPEAKER_B = '7ffcb7ce-00ec-4bdc-82cd-45a8889e43ff'
+
+
+# 話者ごとのストリームの差分
+STREAMS = {
+    SPEAKER_A: ['こんにちは。', '今日は', '晴れだね。'],
+    SPEAKER_B: ['そう', 'だね。'],
+}
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemoryConversationStore()
+    monkeypatch.setattr(app_module, 'conversation_store', store)
+    monkeypatch.setattr(app_module.summarizer, 'schedule', lambda store, session_id: None)
+    monkeypatch.setattr(app_module, 'should_degrade', lambda route: False)
+    return store
+
+
+@pytest.fixture
+def stub_streams(monkeypatch):
+    """LLM の代わりに STREAMS の差分を返す（呼び出しの引数を記録する）"""
+    calls = []
+
+    def stream_chat_response(user_message, history, speaker, **kwargs):
+        calls.append({'speaker': speaker, 'history': list(history), **kwargs})
+        yield from STREAMS[speaker]
+
+    monkeypatch.setattr(app_module, 'stream_chat_response', stream_chat_response)
+    return calls
+
+
+def sse_events(response):
+    """SSE の本文を (イベント名, データ) のリストにする"""
+    events = []
+    for block in response.get_data(as_text=True).split('\n\n'):
+        if not block:
+            continue
+        event, data = block.split('\n')
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def stream_turn(client, **data):
+    response = client.post('/chat/stream', json={'message': 'こんにちは', **data})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    return sse_events(response)
+
+
+def test_stream_sends_speaker_a_then_b(client, store, stub_streams, monkeypatch):
+    monkeypatch.setattr(app_module, 'choose_response_pattern', lambda: 'A')
+    events = stream_turn(client, speaker_a=SPEAKER_A, speaker_b=SPEAKER_B)
+
+    assert events[0][0] == 'turn'
+    assert events[1:] == [
+        *[('delta', {'speaker': 'A', 'text': text}) for text in STREAMS[SPEAKER_A]],
+        ('speaker_end', {'speaker': 'A', 'sentences': 0}),
+        *[('delta', {'speaker': 'B', 'text': text}) for text in STREAMS[SPEAKER_B]],
+        ('speaker_end', {'speaker': 'B', 'sentences': 0}),
+        ('done', {'speaker_a': 'こんにちは。今日は晴れだね。', 'speaker_b': 'そうだね。'}),
+    ]
+    # 話者Bは話者Aの回答を含む履歴で生成する
+    assert stub_streams[1]['history'][-1] == {'role': 'assistant', 'content': 'こんにちは。今日は晴れだね。'}
+
+
+def test_stream_saves_the_turn_to_the_conversation(client, store, stub_streams, monkeypatch):
+    monkeypatch.setattr(app_module, 'choose_response_pattern', lambda: 'A')
+    stream_turn(client, speaker_a=SPEAKER_A, speaker_b=SPEAKER_B)
+    with client.session_transaction() as session:
+        conversation_id = session['conversation_id']
+
+    assert [m['content'] for m in store.get_history(conversation_id)] == ['こんにちは', 'こんにちは。今日は晴れだね。', 'そうだね。']
+    stream_turn(client, speaker_a=SPEAKER_A, speaker_b=SPEAKER_B)
+    assert len(stub_streams[2]['history']) == 3
+
+
+def test_independent_pattern_streams_both_speakers(client, store, stub_streams, monkeypatch):
+    monkeypatch.setattr(app_module, 'choose_response_pattern', lambda: 'C')
+    events = stream_turn(client, speaker_a=SPEAKER_A, speaker_b=SPEAKER_B)
+
+    for speaker, speaker_id in (('A', SPEAKER_A), ('B', SPEAKER_B)):
+        texts = [data['text'] for event, data in events if event == 'delta' and data['speaker'] == speaker]
+        assert texts == STREAMS[speaker_id]
+        assert ('speaker_end', {'speaker': speaker, 'sentences': 0}) in events
+    assert events[-1] == ('done', {'speaker_a': 'こんにちは。今日は晴れだね。', 'speaker_b': 'そうだね。'})
+
+
+def test_single_speaker_stream(client, store, stub_streams):
+    events = stream_turn(client, speaker_id=SPEAKER_A)
+    assert [event for event, _ in events] == ['turn', 'delta', 'delta', 'delta', 'speaker_end', 'done']
+    assert events[-1] == ('done', {'content': 'こんにちは。今日は晴れだね。'})
+
+
+def test_stream_reports_provider_errors(client, store, monkeypatch):
+    def broken(*args, **kwargs):
+        yield 'こん'
+        raise Exception('provider down')
+
+    monkeypatch.setattr(app_module, 'stream_chat_response', broken)
+    events = stream_turn(client, speaker_id=SPEAKER_A)
+    assert events[-1] == ('error', {'error': 'provider down'})
+
+
+def test_stream_synthesizes_each_sentence_as_it_completes(client, store, stub_streams, monkeypatch):
+    submitted = []
+
+    def submit_tts_chunk(text, style_id):
+        submitted.append((text, style_id))
+        return Future()
+
+    monkeypatch.setattr(app_module, 'submit_tts_chunk', submit_tts_chunk)
+    monkeypatch.setattr(app_module, 'choose_response_pattern', lambda: 'A')
+    events = stream_turn(client, speaker_a=SPEAKER_A, speaker_b=SPEAKER_B, style_a=3, style_b=8)
+
+    assert submitted == [('こんにちは。', 3), ('今日は晴れだね。', 3), ('そうだね。', 8)]
+    sentences = [data for event, data in events if event == 'sentence']
+    assert [(s['speaker'], s['index'], s['text']) for s in sentences] == [
+        ('A', 0, 'こんにちは。'), ('A', 1, '今日は晴れだね。'), ('B', 0, 'そうだね。')
+    ]
+    # 最初の文は話者Aの応答が終わる前に送る
+    names = [event for event, _ in events]
+    assert names.index('sentence') < names.index('speaker_end')
+    assert ('speaker_end', {'speaker': 'A', 'sentences': 2}) in events
+
+    # クライアントは文ごとの音声を /tts のURLで取りに来る
+    with app_module.app.test_request_context():
+        assert sentences[0]['audio_url'] == app_module.url_for('tts', text='こんにちは。', speaker=3)
+
+
+def test_stream_without_style_ids_sends_no_sentences(client, store, stub_streams, monkeypatch):
+    monkeypatch.setattr(app_module, 'submit_tts_chunk', lambda text, style_id: pytest.fail('synthesized'))
+    events = stream_turn(client, speaker_id=SPEAKER_A)
+    assert 'sentence' not in [event for event, _ in events]
+
+
+def test_stream_validates_the_request(client):
+    response = client.post('/chat/stream', json={'speaker_id': SPEAKER_A})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'No message provided'}
+
+
+class RejectingExecutor:
+    def submit(self, *args, **kwargs):
+        raise AssertionError('speaker_executor should not be used')
+
+
+def test_merged_streams_do_not_use_speaker_pool(monkeypatch):
+    monkeypatch.setattr(app_module, 'speaker_executor', RejectingExecutor())
+    events = list(app_module._merge_streams({'A': lambda: iter(['こん', 'にちは']), 'B': lambda: iter(['やあ'])}))
+    assert [delta for speaker, delta in events if speaker == 'A'] == ['こん', 'にちは', None]
+    assert [delta for speaker, delta in events if speaker == 'B'] == ['やあ', None]
+
+
+def test_speaker_b_is_cancelled_when_speaker_a_fails(client, monkeypatch):
+    pending = Future()
+
+    class PendingExecutor:
+        def submit(self, *args, **kwargs):
+            return pending
+
+    def failing_chat_response(*args, **kwargs):
+        raise Exception('speaker A down')
+
+    monkeypatch.setattr(app_module, 'speaker_executor', PendingExecutor())
+    monkeypatch.setattr(app_module, 'choose_response_pattern', lambda: 'C')
+    monkeypatch.setattr(app_module, 'JOINT_EXCHANGE', False)
+    monkeypatch.setattr(app_module, 'should_degrade', lambda route: False)
+    monkeypatch.setattr(app_module, 'get_chat_response', failing_chat_response)
+
+    response = client.post('/chat', json={'message': 'こんにちは', 'speaker_a': SPEAKER_A, 'speaker_b': SPEAKER_B})
+    assert response.status_code == 500
+    assert pending.cancelled()
@@ -0,0 +1,99 @@
+import json
+import asyncio
+
+import pytest
+
+pytest.importorskip('asgiref')
+
+import asgi
+
+
+def http_scope(method, path, headers=(), query_string=b''):
+    return {
+        'type': 'http', 'method': method, 'path': path, 'root_path': '', 'query_string': query_string,
+        'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+        'headers': list(headers),
+    }
+
+
+def call(application, scope, body=b''):
+    """ASGI アプリを呼び、送られたメッセージを返す"""
+    messages = []
+    chunks = [body[:1], body[1:]] if body else [b'']
+
+    async def receive():
+        chunk = chunks.pop(0)
+        return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    return messages
+
+
+def response_of(messages):
+    start, *bodies = messages
+    assert start['type'] == 'http.response.start'
+    assert all(message['type'] == 'http.response.body' for message in bodies)
+    assert not bodies[-1].get('more_body')
+    return start['status'], dict(start['headers']), b''.join(message.get('body', b'') for message in bodies)
+
+
+def test_flask_routes_are_served():
+    status, headers, body = response_of(call(asgi.flask_application, http_scope('GET', '/tts-status')))
+    assert status == 200
+    assert headers[b'content-type'] == b'application/json'
+    assert 'available' in json.loads(body)
+
+
+def test_flask_routes_receive_the_request_body():
+    body = json.dumps({'message': 'こんにちは'}).encode()
+    scope = http_scope('POST', '/chat/stream', headers=[
+        (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())
+    ])
+    status, _, response = response_of(call(asgi.flask_application, scope, body))
+    assert status == 400
+    assert json.loads(response)['error'] == 'Either speaker_id or both speaker_a and speaker_b must be specified'
+
+
+def test_wsgi_request_streams_chunks_and_closes_the_response():
+    seen = {}
+
+    class Chunks:
+        closed = False
+
+        def __iter__(self):
+            return iter([b'event: a\n\n', b'', b'event: b\n\n'])
+
+        def close(self):
+            self.closed = True
+
+    chunks = Chunks()
+
+    def wsgi_app(environ, start_response):
+        seen.update(environ)
+        start_response('200 OK', [('Content-Type', 'text/event-stream')])
+        return chunks
+
+    async def application(scope, receive, send):
+        request = asgi.WsgiRequest(wsgi_app, scope, send)
+        await asgi.sync_to_async(request.run, thread_sensitive=False)(asgi.io.BytesIO(b''))
+
+    scope = http_scope('GET', '/stream', headers=[(b'x-test', b'1'), (b'x-test', b'2')], query_string=b'a=1')
+    messages = call(application, scope)
+    assert [message.get('body') for message in messages[1:]] == [b'event: a\n\n', b'event: b\n\n', None]
+    assert messages[1]['more_body']
+    assert chunks.closed
+    assert seen['PATH_INFO'] == '/stream'
+    assert seen['QUERY_STRING'] == 'a=1'
+    assert seen['HTTP_X_TEST'] == '1,2'
+    assert seen['REMOTE_ADDR'] == '127.0.0.1'
+
+
+@pytest.mark.parametrize('body', [b'[]', b'"hi"', b'{'])
+def test_chat_rejects_bodies_that_are_not_json_objects(body):
+    scope = http_scope('POST', '/chat', headers=[(b'content-type', b'application/json')])
+    status, _, response = response_of(call(asgi.application, scope, body))
+    assert status == 400
+    assert 'error' in json.loads(response)
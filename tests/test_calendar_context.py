@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from utils.calendar_context import CalendarContext
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_renders_date_time_and_season():
+    context = CalendarContext(FakeClock(datetime(2025, 6, 10, 8, 5)))
+    info = context.now()
+    assert info['date'] == '2025年6月10日（火）'
+    assert info['time'] == '08時05分'
+    assert info['time_of_day'] == '朝'
+    assert (info['season'], info['season_detail']) == ('夏', '梅雨')
+    assert not info['is_holiday'] and info['holiday_name'] is None
+    assert info['raw']['weekday'] == '火'
+
+
+def test_reports_holidays():
+    info = CalendarContext(FakeClock(datetime(2025, 1, 1, 23, 0))).now()
+    assert info['is_holiday']
+    assert info['holiday_name'] == '元日'
+    assert info['time_of_day'] == '夜'
+    assert (info['season'], info['season_detail']) == ('冬', '晩冬')
+
+
+def test_same_minute_reuses_rendered_result():
+    clock = FakeClock(datetime(2025, 3, 21, 12, 0, 1))
+    context = CalendarContext(clock)
+    first = context.now()
+    clock.now = datetime(2025, 3, 21, 12, 0, 59)
+    assert context.now() is first
+    clock.now = datetime(2025, 3, 21, 12, 1, 0)
+    assert context.now()['time'] == '12時01分'
+
+
+def test_rebuilds_table_when_year_changes():
+    clock = FakeClock(datetime(2024, 12, 31, 23, 59))
+    context = CalendarContext(clock)
+    assert context.now()['season_detail'] == '冬本番'
+    clock.now = datetime(2025, 1, 13, 0, 0)
+    info = context.now()
+    # 2025年1月13日は成人の日
+    assert info['holiday_name'] == '成人の日'
+    assert context._year == 2025
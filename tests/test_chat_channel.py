@@ -0,0 +1,120 @@
+import json
+from concurrent.futures import Future
+
+import pytest
+
+from utils.chat_channel import ChatChannel, TurnAudio
+
+METAN = '7ffcb7ce-00ec-4bdc-82cd-45a8889e43ff'
+ZUNDAMON = '388f246b-8c41-4ac1-8e2d-5d79f3ff56d9'
+
+
+def done_future(duration):
+    future = Future()
+    future.set_result({'duration': duration, 'timeline': None})
+    return future
+
+
+def recorder():
+    sent = []
+    return sent, lambda message_type, payload: sent.append((message_type, payload))
+
+
+def test_audio_ready_is_sent_in_sentence_order():
+    sent, send = recorder()
+    audio = TurnAudio(send)
+    first, second = Future(), Future()
+    audio.add('A', 0, '/tts?0', first)
+    audio.add('A', 1, '/tts?1', second)
+
+    second.set_result({'duration': 2.0, 'timeline': None})
+    assert sent == []
+    first.set_result({'duration': 1.5, 'timeline': {'fps': 30, 'frames': 'ab'}})
+    assert [(t, p['index']) for t, p in sent] == [('audio_ready', 0), ('audio_ready', 1)]
+    assert sent[0][1]['timeline'] == {'fps': 30, 'frames': 'ab'}
+
+    audio.end('A', 2)
+    assert sent[2:] == [
+        ('audio_end', {'speaker': 'A', 'sentences': 2, 'duration': 3.5}),
+        ('cue', {'speaker': 'B', 'after': 'A', 'after_seconds': 3.5}),
+    ]
+
+
+def test_audio_end_waits_for_the_last_sentence():
+    sent, send = recorder()
+    audio = TurnAudio(send)
+    pending = Future()
+    audio.add('B', 0, '/tts?0', pending)
+    audio.end('B', 1)
+    assert sent == []
+
+    pending.set_exception(Exception('synthesis failed'))
+    # 合成に失敗した文も再生時間なしで知らせる（クライアントが /tts を取りに行く）
+    assert sent == [
+        ('audio_ready', {'speaker': 'B', 'index': 0, 'audio_url': '/tts?0', 'duration': None, 'timeline': None}),
+        ('audio_end', {'speaker': 'B', 'sentences': 1, 'duration': 0.0}),
+    ]
+
+
+def test_speaker_without_sentences_cues_immediately():
+    sent, send = recorder()
+    audio = TurnAudio(send)
+    audio.add('A', 0, '/tts?long', None)
+    audio.end('A', 1)
+    assert [t for t, _ in sent] == ['audio_ready', 'audio_end', 'cue']
+
+
+def test_channel_stops_sending_after_a_failure():
+    class Socket:
+        def __init__(self):
+            self.messages = []
+
+        def send(self, message):
+            if len(self.messages) == 1:
+                raise ConnectionError('closed')
+            self.messages.append(json.loads(message))
+
+    ws = Socket()
+    channel = ChatChannel(ws)
+    channel.send('delta', {'text': 'こんにちは'})
+    channel.send('delta', {'text': '落ちる'})
+    channel.send('delta', {'text': '送らない'})
+    assert ws.messages == [{'type': 'delta', 'text': 'こんにちは'}]
+    assert channel.closed
+
+
+def test_socket_turn_sends_events_audio_and_cue(monkeypatch):
+    pytest.importorskip('flask')
+    import app as app_module
+    from utils.conversation_store import MemoryConversationStore
+
+    streams = {ZUNDAMON: ['こんにちは。', '元気？'], METAN: ['元気よ。']}
+    monkeypatch.setattr(app_module, 'stream_chat_response', lambda message, history, speaker, **kwargs: iter(streams[speaker]))
+    monkeypatch.setattr(app_module, 'submit_tts_chunk', lambda text, style_id: done_future(len(text) * 0.1))
+    monkeypatch.setattr(app_module, 'conversation_store', MemoryConversationStore())
+    monkeypatch.setattr(app_module.summarizer, 'schedule', lambda store, session_id: None)
+    monkeypatch.setattr(app_module, 'should_degrade', lambda route: False)
+    monkeypatch.setattr(app_module, 'choose_response_pattern', lambda: 'A')
+
+    class Channel:
+        def __init__(self):
+            self.sent = []
+
+        def send(self, message_type, payload):
+            self.sent.append((message_type, payload))
+
+    channel = Channel()
+    data = {'type': 'chat', 'message': 'やあ', 'speaker_a': ZUNDAMON, 'speaker_b': METAN,
+            'style_a': 3, 'style_b': 2, 'idempotency_key': 'k1'}
+    with app_module.app.test_request_context():
+        app_module.run_socket_turn(channel, data, 'conversation')
+
+    assert all(payload['request'] == 'k1' for _, payload in channel.sent)
+    types = [message_type for message_type, _ in channel.sent]
+    assert types[0] == 'turn' and types[-1] == 'done'
+    # 話者Aの音声が揃ってから話者Bの開始を知らせる
+    assert types.index('cue') > types.index('audio_end')
+    cue = dict(channel.sent)['cue']
+    assert cue['after_seconds'] == pytest.approx(0.9)
+    ready = [(p['speaker'], p['index'], p['duration']) for t, p in channel.sent if t == 'audio_ready']
+    assert ready == [('A', 0, pytest.approx(0.6)), ('A', 1, pytest.approx(0.3)), ('B', 0, pytest.approx(0.4))]
@@ -0,0 +1,86 @@
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from flask import Flask
+
+from utils.conversation_store import MemoryConversationStore, SQLConversationStore, db
+
+
+@pytest.fixture(params=['memory', 'sql'])
+def make_store(request, tmp_path):
+    def make(**options):
+        if request.param == 'memory':
+            return MemoryConversationStore(**options)
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'conversations.db'}"
+        db.init_app(app)
+        return SQLConversationStore(app, **options)
+    return make
+
+
+def messages(*contents):
+    return [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': content} for i, content in enumerate(contents)]
+
+
+def test_history_round_trip(make_store):
+    store = make_store()
+    store.append_messages('s1', messages('映画が好き', 'どんな映画？'))
+    store.append_messages('s1', messages('アニメ映画'))
+
+    history = store.get_history('s1')
+    assert [(m['role'], m['content']) for m in history] == [
+        ('user', '映画が好き'), ('assistant', 'どんな映画？'), ('user', 'アニメ映画')
+    ]
+    # 話題キーワードは保存時に抽出され、番号は追加順に増える
+    assert '映画' in history[0]['keywords']
+    seqs = [m['seq'] for m in history]
+    assert seqs == sorted(seqs) and len(set(seqs)) == 3
+
+
+def test_sessions_are_isolated_and_clearable(make_store):
+    store = make_store()
+    store.append_messages('s1', messages('こんにちは'))
+    store.append_messages('s2', messages('こんばんは'))
+    assert store.get_history('unknown') == []
+
+    store.clear('s1')
+    assert store.get_history('s1') == []
+    assert [m['content'] for m in store.get_history('s2')] == ['こんばんは']
+
+
+def test_keeps_only_the_newest_messages(make_store):
+    store = make_store(max_messages=3)
+    for content in ['1', '2', '3', '4', '5']:
+        store.append_messages('s1', messages(content))
+    assert [m['content'] for m in store.get_history('s1')] == ['3', '4', '5']
+
+
+def test_expired_history_is_dropped(make_store):
+    # TTL が負なら保存した直後から期限切れ
+    store = make_store(ttl_seconds=-1)
+    store.append_messages('s1', messages('こんにちは'))
+    assert store.get_history('s1') == []
+
+
+def test_summary_is_not_replaced_by_an_older_one(make_store):
+    store = make_store()
+    store.append_messages('s1', messages('こんにちは'))
+    assert store.get_summary('s1') is None
+
+    store.set_summary('s1', '挨拶した', 4)
+    store.set_summary('s1', '古い要約', 2)
+    assert store.get_summary('s1') == {'text': '挨拶した', 'through': 4}
+    store.set_summary('s1', '新しい要約', 6)
+    assert store.get_summary('s1') == {'text': '新しい要約', 'through': 6}
+
+
+def test_memory_store_drops_least_recently_used_sessions():
+    store = MemoryConversationStore(max_sessions=2)
+    store.append_messages('s1', messages('1'))
+    store.append_messages('s2', messages('2'))
+    store.get_history('s1')
+    store.append_messages('s3', messages('3'))
+
+    assert store.get_history('s2') == []
+    assert [m['content'] for m in store.get_history('s1')] == ['1']
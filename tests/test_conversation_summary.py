@@ -0,0 +1,97 @@
+import threading
+
+from utils import conversation_summary
+from utils.conversation_summary import ConversationSummarizer
+from utils.conversation_store import MemoryConversationStore
+from utils.history_window import MESSAGE_OVERHEAD_TOKENS
+
+
+class Limiter:
+    def __init__(self, load):
+        self._load = load
+
+    def load(self):
+        return self._load
+
+
+def conversation(count, length=20):
+    store = MemoryConversationStore()
+    store.append_messages('s1', [
+        {'role': 'user' if i % 2 == 0 else 'assistant', 'content': 'あ' * length} for i in range(count)
+    ])
+    return store
+
+
+def stub_summaries(monkeypatch):
+    calls = []
+
+    def summarize_conversation(previous_summary, messages):
+        calls.append((previous_summary, [m['seq'] for m in messages]))
+        return f"要約{len(calls)}"
+
+    monkeypatch.setattr(conversation_summary, 'summarize_conversation', summarize_conversation)
+    monkeypatch.setitem(conversation_summary.limiters, 'global', Limiter(0.0))
+    return calls
+
+
+def test_short_history_is_not_summarized(monkeypatch):
+    calls = stub_summaries(monkeypatch)
+    store = conversation(2)
+    assert not ConversationSummarizer(budget=1000).summarize(store, 's1')
+    assert calls == []
+    assert store.get_summary('s1') is None
+
+
+def test_long_history_folds_older_messages(monkeypatch):
+    calls = stub_summaries(monkeypatch)
+    cost = 20 + MESSAGE_OVERHEAD_TOKENS
+    store = conversation(10)
+    summarizer = ConversationSummarizer(budget=cost * 8)
+
+    assert summarizer.summarize(store, 's1')
+    previous, folded = calls[0]
+    assert previous is None
+    # 新しい側の予算の半分（4件）だけを残して畳み込む
+    assert folded == [1, 2, 3, 4, 5, 6]
+    assert store.get_summary('s1') == {'text': '要約1', 'through': 6}
+
+    # 畳み込んだ分は数えないので、次のターンでは要約し直さない
+    assert not summarizer.summarize(store, 's1')
+    store.append_messages('s1', [{'role': 'user', 'content': 'あ' * 20}, {'role': 'assistant', 'content': 'あ' * 20}])
+    assert not summarizer.summarize(store, 's1')
+    store.append_messages('s1', [{'role': 'user', 'content': 'あ' * 20}, {'role': 'assistant', 'content': 'あ' * 20}])
+    assert summarizer.summarize(store, 's1')
+    assert calls[1] == ('要約1', [7, 8, 9, 10])
+
+
+def test_summary_is_skipped_under_load(monkeypatch):
+    calls = stub_summaries(monkeypatch)
+    monkeypatch.setitem(conversation_summary.limiters, 'global', Limiter(1.0))
+    assert not ConversationSummarizer(budget=10).summarize(conversation(10), 's1')
+    assert calls == []
+
+
+def test_schedule_runs_one_summary_per_conversation_at_a_time(monkeypatch):
+    monkeypatch.setattr(conversation_summary, 'HISTORY_SUMMARY', True)
+    summarizer = ConversationSummarizer(budget=10)
+    started = threading.Event()
+    release = threading.Event()
+    finished = threading.Event()
+    calls = []
+
+    def summarize(store, session_id):
+        calls.append(session_id)
+        started.set()
+        release.wait(5)
+        finished.set()
+
+    monkeypatch.setattr(summarizer, 'summarize', summarize)
+    summarizer.schedule(None, 's1')
+    assert started.wait(5)
+    summarizer.schedule(None, 's1')
+    release.set()
+    assert finished.wait(5)
+    summarizer._executor.shutdown()
+
+    assert calls == ['s1']
+    assert not summarizer._running
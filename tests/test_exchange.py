@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+from utils import openai_helper, resilience
+from utils.openai_helper import ExchangeFormatError, parse_exchange, get_exchange_response
+from utils.metrics import EXCHANGE_FALLBACKS
+from utils.resilience import CircuitBreaker
+
+METAN = '7ffcb7ce-00ec-4bdc-82cd-45a8889e43ff'
+HAU = '3474ee95-c274-47f9-aa1a-8322163d96f1'
+
+
+@pytest.fixture
+def openai_reply(monkeypatch):
+    """OpenAI の応答テキストを差し替え、送った要求を記録する"""
+    monkeypatch.setattr(openai_helper, 'OPENAI_API_KEY', 'test')
+    monkeypatch.setattr(openai_helper, 'LLM_FALLBACK_TO_CLAUDE', False)
+    monkeypatch.setattr(resilience, 'breakers', {
+        name: CircuitBreaker(name, failure_threshold=5, reset_timeout=1) for name in ('anthropic', 'openai')
+    })
+    requests = []
+
+    def reply(text):
+        def openai_chat(messages, max_tokens, speaker_id=None, response_format=None):
+            requests.append({'messages': messages, 'response_format': response_format})
+            return text, {}
+        monkeypatch.setattr(openai_helper, '_openai_chat', openai_chat)
+        return requests
+    return reply
+
+
+def test_parse_exchange_accepts_surrounding_text_and_strips_names():
+    text = '了解です。\n{"speaker_a": "四国めたん：別にいいけど", "speaker_b": "ボクもそう思うよ"}'
+    assert parse_exchange(text, METAN, HAU) == ('別にいいけど', 'ボクもそう思うよ')
+
+
+@pytest.mark.parametrize('text', [
+    'JSONなし',
+    '{"speaker_a": "途中',
+    '{"speaker_a": "こんにちは"}',
+    '{"speaker_a": "同じ", "speaker_b": "同じ"}',
+    '{"speaker_a": "  ", "speaker_b": "こんにちは"}',
+    '{"speaker_a": 1, "speaker_b": "こんにちは"}',
+])
+def test_parse_exchange_rejects_invalid_responses(text):
+    with pytest.raises(ExchangeFormatError):
+        parse_exchange(text, METAN, HAU)
+
+
+def test_exchange_uses_one_json_mode_call(openai_reply):
+    requests = openai_reply(json.dumps({'speaker_a': 'ワタシは元気よ', 'speaker_b': 'ボクも元気だよ'}, ensure_ascii=False))
+    response_a, response_b = get_exchange_response('元気？', [], METAN, HAU, '話者Aに同調してください')
+
+    assert (response_a['content'], response_b['content']) == ('ワタシは元気よ', 'ボクも元気だよ')
+    assert len(requests) == 1
+    assert requests[0]['response_format'] == {'type': 'json_object'}
+    system = requests[0]['messages'][0]['content']
+    assert system.startswith(openai_helper.build_exchange_prefix(METAN, HAU))
+    assert '話者Aに同調してください' in system
+    assert requests[0]['messages'][-1] == {'role': 'user', 'content': '元気？'}
+
+
+def test_invalid_exchange_falls_back_to_separate_calls(openai_reply):
+    openai_reply('ごめんなさい、JSONは書けません')
+    before = EXCHANGE_FALLBACKS.value(reason='format')
+    assert get_exchange_response('元気？', [], METAN, HAU, '') is None
+    assert EXCHANGE_FALLBACKS.value(reason='format') == before + 1
+
+
+def test_exchange_needs_known_characters(openai_reply):
+    requests = openai_reply('{}')
+    assert get_exchange_response('元気？', [], METAN, 'unknown', '') is None
+    assert requests == []
+
+
+def test_chat_uses_the_exchange_and_falls_back(monkeypatch):
+    pytest.importorskip('flask')
+    import app as app_module
+    from utils.conversation_store import MemoryConversationStore
+
+    monkeypatch.setattr(app_module, 'conversation_store', MemoryConversationStore())
+    monkeypatch.setattr(app_module.summarizer, 'schedule', lambda store, session_id: None)
+    monkeypatch.setattr(app_module, 'should_degrade', lambda route: False)
+    monkeypatch.setattr(app_module, 'JOINT_EXCHANGE', True)
+    monkeypatch.setattr(app_module, 'choose_response_pattern', lambda: 'A')
+    separate_calls = []
+
+    def get_chat_response(message, history, speaker_id, **kwargs):
+        separate_calls.append(speaker_id)
+        return {'content': f'{speaker_id}の応答'}
+
+    monkeypatch.setattr(app_module, 'get_chat_response', get_chat_response)
+    client = app_module.app.test_client()
+    request = {'message': '元気？', 'speaker_a': METAN, 'speaker_b': HAU}
+
+    monkeypatch.setattr(app_module, 'get_exchange_response', lambda *args, **kwargs: ({'content': 'A'}, {'content': 'B'}))
+    assert client.post('/chat', json=request).get_json() == {'speaker_a': 'A', 'speaker_b': 'B'}
+    assert separate_calls == []
+
+    monkeypatch.setattr(app_module, 'get_exchange_response', lambda *args, **kwargs: None)
+    assert client.post('/chat', json=request).get_json() == {'speaker_a': f'{METAN}の応答', 'speaker_b': f'{HAU}の応答'}
+    assert separate_calls == [METAN, HAU]
@@ -0,0 +1,51 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from utils import executors
+from utils.executors import LazyThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_pool_is_created_on_first_submit():
+    executor = LazyThreadPoolExecutor(2, "test")
+    assert not executor.started
+    assert executor.submit(lambda x: x * 2, 21).result() == 42
+    assert list(executor.map(abs, [-1, -2])) == [1, 2]
+    assert executor.started
+    executor.shutdown()
+
+
+def test_pool_is_recreated_after_fork(monkeypatch):
+    executor = LazyThreadPoolExecutor(1, "test")
+    executor.submit(int).result()
+    parent_pool = executor._executor
+
+    monkeypatch.setattr(executors.os, 'getpid', lambda: -1)
+    assert not executor.started
+    executor.submit(int).result()
+    assert executor._executor is not parent_pool
+    parent_pool.shutdown()
+    executor.shutdown()
+
+
+def test_importing_the_app_starts_no_pools_and_skips_httpx():
+    pytest.importorskip('flask')
+    probe = (
+        "import sys, threading, app\n"
+        "from utils.warmup import warm_up\n"
+        "warm_up()\n"
+        "print(sorted(t.name for t in threading.enumerate()))\n"
+        "print('httpx' in sys.modules)\n"
+    )
+    # 温めで読み込む Anthropic SDK は httpx を使うので、キーなしで確かめる
+    env = {key: value for key, value in os.environ.items() if key != 'ANTHROPIC_API_KEY'}
+    result = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    threads, has_httpx = result.stdout.strip().splitlines()[-2:]
+    for prefix in ('speaker', 'stream', 'hedge', 'room', 'tts', 'summary', 'flask'):
+        assert f"'{prefix}_" not in threads
+    assert has_httpx == 'False'
@@ -0,0 +1,44 @@
+from utils.history_window import (
+    MESSAGE_OVERHEAD_TOKENS, estimate_tokens, history_tokens, select_recent_history, unsummarized
+)
+
+
+def message(seq, role, content):
+    return {'seq': seq, 'role': role, 'content': content}
+
+
+def test_estimate_tokens_counts_japanese_per_character_and_ascii_per_four():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('こんにちは') == 5
+    assert estimate_tokens('hello world!') == 3
+    assert estimate_tokens('abcde') == 2
+    assert estimate_tokens('映画abcd') == 3
+
+
+def test_select_keeps_newest_messages_within_budget():
+    history = [message(i + 1, 'user' if i % 2 == 0 else 'assistant', 'あ' * 10) for i in range(10)]
+    cost = 10 + MESSAGE_OVERHEAD_TOKENS
+    selected = select_recent_history(history, budget=cost * 4)
+    assert [msg['seq'] for msg in selected] == [7, 8, 9, 10]
+    assert history_tokens(selected) <= cost * 4
+
+
+def test_select_starts_with_a_user_message():
+    history = [message(1, 'user', 'あ'), message(2, 'assistant', 'い'), message(3, 'user', 'う'), message(4, 'assistant', 'え')]
+    cost = 1 + MESSAGE_OVERHEAD_TOKENS
+    # 予算は3件分だが、先頭が assistant になるので2件に減らす
+    assert [msg['seq'] for msg in select_recent_history(history, budget=cost * 3)] == [3, 4]
+
+
+def test_select_always_includes_latest_message():
+    history = [message(1, 'user', 'あ' * 100)]
+    assert select_recent_history(history, budget=10) == history
+
+
+def test_summarized_messages_are_excluded():
+    history = [message(i, 'user' if i % 2 else 'assistant', 'あ') for i in range(1, 7)]
+    summary = {'through': 4, 'text': '要約'}
+    assert [msg['seq'] for msg in unsummarized(history, summary)] == [5, 6]
+    assert [msg['seq'] for msg in select_recent_history(history, budget=1000, summary=summary)] == [5, 6]
+    # seq のない発言は要約されていないものとして扱う
+    assert unsummarized([{'role': 'user', 'content': 'あ'}], summary) == [{'role': 'user', 'content': 'あ'}]
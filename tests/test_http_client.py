@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+import requests
+
+from utils.http_client import ProviderHTTPClient, AsyncProviderHTTPClient
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """結果（レスポンスか例外）を順に返す requests.Session の代わり"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def make_client(*results, max_retries=2):
+    client = ProviderHTTPClient('test', 'https://example.invalid', max_retries=max_retries, backoff_base=0)
+    client.session = FakeSession(*results)
+    return client
+
+
+def test_retries_connection_errors():
+    client = make_client(requests.ConnectionError('refused'), requests.ConnectTimeout('slow'), FakeResponse(200))
+    assert client.post('/v1').status_code == 200
+    assert client.session.calls == 3
+
+
+def test_gives_up_after_max_retries():
+    client = make_client(*[requests.ConnectionError('refused')] * 3)
+    with pytest.raises(requests.ConnectionError):
+        client.post('/v1')
+    assert client.session.calls == 3
+
+
+def test_read_timeout_is_not_retried():
+    client = make_client(requests.ReadTimeout('no answer'), FakeResponse(200))
+    with pytest.raises(requests.ReadTimeout):
+        client.post('/v1')
+    assert client.session.calls == 1
+
+
+def test_retries_retryable_status_codes():
+    busy = FakeResponse(429, {'Retry-After': '0'})
+    client = make_client(busy, FakeResponse(503), FakeResponse(200))
+    assert client.post('/v1').status_code == 200
+    assert busy.closed
+    assert client.session.calls == 3
+
+
+def test_last_retryable_response_is_returned():
+    client = make_client(FakeResponse(500), FakeResponse(502), max_retries=1)
+    assert client.post('/v1').status_code == 502
+
+
+def test_other_status_codes_are_returned_as_is():
+    client = make_client(FakeResponse(400), FakeResponse(200))
+    assert client.post('/v1').status_code == 400
+    assert client.session.calls == 1
+
+
+def run_async(*results, max_retries=2):
+    httpx = pytest.importorskip('httpx')
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        result = results[len(calls) - 1]
+        if isinstance(result, Exception):
+            raise result
+        return httpx.Response(result)
+
+    async def post():
+        client = AsyncProviderHTTPClient('test', 'https://example.invalid', max_retries=max_retries, backoff_base=0)
+        client.client = httpx.AsyncClient(base_url='https://example.invalid', transport=httpx.MockTransport(handler))
+        try:
+            return (await client.post('/v1')).status_code
+        finally:
+            await client.client.aclose()
+
+    return asyncio.run(post()), len(calls)
+
+
+def test_async_retries_connection_errors_and_status_codes():
+    httpx = pytest.importorskip('httpx')
+    assert run_async(httpx.ConnectError('refused'), 503, 200) == (200, 3)
+
+
+def test_async_read_timeout_is_not_retried():
+    httpx = pytest.importorskip('httpx')
+    with pytest.raises(httpx.ReadTimeout):
+        run_async(httpx.ReadTimeout('no answer'), 200)
@@ -0,0 +1,43 @@
+from utils.keyword_matcher import (
+    KeywordMatcher, DEFAULT_TOPIC_WORDS, load_vocabulary, message_keywords, question_matcher
+)
+
+
+def test_finds_overlapping_and_nested_keywords():
+    matcher = KeywordMatcher(['he', 'she', 'his', 'hers'])
+    assert set(matcher.find('ushers')) == {'she', 'he', 'hers'}
+    assert matcher.find('his') == ['his']
+
+
+def test_results_match_substring_search():
+    words = ['ラーメン', 'メン', '在宅', '在宅ワーク', 'ワーク', 'ゲーム', '雨']
+    matcher = KeywordMatcher(words)
+    for text in ['在宅ワークの後にラーメン', '雨の日はゲーム', '何もない', 'メンメンラーメン']:
+        assert set(matcher.find(text)) == {word for word in words if word in text}
+
+
+def test_find_returns_each_keyword_once_in_order_of_appearance():
+    matcher = KeywordMatcher(['雨', '映画', '雨'])
+    assert len(matcher) == 2
+    assert matcher.find('雨だから映画、また雨') == ['雨', '映画']
+
+
+def test_contains_any():
+    assert question_matcher.contains_any('どんな映画が好き？')
+    assert not question_matcher.contains_any('映画を見ました。')
+    assert not KeywordMatcher([]).contains_any('何でも')
+
+
+def test_load_vocabulary_skips_comments_and_falls_back(tmp_path):
+    path = tmp_path / 'words.txt'
+    path.write_text('# 見出し\n映画\n\n音楽  # コメント\n', encoding='utf-8')
+    assert load_vocabulary(str(path)) == ['映画', '音楽']
+    assert load_vocabulary(str(tmp_path / 'missing.txt')) == DEFAULT_TOPIC_WORDS
+
+
+def test_message_keywords_are_cached_on_the_message():
+    message = {'role': 'user', 'content': '今日はカレーを作った'}
+    keywords = message_keywords(message)
+    assert 'カレー' in keywords
+    message['content'] = '別の話'
+    assert message_keywords(message) is keywords
@@ -0,0 +1,64 @@
+import io
+import wave
+
+import numpy as np
+
+from utils import lipsync
+
+
+def make_wav(seconds, rate=16000, amplitude=0.5):
+    samples = (np.sin(np.linspace(0, 2 * np.pi * 220 * seconds, int(rate * seconds))) * amplitude * 32767).astype('<i2')
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+    return output.getvalue()
+
+
+def mp3_frame(bitrate_index=9, sample_rate_index=0, padding=0):
+    """MPEG1 Layer III のフレーム（128kbps・44.1kHz なら417バイト）"""
+    header = bytes([0xFF, 0xFB, (bitrate_index << 4) | (sample_rate_index << 2) | (padding << 1), 0xC4])
+    size = 144 * 128000 // 44100 + padding
+    return header + b'\x00' * (size - 4)
+
+
+def test_mp3_duration_counts_frames():
+    data = mp3_frame() * 10
+    assert abs(lipsync.mp3_duration(data) - 10 * 1152 / 44100) < 1e-9
+
+
+def test_mp3_duration_skips_id3_tag():
+    tag = b'ID3\x04\x00\x00\x00\x00\x00\x0a' + b'\x00' * 10
+    assert abs(lipsync.mp3_duration(tag + mp3_frame() * 3) - 3 * 1152 / 44100) < 1e-9
+
+
+def test_mp3_duration_of_garbage_is_none():
+    assert lipsync.mp3_duration(b'not an mp3') is None
+
+
+def test_audio_duration_reads_wav_header_and_timeline():
+    assert abs(lipsync.audio_duration(make_wav(0.5)) - 0.5) < 1e-3
+    assert lipsync.audio_duration(b'', {'fps': 25, 'frames': '0' * 50}) == 2
+    assert lipsync.audio_duration(b'RIFF\x00\x00\x00\x00WAVEbroken') is None
+
+
+def test_timeline_opens_the_mouth_for_voiced_frames():
+    silence = np.zeros(1600, dtype=np.float32)
+    voiced = np.sin(np.linspace(0, 2 * np.pi * 100, 3200)).astype(np.float32) * 0.5
+    levels = lipsync.mouth_timeline(np.concatenate([silence, voiced, silence]), 16000, fps=25)
+    assert len(levels) == 10
+    assert levels[0] == 0 and levels[-1] == 0
+    assert levels[5] == 3
+
+
+def test_compressed_audio_is_skipped_without_ffmpeg(monkeypatch):
+    monkeypatch.setattr(lipsync, 'FFMPEG_PATH', None)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("tried to decode")
+
+    monkeypatch.setattr(lipsync.audio_cache, 'get_or_create', fail)
+    assert lipsync.get_lipsync_timeline('key', mp3_frame() * 3) is None
+    assert lipsync.can_decode(make_wav(0.1))
@@ -0,0 +1,62 @@
+import io
+import queue
+import logging
+import threading
+import logging.handlers
+
+from utils.logging_config import SnapshotQueueHandler, RedactingFilter, _LazyPayload, redact_secrets
+
+
+class FormattedOn:
+    """文字列にされたスレッドを記録する"""
+
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread().name)
+        return 'value'
+
+
+def make_logger(name):
+    log_queue = queue.SimpleQueue()
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.addFilter(RedactingFilter())
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    logger = logging.getLogger(name)
+    logger.handlers = [SnapshotQueueHandler(log_queue)]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger, listener, stream
+
+
+def test_messages_are_formatted_on_the_listener_thread():
+    logger, listener, stream = make_logger('test.snapshot.thread')
+    value = FormattedOn()
+    logger.info("formatted %s", value)
+    assert value.threads == []
+
+    listener.start()
+    listener.stop()
+    assert stream.getvalue() == "formatted value\n"
+    assert value.threads and threading.main_thread().name not in value.threads
+
+
+def test_arguments_are_snapshotted_and_secrets_redacted():
+    logger, listener, stream = make_logger('test.snapshot.args')
+    history = [{'role': 'user', 'content': 'hi'}]
+    logger.info("history %s key %s", history, 'sk-ant-abcdefghijklmnop')
+    history.append({'role': 'assistant', 'content': 'later'})
+
+    listener.start()
+    listener.stop()
+    output = stream.getvalue()
+    assert 'later' not in output
+    assert 'sk-ant-' not in output and '<redacted>' in output
+
+
+def test_lazy_payload_redacts_text():
+    payload = _LazyPayload({'role': 'user', 'content': 'secret text'})
+    assert str(payload) == '{"role": "user", "content": "<11 chars>"}'
+    assert redact_secrets('Bearer abcdefghijkl') == '<redacted>'
@@ -0,0 +1,75 @@
+import re
+
+import pytest
+
+from utils import metrics
+from utils.metrics import Registry, Counter, Histogram, span, record_usage
+
+
+def test_counter_renders_labelled_values():
+    registry = Registry()
+    counter = Counter('test_total', 'Test counter', ['provider'], registry=registry)
+    counter.inc(provider='openai')
+    counter.inc(2, provider='openai')
+    counter.inc(provider='a"b')
+
+    assert counter.value(provider='openai') == 3
+    assert registry.render() == (
+        '# HELP test_total Test counter\n'
+        '# TYPE test_total counter\n'
+        'test_total{provider="a\\"b"} 1\n'
+        'test_total{provider="openai"} 3\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = Histogram('test_seconds', 'Test histogram', ['stage'], buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.5, 0.7, 5.0):
+        histogram.observe(value, stage='llm')
+
+    lines = registry.render().splitlines()
+    assert 'test_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="llm",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{stage="llm",le="+Inf"} 4' in lines
+    assert 'test_seconds_sum{stage="llm"} 6.25' in lines
+    assert 'test_seconds_count{stage="llm"} 4' in lines
+
+
+def stage_count(stage):
+    match = re.search(rf'^chat_stage_seconds_count{{stage="{stage}"}} (\d+)$', metrics.render_metrics(), re.M)
+    return int(match.group(1)) if match else 0
+
+
+def test_span_records_the_stage_even_on_errors():
+    before = stage_count('test_span')
+    with span('test_span'):
+        pass
+    with pytest.raises(ValueError):
+        with span('test_span'):
+            raise ValueError('failed')
+    assert stage_count('test_span') == before + 2
+
+
+def test_record_usage_counts_tokens_by_kind():
+    before = metrics.LLM_TOKENS.value(provider='openai', speaker_id='test-speaker', kind='cached')
+    record_usage('openai', 'test-speaker', {'prompt_tokens': 100, 'completion_tokens': 20, 'cached_tokens': 64, 'cache_creation_tokens': 0})
+    assert metrics.LLM_TOKENS.value(provider='openai', speaker_id='test-speaker', kind='cached') == before + 64
+    assert metrics.LLM_TOKENS.value(provider='openai', speaker_id='test-speaker', kind='cache_creation') == 0
+
+
+def test_metrics_endpoint_exposes_request_latency():
+    pytest.importorskip('flask')
+    import app as app_module
+
+    client = app_module.app.test_client()
+    assert client.get('/tts-status').status_code == 200
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert '# TYPE http_request_seconds histogram' in body
+    assert 'http_request_seconds_count{endpoint="tts_status",status="200"}' in body
+    # /metrics 自体の問い合わせは記録しない
+    assert 'endpoint="metrics"' not in body
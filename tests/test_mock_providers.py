@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from benchmarks import mock_providers
+from benchmarks.load_chat import percentile, parse_mix
+from utils import openai_helper
+from utils.http_client import ProviderHTTPClient
+
+NO_DELAY = ['--latency', 'fixed:0', '--token-interval', 'fixed:0', '--tts-latency', 'fixed:0', '--engine-latency', 'fixed:0']
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(*args):
+        config = mock_providers.MockConfig(mock_providers.parse_args([*NO_DELAY, *args]))
+        server = mock_providers.create_server('127.0.0.1', 0, config)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def openai_mock(mock_server, monkeypatch):
+    """アプリの OpenAI クライアントの接続先をモックにする"""
+    def connect(*args):
+        client = ProviderHTTPClient('OpenAI', mock_server(*args), max_retries=1, backoff_base=0, backoff_max=0)
+        monkeypatch.setattr(openai_helper, '_openai_http', client)
+        monkeypatch.setattr(openai_helper, 'OPENAI_API_KEY', 'mock')
+        monkeypatch.setattr(openai_helper, 'LLM_FALLBACK_TO_CLAUDE', False)
+        return client
+    return connect
+
+
+def test_chat_response_through_the_mock(openai_mock):
+    openai_mock('--reply-chars', '30')
+    response = openai_helper.get_chat_response('こんにちは', [], '388f246b-8c41-4ac1-8e2d-5d79f3ff56d9')
+    assert len(response['content']) == 30
+    assert response['usage']['completion_tokens'] == 30
+
+
+def test_streamed_response_through_the_mock(openai_mock):
+    openai_mock('--reply-chars', '30')
+    deltas = list(openai_helper.stream_chat_response('こんにちは', [], '388f246b-8c41-4ac1-8e2d-5d79f3ff56d9'))
+    assert len(deltas) > 1
+    assert len(''.join(deltas)) == 30
+
+
+def test_injected_errors_are_retried_then_reported(openai_mock):
+    client = openai_mock('--error-rate', '1')
+    response = client.post('/v1/chat/completions', json={'messages': []})
+    assert response.status_code in (429, 500, 503)
+    with pytest.raises(Exception, match='OpenAI API error'):
+        openai_helper.get_chat_response('こんにちは', [], '388f246b-8c41-4ac1-8e2d-5d79f3ff56d9')
+
+
+def test_latency_model():
+    assert mock_providers.LatencyModel('fixed:0.25').sample() == 0.25
+    assert 0.1 <= mock_providers.LatencyModel('uniform:0.1,0.2').sample() <= 0.2
+    with pytest.raises(ValueError):
+        mock_providers.LatencyModel('pareto:1')
+
+
+def test_load_test_helpers():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([1, 2, 3, 4], 0.5) == 2.5
+    assert percentile([3, 1, 2], 1.0) == 3
+    assert parse_mix('legacy=3,single') == {'legacy': 3.0, 'single': 1.0}
+    with pytest.raises(Exception, match='Unknown scenario'):
+        parse_mix('unknown=1')
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils import openai_helper
+from utils.openai_helper import CHARACTER_PROFILES, build_persona_prefix
+
+SPEAKER = '7ffcb7ce-00ec-4bdc-82cd-45a8889e43ff'
+
+
+def fake_now(full, time_of_day='朝'):
+    return lambda: {'full': full, 'holiday_name': None, 'season_detail': None, 'time_of_day': time_of_day}
+
+
+@pytest.mark.parametrize('speaker_id', list(CHARACTER_PROFILES))
+def test_persona_prefix_is_memoized_per_character(speaker_id):
+    prefix = build_persona_prefix(speaker_id)
+    assert prefix is build_persona_prefix(speaker_id)
+    assert CHARACTER_PROFILES[speaker_id]['name'] in prefix
+
+
+def test_only_the_volatile_part_changes_between_turns(monkeypatch):
+    monkeypatch.setattr(openai_helper, 'get_current_datetime_jp', fake_now('2026年1月1日 08:00'))
+    first_prefix, first_volatile = openai_helper._build_system_prompt('おはよう', [], SPEAKER)
+    monkeypatch.setattr(openai_helper, 'get_current_datetime_jp', fake_now('2026年1月1日 20:00', '夜'))
+    second_prefix, second_volatile = openai_helper._build_system_prompt(
+        'こんばんは', [], SPEAKER, additional_instruction='短く答えて', conversation_summary={'text': '挨拶した', 'through': 2}
+    )
+
+    assert first_prefix == second_prefix
+    assert '2026年1月1日' not in first_prefix
+    assert '08:00' in first_volatile and '20:00' in second_volatile
+    assert '短く答えて' in second_volatile and '挨拶した' in second_volatile
+
+
+def test_unknown_speaker_falls_back_to_default_profile(monkeypatch):
+    monkeypatch.setattr(openai_helper, 'get_current_datetime_jp', fake_now('2026年1月1日 08:00'))
+    prefix, _ = openai_helper._build_system_prompt('こんにちは', [], 'unknown')
+    assert prefix == build_persona_prefix(SPEAKER)
+
+
+def test_requests_start_with_the_persona_prefix(monkeypatch):
+    monkeypatch.setattr(openai_helper, 'get_current_datetime_jp', fake_now('2026年1月1日 08:00'))
+    history = [{'role': 'user', 'content': '前の話'}, {'role': 'assistant', 'content': 'そうだね'}]
+
+    system_blocks, claude_messages = openai_helper._build_claude_request('こんにちは', history, SPEAKER)
+    assert system_blocks[0] == {'type': 'text', 'text': build_persona_prefix(SPEAKER), 'cache_control': {'type': 'ephemeral'}}
+    assert '2026年1月1日' in system_blocks[1]['text']
+    assert claude_messages[-1] == {'role': 'user', 'content': 'こんにちは'}
+
+    messages = openai_helper._build_openai_messages('こんにちは', history, SPEAKER)
+    assert messages[0]['role'] == 'system'
+    assert messages[0]['content'].startswith(build_persona_prefix(SPEAKER))
+    assert [m['content'] for m in messages[1:]] == ['前の話', 'そうだね', 'こんにちは']
+
+
+def test_usage_includes_cached_tokens():
+    assert openai_helper._openai_usage({
+        'prompt_tokens': 1200, 'completion_tokens': 80, 'prompt_tokens_details': {'cached_tokens': 1024}
+    }) == {'prompt_tokens': 1200, 'completion_tokens': 80, 'cached_tokens': 1024, 'cache_creation_tokens': 0}
+
+    usage = SimpleNamespace(input_tokens=50, output_tokens=80, cache_read_input_tokens=1000, cache_creation_input_tokens=0)
+    assert openai_helper._anthropic_usage(usage) == {
+        'prompt_tokens': 1050, 'completion_tokens': 80, 'cached_tokens': 1000, 'cache_creation_tokens': 0
+    }
@@ -0,0 +1,165 @@
+import time
+
+import pytest
+
+from utils import openai_helper, resilience
+from utils.admission import AdmissionRejected
+from utils.resilience import CircuitBreaker, call_with_resilience, stream_with_resilience
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(resilience, 'breakers', {
+        'anthropic': CircuitBreaker('anthropic', failure_threshold=2, reset_timeout=0.05),
+        'openai': CircuitBreaker('openai', failure_threshold=2, reset_timeout=0.05),
+    })
+
+
+@pytest.fixture
+def both_keys(monkeypatch):
+    monkeypatch.setattr(openai_helper, 'ANTHROPIC_API_KEY', 'test')
+    monkeypatch.setattr(openai_helper, 'OPENAI_API_KEY', 'test')
+
+
+def unlimited(provider, call):
+    return call
+
+
+def failing(message):
+    def call():
+        raise Exception(message)
+    return call
+
+
+def test_gpt_preferred_calls_do_not_fall_back_to_claude_by_default(both_keys, monkeypatch):
+    monkeypatch.setattr(openai_helper, 'LLM_FALLBACK_TO_CLAUDE', False)
+    attempts = openai_helper._provider_attempts(False, lambda: 'claude', lambda: 'gpt', limit=unlimited)
+    assert [name for name, _ in attempts] == ['openai']
+
+
+def test_gpt_preferred_calls_fall_back_to_claude_when_enabled(both_keys, monkeypatch):
+    monkeypatch.setattr(openai_helper, 'LLM_FALLBACK_TO_CLAUDE', True)
+    attempts = openai_helper._provider_attempts(False, lambda: 'claude', lambda: 'gpt', limit=unlimited)
+    assert [name for name, _ in attempts] == ['openai', 'anthropic']
+
+
+def test_claude_preferred_calls_still_fall_back_to_gpt(both_keys, monkeypatch):
+    monkeypatch.setattr(openai_helper, 'LLM_FALLBACK_TO_CLAUDE', False)
+    attempts = openai_helper._provider_attempts(True, lambda: 'claude', lambda: 'gpt', limit=unlimited)
+    assert [name for name, _ in attempts] == ['anthropic', 'openai']
+
+
+def test_gpt_preferred_call_without_openai_key_raises(monkeypatch):
+    monkeypatch.setattr(openai_helper, 'ANTHROPIC_API_KEY', 'test')
+    monkeypatch.setattr(openai_helper, 'OPENAI_API_KEY', None)
+    monkeypatch.setattr(openai_helper, 'LLM_FALLBACK_TO_CLAUDE', False)
+    with pytest.raises(Exception, match='OpenAI API key not configured'):
+        openai_helper._provider_attempts(False, lambda: 'claude', lambda: 'gpt', limit=unlimited)
+
+
+def test_breaker_opens_after_threshold_and_probes_after_reset():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.begin()
+    assert breaker.state == 'half_open'
+    # 試行中は他の問い合わせを通さない
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_failure_reopens_breaker():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.begin()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_skipped_call_does_not_count_as_failure():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_skipped()
+    assert breaker.state == 'closed'
+
+
+def test_call_falls_back_to_next_provider():
+    result = call_with_resilience([('anthropic', failing('down')), ('openai', lambda: 'gpt')], hedge_after=0)
+    assert result == 'gpt'
+
+
+def test_open_circuit_skips_provider():
+    resilience.breakers['anthropic'].record_failure()
+    resilience.breakers['anthropic'].record_failure()
+    calls = []
+
+    def claude():
+        calls.append('anthropic')
+        return 'claude'
+
+    assert call_with_resilience([('anthropic', claude), ('openai', lambda: 'gpt')], hedge_after=0) == 'gpt'
+    assert calls == []
+
+
+def test_all_failures_raise_combined_error():
+    with pytest.raises(Exception, match='All LLM providers failed'):
+        call_with_resilience([('anthropic', failing('a')), ('openai', failing('b'))], hedge_after=0)
+
+
+def test_all_rejected_raises_admission_rejected():
+    def rejected():
+        raise AdmissionRejected('openai queue full', retry_after=2)
+
+    with pytest.raises(AdmissionRejected):
+        call_with_resilience([('openai', rejected)], hedge_after=0)
+    assert resilience.breakers['openai'].state == 'closed'
+
+
+def test_hedged_call_uses_faster_provider():
+    def slow():
+        time.sleep(0.5)
+        return 'claude'
+
+    started = time.monotonic()
+    result = call_with_resilience([('anthropic', slow), ('openai', lambda: 'gpt')], hedge_after=0.05)
+    assert result == 'gpt'
+    assert time.monotonic() - started < 0.4
+
+
+def test_hedged_call_keeps_fast_primary():
+    calls = []
+
+    def secondary():
+        calls.append('openai')
+        return 'gpt'
+
+    result = call_with_resilience([('anthropic', lambda: 'claude'), ('openai', secondary)], hedge_after=0.5)
+    assert result == 'claude'
+    assert calls == []
+
+
+def test_stream_falls_back_only_before_first_token():
+    def broken():
+        raise Exception('down')
+        yield
+
+    def working():
+        yield 'こん'
+        yield 'にちは'
+
+    assert list(stream_with_resilience([('anthropic', broken), ('openai', working)], hedge_after=0)) == ['こん', 'にちは']
+
+    def interrupted():
+        yield 'こん'
+        raise Exception('reset')
+
+    with pytest.raises(Exception, match='Failed to stream anthropic response'):
+        list(stream_with_resilience([('anthropic', interrupted), ('openai', working)], hedge_after=0))
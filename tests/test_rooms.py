@@ -0,0 +1,28 @@
+from utils.rooms import validate_room, plan_room_turn, ROOM_MAX_CHARACTERS
+from utils.openai_helper import CHARACTER_PROFILES
+
+SPEAKERS = list(CHARACTER_PROFILES)
+
+
+def test_validate_room_accepts_known_characters():
+    assert validate_room(SPEAKERS[:2]) is None
+
+
+def test_validate_room_rejects_bad_input():
+    assert validate_room('abc')
+    assert validate_room(SPEAKERS[:1])
+    assert validate_room([SPEAKERS[0], SPEAKERS[0]])
+    assert validate_room([SPEAKERS[0], 'unknown'])
+    assert validate_room(SPEAKERS[:1] * (ROOM_MAX_CHARACTERS + 1))
+
+
+def test_validate_room_rejects_unhashable_members():
+    assert validate_room([{}, {}]) == 'Characters must be speaker UUID strings'
+    assert validate_room([[SPEAKERS[0]], SPEAKERS[1]]) == 'Characters must be speaker UUID strings'
+
+
+def test_plan_room_turn_puts_the_lead_first():
+    plan = plan_room_turn(SPEAKERS[:3])
+    assert [entry['speaker_id'] for entry in plan] == SPEAKERS[:3]
+    assert plan[0]['pattern'] is None and plan[0]['depends_on'] is None
+    assert all(entry['depends_on'] in (None, SPEAKERS[0]) for entry in plan[1:])
@@ -0,0 +1,44 @@
+from utils.sentences import SentenceChunker, split_sentences
+
+
+def test_split_sentences_keeps_terminators_and_closers():
+    text = '「こんにちは！」今日はいい天気ですね。本当？\nうん'
+    assert split_sentences(text) == ['「こんにちは！」', '今日はいい天気ですね。', '本当？', 'うん']
+
+
+def test_repeated_terminators_stay_in_one_sentence():
+    assert split_sentences('えっ！？そうなの…。') == ['えっ！？', 'そうなの…。']
+
+
+def test_chunker_emits_sentences_as_deltas_arrive():
+    chunker = SentenceChunker()
+    assert chunker.feed('こんに') == []
+    assert chunker.feed('ちは。今日') == ['こんにちは。']
+    assert chunker.feed('は晴れ') == []
+    assert chunker.feed('です！') == []
+    assert chunker.flush() == ['今日は晴れです！']
+    assert chunker.flush() == []
+
+
+def test_chunker_waits_for_closer_split_across_deltas():
+    chunker = SentenceChunker()
+    # 「。」の直後に届く閉じ括弧を同じ文に含める
+    assert chunker.feed('「そうだね。') == []
+    assert chunker.feed('」次') == ['「そうだね。」']
+    assert chunker.flush() == ['次']
+
+
+def test_same_result_for_any_split():
+    text = 'ねえ、聞いて！昨日ね、映画を見たの。「面白かった？」って？うん。'
+    expected = split_sentences(text)
+    for size in range(1, 6):
+        chunker = SentenceChunker()
+        sentences = []
+        for i in range(0, len(text), size):
+            sentences += chunker.feed(text[i:i + size])
+        assert sentences + chunker.flush() == expected
+
+
+def test_blank_text_has_no_sentences():
+    assert split_sentences('') == []
+    assert split_sentences(' \n\n ') == []
@@ -0,0 +1,63 @@
+import gzip
+import json
+
+import pytest
+
+from utils.speaker_registry import SpeakerRegistry, load_speaker_registry, speaker_registry
+
+METAN = '7ffcb7ce-00ec-4bdc-82cd-45a8889e43ff'
+
+SPEAKERS = [
+    {'speaker_uuid': METAN, 'name': '四国めたん', 'styles': [{'id': 2, 'name': 'ノーマル'}, {'id': 0, 'name': 'あまあま'}]},
+    {'speaker_uuid': 'other', 'name': 'だれか', 'styles': [{'id': 99, 'name': 'ノーマル'}]},
+]
+
+
+def test_lookups_by_uuid_name_and_style():
+    registry = SpeakerRegistry(SPEAKERS)
+    assert registry.get(METAN)['name'] == '四国めたん'
+    assert registry.find_by_name('だれか')['speaker_uuid'] == 'other'
+    speaker, style = registry.speaker_for_style(0)
+    assert (speaker['name'], style['name']) == ('四国めたん', 'あまあま')
+    assert registry.speaker_for_style(12345) is None
+    assert registry.position(METAN) == 'B'
+    assert registry.position('other') == 'A'
+
+
+def test_precomputed_documents():
+    registry = SpeakerRegistry(SPEAKERS)
+    assert json.loads(registry.speakers_json.body) == SPEAKERS
+    assert gzip.decompress(registry.speakers_json.gzip_body) == registry.speakers_json.body
+    assert json.loads(registry.styles_json.body)['0'] == {
+        'speaker_uuid': METAN, 'name': '四国めたん', 'style': 'あまあま', 'position': 'B', 'mouth': 'metan'
+    }
+    # 同じ内容なら ETag も同じ
+    assert SpeakerRegistry(SPEAKERS).speakers_json.etag == registry.speakers_json.etag
+
+
+def test_loads_utf16_files_and_falls_back(tmp_path):
+    path = tmp_path / 'speakers.json'
+    path.write_bytes(json.dumps(SPEAKERS, ensure_ascii=False).encode('utf-16'))
+    broken = tmp_path / 'broken.json'
+    broken.write_text('{', encoding='utf-8')
+
+    registry = load_speaker_registry([str(tmp_path / 'missing.json'), str(broken), str(path)])
+    assert registry.get(METAN)['name'] == '四国めたん'
+    assert load_speaker_registry([str(tmp_path / 'missing.json')]).speakers == []
+
+
+def test_get_speakers_supports_gzip_and_revalidation():
+    pytest.importorskip('flask')
+    import app as app_module
+
+    client = app_module.app.test_client()
+    response = client.get('/get-speakers', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == speaker_registry.speakers_json.body
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+    etag = response.headers['ETag']
+    revalidated = client.get('/get-speakers', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert client.get('/speaker-styles').get_json() == json.loads(speaker_registry.styles_json.body)
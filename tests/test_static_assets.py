@@ -0,0 +1,78 @@
+import gzip
+import json
+
+import pytest
+
+from tools.build_assets import DistWriter, build_text_file
+from utils.static_assets import AssetManifest, MANIFEST_NAME, load_asset_manifest, source_digest
+
+
+def build_manifest(dist_dir):
+    """chat.js だけをビルドし、manifest.json に書き出す"""
+    writer = DistWriter(str(dist_dir))
+    data = {'files': {'js/chat.js': build_text_file(writer, 'js/chat.js')}}
+    (dist_dir / MANIFEST_NAME).write_text(json.dumps(data), encoding='utf-8')
+    return data
+
+
+def test_missing_or_broken_manifest_serves_originals(tmp_path):
+    assert load_asset_manifest(str(tmp_path)).file('js/chat.js') is None
+    (tmp_path / MANIFEST_NAME).write_text('{', encoding='utf-8')
+    manifest = load_asset_manifest(str(tmp_path))
+    assert manifest.file('js/chat.js') is None
+    assert manifest.client_manifest() == {'characters': {}}
+
+
+def test_built_files_are_fingerprinted_and_precompressed(tmp_path):
+    data = build_manifest(tmp_path)
+    name = data['files']['js/chat.js']['file']
+    assert name.startswith('chat.') and name.endswith('.js')
+    assert gzip.decompress((tmp_path / (name + '.gz')).read_bytes()) == (tmp_path / name).read_bytes()
+
+    manifest = load_asset_manifest(str(tmp_path))
+    assert manifest.file('js/chat.js') == name
+    assert name in manifest.precompressed
+
+
+def test_stale_entries_fall_back_to_originals():
+    entry = {'sources': ['js/chat.js'], 'file': 'chat.old.js', 'gzip': True}
+    manifest = AssetManifest({
+        'files': {'js/chat.js': {**entry, 'digest': 'outdated'}, 'css/missing.css': {**entry, 'sources': ['css/missing.css']}},
+        'characters': {'metan': {'sources': ['js/chat.js'], 'digest': 'outdated'}},
+    })
+    assert manifest.file('js/chat.js') is None
+    assert manifest.file('css/missing.css') is None
+    assert manifest.precompressed == set()
+    assert manifest.client_manifest() == {'characters': {}}
+    assert AssetManifest({'files': {'js/chat.js': {**entry, 'digest': source_digest(['js/chat.js'])}}}).file('js/chat.js') == 'chat.old.js'
+
+
+def test_app_serves_built_assets_with_immutable_caching(tmp_path, monkeypatch):
+    pytest.importorskip('flask')
+    import app as app_module
+
+    client = app_module.app.test_client()
+    monkeypatch.setattr(app_module, 'asset_manifest', AssetManifest({}))
+    with app_module.app.test_request_context():
+        assert app_module.asset_url('js/chat.js') == '/static/js/chat.js'
+
+    name = build_manifest(tmp_path)['files']['js/chat.js']['file']
+    monkeypatch.setattr(app_module, 'asset_manifest', load_asset_manifest(str(tmp_path)))
+    monkeypatch.setattr(app_module, 'ASSET_DIST_DIR', str(tmp_path))
+    with app_module.app.test_request_context():
+        assert app_module.asset_url('js/chat.js') == f'/dist/{name}'
+        assert app_module.asset_url('css/style.css') == '/static/css/style.css'
+
+    response = client.get(f'/dist/{name}', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype in ('text/javascript', 'application/javascript')
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()) == (tmp_path / name).read_bytes()
+    response.close()
+
+    plain = client.get(f'/dist/{name}')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.get_data() == (tmp_path / name).read_bytes()
+    plain.close()
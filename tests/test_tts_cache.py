@@ -0,0 +1,73 @@
+import threading
+
+import app as app_module
+from utils.tts_helper import AudioCache, tts_cache_key
+
+
+def test_get_or_create_shares_one_synthesis(tmp_path):
+    cache = AudioCache(str(tmp_path), 1024 * 1024)
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def producer():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return b'audio'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_create('k', producer))) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [b'audio'] * 4
+    assert len(calls) == 1
+
+
+def test_get_or_create_rereads_entry_saved_after_a_miss(tmp_path, monkeypatch):
+    """読み込みに失敗した直後に前の生成が保存を終えた場合、もう一度合成しない"""
+    cache = AudioCache(str(tmp_path), 1024 * 1024)
+    cache.put('k', b'saved')
+    real_get = cache.get
+    misses = iter([None])
+    monkeypatch.setattr(cache, 'get', lambda key: next(misses, None) or real_get(key))
+
+    def producer():
+        raise AssertionError("synthesized again")
+
+    assert cache.get_or_create('k', producer) == b'saved'
+
+
+def test_get_or_create_produces_when_cache_file_is_unreadable(tmp_path):
+    """キャッシュのファイルがあっても読めなければ、読み直しを繰り返さずに合成する"""
+    cache = AudioCache(str(tmp_path), 1024 * 1024)
+    # open() が IsADirectoryError になるパス（root でも読めない）
+    (tmp_path / 'k.audio').mkdir()
+    results = []
+    worker = threading.Thread(target=lambda: results.append(cache.get_or_create('k', lambda: b'fresh')), daemon=True)
+    worker.start()
+    worker.join(5)
+
+    assert not worker.is_alive()
+    assert results == [b'fresh']
+
+
+def test_tts_revalidation_skips_synthesis(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("synthesized on revalidation")
+
+    monkeypatch.setattr(app_module, 'get_tts_audio', fail)
+    monkeypatch.setattr(app_module, 'get_lipsync_timeline', fail)
+    key = tts_cache_key('こんにちは', 3)
+
+    response = app_module.app.test_client().get(
+        '/tts', query_string={'text': 'こんにちは', 'speaker': 3}, headers={'If-None-Match': f'"{key}"'}
+    )
+    assert response.status_code == 304
+    assert response.headers['ETag'] == f'"{key}"'
@@ -0,0 +1,139 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from utils.turns import TurnRegistry, TurnCancelled
+
+
+def test_begin_cancels_previous_turn_of_same_conversation():
+    registry = TurnRegistry()
+    first = registry.begin('conversation')
+    queued = Future()
+    first.track(queued)
+    other = registry.begin('other')
+
+    second = registry.begin('conversation')
+    assert first.cancelled and queued.cancelled()
+    assert not second.cancelled and not other.cancelled
+    with pytest.raises(TurnCancelled):
+        first.check()
+    second.check()
+
+
+def test_finish_keeps_newer_turn_current():
+    registry = TurnRegistry()
+    first = registry.begin('conversation')
+    second = registry.begin('conversation')
+    registry.finish(first)
+    registry.cancel_current('conversation')
+    assert second.cancelled
+
+
+def test_duplicate_key_gets_first_result():
+    registry = TurnRegistry()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def producer():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return 'first'
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(registry.coalesce('key', producer)))
+    owner.start()
+    started.wait(2)
+    duplicate = threading.Thread(target=lambda: results.append(registry.coalesce('key', lambda: 'second')))
+    duplicate.start()
+    release.set()
+    owner.join(2)
+    duplicate.join(2)
+
+    assert results == ['first', 'first']
+    assert len(calls) == 1
+    # 完了後も TTL の間は同じ結果を返す
+    assert registry.coalesce('key', lambda: 'third') == 'first'
+
+
+def test_failed_producer_releases_key():
+    registry = TurnRegistry()
+
+    def failing():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        registry.coalesce('key', failing)
+    assert registry.coalesce('key', lambda: 'retried') == 'retried'
+
+
+def test_coalesce_async_shares_result_and_releases_failed_key():
+    registry = TurnRegistry()
+    calls = []
+
+    async def producer():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'first'
+
+    async def failing():
+        raise RuntimeError('boom')
+
+    async def main():
+        results = await asyncio.gather(registry.coalesce_async('key', producer), registry.coalesce_async('key', producer))
+        with pytest.raises(RuntimeError):
+            await registry.coalesce_async('other', failing)
+        return results, await registry.coalesce_async('other', producer)
+
+    results, retried = asyncio.run(main())
+    assert results == ['first', 'first']
+    assert retried == 'first'
+    assert len(calls) == 2
+
+
+def test_coalesced_result_expires_after_ttl():
+    registry = TurnRegistry(idempotency_ttl=0.05)
+    assert registry.coalesce('key', lambda: 'first') == 'first'
+    time.sleep(0.06)
+    assert registry.coalesce('key', lambda: 'second') == 'second'
+
+
+def test_claim_and_release_follow_ttl():
+    registry = TurnRegistry(idempotency_ttl=0.05)
+    assert registry.claim('key')
+    assert not registry.claim('key')
+    # 実行中のキーは期限がないので、時間が経っても重複として扱う
+    time.sleep(0.06)
+    assert not registry.claim('key')
+
+    registry.release('key')
+    assert not registry.claim('key')
+    time.sleep(0.06)
+    assert registry.claim('key')
+
+
+def test_cancelled_turn_writes_no_history(monkeypatch):
+    app_module = pytest.importorskip('app')
+    monkeypatch.setattr(app_module, 'CONCURRENT_SPEAKERS', False)
+    monkeypatch.setattr(app_module, 'JOINT_EXCHANGE', False)
+    registry = TurnRegistry()
+    turn = registry.begin('cancelled-conversation')
+
+    def get_chat_response(message, conversation_history, speaker_id, **kwargs):
+        # 話者Aの生成中に同じ会話の新しいメッセージが届いた
+        registry.begin('cancelled-conversation')
+        return {'content': '応答'}
+
+    monkeypatch.setattr(app_module, 'get_chat_response', get_chat_response)
+    with app_module.app.test_request_context():
+        response, status = app_module.chat_turn(
+            {'message': 'こんにちは', 'speaker_a': 'a', 'speaker_b': 'b'}, 'cancelled-conversation', turn
+        )
+
+    assert status == 409
+    assert response.get_json()['cancelled']
+    assert app_module.conversation_store.get_history('cancelled-conversation') == []
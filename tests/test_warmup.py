@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from utils import warmup
+
+
+@pytest.fixture
+def cold(monkeypatch):
+    """温める前の状態にし、温めの手順を記録するものに差し替える"""
+    monkeypatch.setattr(warmup, '_state', {'warm': False, 'pid': None, 'seconds': {}})
+    monkeypatch.setattr(warmup, '_thread', None)
+    calls = []
+    monkeypatch.setattr(warmup, '_steps', lambda: [('step', lambda: calls.append('step'))])
+    return calls
+
+
+def wait_for_background_warm_up():
+    deadline = time.monotonic() + 5
+    while warmup._thread is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_warm_up_runs_once(cold):
+    warmup.warm_up()
+    warmup.warm_up()
+    assert cold == ['step']
+    status = warmup.warmup_status()
+    assert status['warm'] and not status['preloaded']
+    assert set(status['warmup_seconds']) == {'step'}
+
+
+def test_failed_background_warm_up_is_retried(cold, monkeypatch):
+    def broken():
+        raise Exception('not ready')
+
+    monkeypatch.setattr(warmup, '_steps', lambda: [('broken', broken)])
+    warmup.start_warm_up()
+    wait_for_background_warm_up()
+    assert not warmup.warmup_status()['warm']
+
+    monkeypatch.setattr(warmup, '_steps', lambda: [('step', lambda: None)])
+    warmup.start_warm_up()
+    wait_for_background_warm_up()
+    assert warmup.warmup_status()['warm']
+
+
+def test_healthz_reports_warming_until_ready(cold):
+    pytest.importorskip('flask')
+    import app as app_module
+
+    client = app_module.app.test_client()
+    response = client.get('/healthz')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'warming'
+
+    # 最初の問い合わせで裏の温めが始まる
+    wait_for_background_warm_up()
+    response = client.get('/healthz')
+
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'ok'
+    assert cold == ['step']
@@ -0,0 +1,252 @@
+"""静的アセットのビルド
+
+キャラクターごとに目・口のアニメーション用フレームを1枚のスプライトアトラスにまとめ、
+立ち絵とアトラスを WebP / AVIF（Pillow が対応していれば）/ PNG で書き出す。
+chat.js と style.css は gzip 済みのファイルも作る。出力のファイル名には内容のハッシュを含め、
+対応表を static/dist/manifest.json に書き出す（アプリは起動時にこれを読む）。
+
+    pip install Pillow
+    python tools/build_assets.py --max-height 1024
+
+目・口の元画像は立ち絵と同じ大きさの透過PNGなので、不透明な部分だけを切り出して詰める。
+切り出した位置は manifest の frames に [x, y, 幅, 高さ, アトラス内のy座標] として記録する。
+"""
+import io
+import os
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.static_assets import ASSET_DIST_DIR, MANIFEST_NAME, STATIC_DIR, source_digest  # noqa: E402
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import pillow_avif  # noqa: F401  Pillow 11.3 より前で AVIF を書き出すためのプラグイン
+except ImportError:
+    pass
+
+# キャラクターごとの立ち絵とフレーム（キーは /speaker-styles の mouth と同じ）
+CHARACTERS = {
+    'metan': {
+        'standing': 'assets/standing_metan.png',
+        'frames': {
+            'eye_open': 'assets/metan_eye_open.png',
+            'eye_close': 'assets/metan_eye_close.png',
+            'mouse_open': 'assets/metan_mouse_open.png',
+            'mouse_open_middle': 'assets/metan_mouse_open_middle.png',
+            'mouse_close_middle': 'assets/metan_mouse_close_middle.png',
+            'mouse_close': 'assets/metan_mouse_close.png',
+        },
+    },
+    'hau': {
+        'standing': 'assets/hau_standing.png',
+        'frames': {
+            'eye_open': 'assets/hau_open_eyes.png',
+            'eye_close': 'assets/hau_close_eyes.png',
+            'mouse_open': 'assets/hau_mouse_open.png',
+            'mouse_open_middle': 'assets/hau_mouse_open_middle.png',
+            'mouse_close_middle': 'assets/hau_mouse_close_middle.png',
+            'mouse_close': 'assets/hau_mouse_close.png',
+        },
+    },
+    'tsumugi': {
+        'standing': 'assets/standing_tsumugi.png',
+        'frames': {
+            'eye_open': 'assets/tsumugi_eye_open.png',
+            'eye_close': 'assets/tsumugi_eye_close.png',
+            'mouse_open': 'assets/tsumugi_mouse_open.png',
+            'mouse_open_middle': 'assets/tsumugi_mouse_open_middle.png',
+            'mouse_close_middle': 'assets/tsumugi_mouse_close_middle.png',
+            'mouse_close': 'assets/tsumugi_mouse_close.png',
+        },
+    },
+    'whiteCul': {
+        'standing': 'assets/whiteCul_standing.png',
+        'frames': {
+            'eye_open': 'assets/whiteCul_eye_open.png',
+            'eye_close': 'assets/whiteCul_eye_close.png',
+            'mouse_open': 'assets/whiteCul_mouse_open.png',
+            'mouse_open_middle': 'assets/whiteCul_mouse_open_middle.png',
+            'mouse_close_middle': 'assets/whiteCul_mouse_close_middle.png',
+            'mouse_close': 'assets/whiteCul_mouse_close.png',
+        },
+    },
+}
+
+# ハッシュつきの名前にしてテンプレートから参照するファイル
+TEXT_FILES = ['js/chat.js', 'css/style.css']
+
+# アトラス内のフレーム同士の間隔（拡大縮小時に隣のフレームがにじまないように）
+FRAME_PADDING = 2
+
+
+def hashed_name(stem, ext, data):
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}.{ext}"
+
+
+class DistWriter:
+    """出力先に書き出し、書いたファイル名を覚えておく（古いファイルの掃除用）"""
+
+    def __init__(self, dist_dir):
+        self.dist_dir = dist_dir
+        self.written = {MANIFEST_NAME}
+        self.total_bytes = 0
+
+    def write(self, name, data):
+        with open(os.path.join(self.dist_dir, name), 'wb') as f:
+            f.write(data)
+        self.written.add(name)
+        self.total_bytes += len(data)
+        return name
+
+    def remove_stale(self):
+        for name in os.listdir(self.dist_dir):
+            if name not in self.written:
+                os.remove(os.path.join(self.dist_dir, name))
+
+
+def avif_supported():
+    Image.init()
+    return 'AVIF' in Image.SAVE
+
+
+def encode(image, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    elif fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=quality, method=6)
+    else:
+        image.save(buffer, 'AVIF', quality=max(1, quality - 25), speed=4)
+    return buffer.getvalue()
+
+
+def write_image(writer, stem, image, formats, quality):
+    """画像を各形式で書き出し、{形式: ファイル名} を返す（chat.js はこの順に試す）"""
+    files = {}
+    for fmt in formats:
+        data = encode(image, fmt, quality)
+        files[fmt] = writer.write(hashed_name(stem, fmt, data), data)
+    return files
+
+
+def load_rgba(path, size):
+    image = Image.open(os.path.join(STATIC_DIR, path)).convert('RGBA')
+    if image.size != size:
+        image = image.resize(size, Image.LANCZOS)
+    return image
+
+
+def frame_group(name):
+    """同じ部位（eye / mouse）のフレームは同じ範囲で切り出す"""
+    return name.split('_', 1)[0]
+
+
+def build_character(writer, key, spec, max_height, formats, quality):
+    standing = Image.open(os.path.join(STATIC_DIR, spec['standing'])).convert('RGBA')
+    scale = min(1.0, max_height / standing.height) if max_height else 1.0
+    canvas = (round(standing.width * scale), round(standing.height * scale))
+    if standing.size != canvas:
+        standing = standing.resize(canvas, Image.LANCZOS)
+
+    frames = {name: load_rgba(path, canvas) for name, path in spec['frames'].items()}
+
+    # 部位ごとに全フレームの不透明部分を合わせた範囲を求める
+    boxes = {}
+    for name, image in frames.items():
+        box = image.getchannel('A').getbbox()
+        if box is None:
+            raise Exception(f"Frame {spec['frames'][name]} is fully transparent")
+        group = frame_group(name)
+        if group in boxes:
+            left, top, right, bottom = boxes[group]
+            box = (min(left, box[0]), min(top, box[1]), max(right, box[2]), max(bottom, box[3]))
+        boxes[group] = box
+
+    # 切り出したフレームを縦に並べる
+    crops = {name: image.crop(boxes[frame_group(name)]) for name, image in frames.items()}
+    atlas_width = max(crop.width for crop in crops.values())
+    atlas_height = sum(crop.height for crop in crops.values()) + FRAME_PADDING * (len(crops) - 1)
+    atlas = Image.new('RGBA', (atlas_width, atlas_height))
+    layout = {}
+    y = 0
+    for name, crop in crops.items():
+        atlas.paste(crop, (0, y))
+        left, top, right, bottom = boxes[frame_group(name)]
+        layout[name] = [left, top, right - left, bottom - top, y]
+        y += crop.height + FRAME_PADDING
+
+    sources = [spec['standing']] + list(spec['frames'].values())
+    return {
+        'sources': sources,
+        'digest': source_digest(sources),
+        'canvas': list(canvas),
+        'standing': write_image(writer, f"{key}_standing", standing, formats, quality),
+        'atlas': write_image(writer, f"{key}_atlas", atlas, formats, quality),
+        'atlas_size': [atlas_width, atlas_height],
+        'frames': layout,
+    }
+
+
+def build_text_file(writer, path):
+    with open(os.path.join(STATIC_DIR, path), 'rb') as f:
+        data = f.read()
+    stem, ext = os.path.splitext(os.path.basename(path))
+    name = writer.write(hashed_name(stem, ext.lstrip('.'), data), data)
+    writer.write(name + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    return {'sources': [path], 'digest': source_digest([path]), 'file': name, 'gzip': True}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build sprite atlases and fingerprinted static assets")
+    parser.add_argument('--out', default=ASSET_DIST_DIR, help="出力先（manifest.json もここに書く）")
+    parser.add_argument('--max-height', type=int, default=1024,
+                        help="立ち絵とフレームをこの高さまで縮小する（0で元の大きさ）")
+    parser.add_argument('--quality', type=int, default=85, help="WebP の品質（AVIF はこれより低めにする）")
+    parser.add_argument('--no-avif', action='store_true', help="AVIF を書き出さない")
+    parser.add_argument('--clean', action='store_true', help="出力先を空にしてからビルドする")
+    args = parser.parse_args()
+
+    if Image is None:
+        print("Pillow is required: pip install Pillow", file=sys.stderr)
+        return 1
+
+    formats = ['webp', 'png']
+    if not args.no_avif:
+        if avif_supported():
+            formats.insert(0, 'avif')
+        else:
+            print("AVIF is not supported by this Pillow build, skipping (pip install pillow-avif-plugin)",
+                  file=sys.stderr)
+
+    if args.clean:
+        shutil.rmtree(args.out, ignore_errors=True)
+    os.makedirs(args.out, exist_ok=True)
+    writer = DistWriter(args.out)
+
+    manifest = {'files': {}, 'characters': {}}
+    for key, spec in CHARACTERS.items():
+        manifest['characters'][key] = build_character(writer, key, spec, args.max_height, formats, args.quality)
+        print(f"{key}: atlas {manifest['characters'][key]['atlas_size']}, {', '.join(formats)}")
+    for path in TEXT_FILES:
+        manifest['files'][path] = build_text_file(writer, path)
+
+    with open(os.path.join(args.out, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    writer.remove_stale()
+
+    print(f"Wrote {len(writer.written)} files ({writer.total_bytes / 1024:.0f} KiB) to {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
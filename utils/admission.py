@@ -0,0 +1,257 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# LLM呼び出しの同時実行数（0 で無制限）。global はプロセス全体、他はプロバイダごと
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_CONCURRENCY_OPENAI = int(os.environ.get("LLM_MAX_CONCURRENCY_OPENAI", "16"))
+LLM_MAX_CONCURRENCY_ANTHROPIC = int(os.environ.get("LLM_MAX_CONCURRENCY_ANTHROPIC", "16"))
+# 1秒あたりのリクエスト数の上限（トークンバケット。0 で無制限）
+LLM_RATE_LIMIT_OPENAI = float(os.environ.get("LLM_RATE_LIMIT_OPENAI", "0"))
+LLM_RATE_LIMIT_ANTHROPIC = float(os.environ.get("LLM_RATE_LIMIT_ANTHROPIC", "0"))
+# 空きを待てるリクエスト数と待ち時間（超えたら 503 + Retry-After）
+LLM_QUEUE_MAX = int(os.environ.get("LLM_QUEUE_MAX", "32"))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "2"))
+# 全体の負荷（実行中 + 待機中）が同時実行数のこの割合を超えたら縮退モードにする
+LLM_DEGRADE_AT = float(os.environ.get("LLM_DEGRADE_AT", "0.8"))
+LLM_DEGRADED_MAX_TOKENS = int(os.environ.get("LLM_DEGRADED_MAX_TOKENS", "200"))
+
+ADMISSION_REJECTIONS = Counter(
+    'llm_admission_rejections_total', 'LLM calls rejected by admission control', ['limiter', 'reason']
+)
+DEGRADED_TURNS = Counter(
+    'chat_degraded_turns_total', 'Chat turns served in degraded mode', ['endpoint']
+)
+
+
+class AdmissionRejected(Exception):
+    """混雑のためLLM呼び出しを受け付けられない（503 + Retry-After で返す）"""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class TokenBucket:
+    """1秒あたり rate 件、最大 burst 件まで溜められるトークンバケット"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """トークンを1つ予約し、使えるまでの待ち時間を返す（max_wait を超える場合は予約せず None）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class ConcurrencyLimiter:
+    """同時実行数の上限と、空きを待つリクエストの上限（待ち時間つき）"""
+
+    def __init__(self, name, limit, max_queue=LLM_QUEUE_MAX, queue_timeout=LLM_QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+        # 非同期で空きを待っている (イベントループ, Future)（スレッドを使わずに待つ）
+        self._async_waiters = []
+
+    def load(self):
+        """実行中 + 待機中の件数を上限に対する割合で返す"""
+        if not self.limit:
+            return 0.0
+        with self._cond:
+            return (self.active + self.waiting) / self.limit
+
+    def saturated(self):
+        """待機列も埋まっていて、新しいリクエストを待たせられない状態か"""
+        if not self.limit:
+            return False
+        with self._cond:
+            return self.active >= self.limit and self.waiting >= self.max_queue
+
+    def try_acquire(self):
+        if not self.limit:
+            return True
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            return False
+
+    def acquire(self):
+        if not self.limit:
+            return
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return
+            if self.waiting >= self.max_queue:
+                ADMISSION_REJECTIONS.inc(limiter=self.name, reason='queue_full')
+                raise AdmissionRejected(f"Too many concurrent {self.name} requests", self.queue_timeout)
+
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        ADMISSION_REJECTIONS.inc(limiter=self.name, reason='queue_timeout')
+                        raise AdmissionRejected(f"Timed out waiting for a {self.name} slot", self.queue_timeout)
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+
+    async def acquire_async(self):
+        """acquire の非同期版。待機列と待ち時間の上限は同じで、イベントループ上で空きを待つ"""
+        if self.try_acquire():
+            return
+        with self._cond:
+            if self.waiting >= self.max_queue:
+                ADMISSION_REJECTIONS.inc(limiter=self.name, reason='queue_full')
+                raise AdmissionRejected(f"Too many concurrent {self.name} requests", self.queue_timeout)
+            self.waiting += 1
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        acquired = False
+        try:
+            while True:
+                wakeup = loop.create_future()
+                with self._cond:
+                    if self.active < self.limit:
+                        self.active += 1
+                        acquired = True
+                        return
+                    self._async_waiters.append((loop, wakeup))
+                remaining = deadline - loop.time()
+                try:
+                    if remaining <= 0:
+                        ADMISSION_REJECTIONS.inc(limiter=self.name, reason='queue_timeout')
+                        raise AdmissionRejected(f"Timed out waiting for a {self.name} slot", self.queue_timeout)
+                    await asyncio.wait_for(wakeup, remaining)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self._cond:
+                        if (loop, wakeup) in self._async_waiters:
+                            self._async_waiters.remove((loop, wakeup))
+        finally:
+            with self._cond:
+                self.waiting -= 1
+                # 起こされたのに枠を取らずに抜けた場合は、次の待機者に譲る
+                if not acquired and self.active < self.limit:
+                    self._wake_async_waiter()
+
+    def _wake_async_waiter(self):
+        """非同期の待機者を1件起こす（ロック取得済みで呼ぶ）"""
+        if self._async_waiters:
+            loop, wakeup = self._async_waiters.pop(0)
+            loop.call_soon_threadsafe(_wake, wakeup)
+
+    def release(self):
+        if not self.limit:
+            return
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+            self._wake_async_waiter()
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+limiters = {
+    'global': ConcurrencyLimiter('global', LLM_MAX_CONCURRENCY),
+    'openai': ConcurrencyLimiter('openai', LLM_MAX_CONCURRENCY_OPENAI),
+    'anthropic': ConcurrencyLimiter('anthropic', LLM_MAX_CONCURRENCY_ANTHROPIC),
+}
+rate_limits = {
+    name: TokenBucket(rate) for name, rate in (
+        ('openai', LLM_RATE_LIMIT_OPENAI),
+        ('anthropic', LLM_RATE_LIMIT_ANTHROPIC),
+    ) if rate > 0
+}
+
+
+def _wait_for_rate(name):
+    bucket = rate_limits.get(name)
+    if bucket is None:
+        return 0.0
+    wait = bucket.reserve(LLM_QUEUE_TIMEOUT)
+    if wait is None:
+        ADMISSION_REJECTIONS.inc(limiter=name, reason='rate_limit')
+        raise AdmissionRejected(f"{name} rate limit exceeded", bucket.retry_after())
+    return wait
+
+
+@contextmanager
+def llm_slot(name):
+    """LLM呼び出し1件分の枠を確保する（name は 'global' またはプロバイダ名）"""
+    wait = _wait_for_rate(name)
+    if wait:
+        time.sleep(wait)
+    limiter = limiters[name]
+    limiter.acquire()
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+@asynccontextmanager
+async def llm_slot_async(name):
+    """llm_slot の非同期版（空きはイベントループ上で待ち、スレッドを使わない）"""
+    wait = _wait_for_rate(name)
+    if wait:
+        await asyncio.sleep(wait)
+    limiter = limiters[name]
+    await limiter.acquire_async()
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+def check_capacity():
+    """待機列まで埋まっていれば、LLMを呼ぶ前に AdmissionRejected を送出する"""
+    limiter = limiters['global']
+    if limiter.saturated():
+        ADMISSION_REJECTIONS.inc(limiter='global', reason='queue_full')
+        raise AdmissionRejected("Server is busy", limiter.queue_timeout)
+
+
+def should_degrade(endpoint):
+    """混雑時は話者Aだけ・短い応答にする（縮退した場合は True）"""
+    if not LLM_MAX_CONCURRENCY or limiters['global'].load() < LLM_DEGRADE_AT:
+        return False
+    logger.warning("Serving %s in degraded mode (load %.2f)", endpoint, limiters['global'].load())
+    DEGRADED_TURNS.inc(endpoint=endpoint)
+    return True
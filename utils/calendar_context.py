@@ -0,0 +1,105 @@
+import logging
+import threading
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ['月', '火', '水', '木', '金', '土', '日']
+
+
+def _season_for(month, day):
+    """月日から (季節, 詳細な季節区分) を求める"""
+    if (month == 3 and day >= 21) or (month == 4) or (month == 5 and day <= 20):
+        return "春", ("春本番" if month == 4 else ("春始め" if month == 3 else "晩春"))
+    if (month == 5 and day >= 21) or (month == 6) or (month == 7 and day <= 20):
+        return "夏", ("夏本番" if month == 7 else ("初夏" if month == 5 else "梅雨"))
+    if (month == 7 and day >= 21) or (month == 8) or (month == 9 and day <= 20):
+        return "夏", ("真夏" if month == 8 else ("残暑" if month == 9 else "盛夏"))
+    if (month == 9 and day >= 21) or (month == 10) or (month == 11 and day <= 20):
+        return "秋", ("秋本番" if month == 10 else ("初秋" if month == 9 else "晩秋"))
+    if (month == 11 and day >= 21) or (month == 12) or (month == 1 and day <= 20):
+        return "冬", ("冬本番" if month == 12 else ("初冬" if month == 11 else "晩冬"))
+    return "冬", ("真冬" if month == 1 else ("厳冬" if month == 2 else "晩冬"))
+
+
+def _jst_now():
+    # pytz と jpholiday は初めて日時を求めるときに読み込む（起動を速くするため）
+    import pytz
+    return datetime.now(pytz.timezone('Asia/Tokyo'))
+
+
+def _time_of_day(hour):
+    if 5 <= hour < 12:
+        return "朝"
+    if 12 <= hour < 17:
+        return "昼"
+    if 17 <= hour < 22:
+        return "夕方"
+    return "夜"
+
+
+class CalendarContext:
+    """日本時間の日付・祝日・季節情報を提供する
+
+    祝日と季節は年単位で表にしておき（初回の now() で作る）、描画結果は分単位でメモ化する。
+    clock には日本時間の datetime を返す関数を渡せる（テスト用）。
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or _jst_now
+        self._lock = threading.Lock()
+        self._year = None
+        self._days = {}  # date -> (祝日名 or None, 季節, 詳細な季節区分)
+        self._minute_key = None
+        self._rendered = None
+
+    def _build_year(self, year):
+        """その年の祝日・季節の表を作る（ロック取得済みで呼ぶ）"""
+        import jpholiday
+        holidays = dict(jpholiday.year_holidays(year))
+        days = {}
+        current = date(year, 1, 1)
+        while current.year == year:
+            season, season_detail = _season_for(current.month, current.day)
+            days[current] = (holidays.get(current), season, season_detail)
+            current += timedelta(days=1)
+        self._year = year
+        self._days = days
+        logger.debug("Built calendar table for %s: %s holidays", year, len(holidays))
+
+    def _render(self, now):
+        holiday_name, season, season_detail = self._days[now.date()]
+        weekday = WEEKDAYS[now.weekday()]
+        return {
+            "date": f"{now.year}年{now.month}月{now.day}日（{weekday}）",
+            "time": f"{now.hour:02d}時{now.minute:02d}分",
+            "time_of_day": _time_of_day(now.hour),
+            "season": season,
+            "season_detail": season_detail,
+            "is_holiday": holiday_name is not None,
+            "holiday_name": holiday_name,
+            "full": f"{now.year}年{now.month}月{now.day}日（{weekday}） {now.hour:02d}時{now.minute:02d}分",
+            "raw": {
+                "year": now.year,
+                "month": now.month,
+                "day": now.day,
+                "weekday": weekday,
+                "hour": now.hour,
+                "minute": now.minute
+            }
+        }
+
+    def now(self):
+        """現在の日時情報を返す（同じ分の間は同じ辞書を共有するため、呼び出し側で変更しないこと）"""
+        now = self.clock()
+        minute_key = (now.year, now.month, now.day, now.hour, now.minute)
+        with self._lock:
+            if minute_key != self._minute_key:
+                if now.year != self._year:
+                    self._build_year(now.year)
+                self._rendered = self._render(now)
+                self._minute_key = minute_key
+            return self._rendered
+
+
+calendar_context = CalendarContext()
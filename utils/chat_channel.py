@@ -0,0 +1,98 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 常時接続のチャット（/ws）。flask-sock が必要で、スレッドを使うワーカーで動かす
+CHAT_WEBSOCKET = os.environ.get("CHAT_WEBSOCKET", "0") == "1"
+# 接続を保つための ping の間隔（秒）
+CHAT_WEBSOCKET_PING_SECONDS = float(os.environ.get("CHAT_WEBSOCKET_PING_SECONDS", "25"))
+
+
+class ChatChannel:
+    """WebSocket 1本分の送信口（合成スレッドからも送るのでロックする）"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def send(self, message_type, payload):
+        message = json.dumps({'type': message_type, **payload}, ensure_ascii=False)
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                self.ws.send(message)
+            except Exception as e:
+                logger.debug("WebSocket send failed, dropping channel: %s", e)
+                self.closed = True
+
+
+class TurnAudio:
+    """1ターン分の文ごとの音声の準備状況を追い、クライアントに知らせる
+
+    合成が終わった文から audio_ready を送る（文の順番は守る）。話者の文がすべて揃ったら
+    audio_end を、話者Aの分が揃った時点で話者Bを始めてよいことを cue で知らせる。
+    send(メッセージの種類, データ) は合成スレッドからも呼ばれる。
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self._lock = threading.Lock()
+        self._ready = {'A': {}, 'B': {}}
+        self._next = {'A': 0, 'B': 0}
+        self._durations = {'A': 0.0, 'B': 0.0}
+        self._totals = {}
+
+    def add(self, speaker, index, audio_url, future):
+        """合成を開始した文を登録する（future が None なら合成なしで知らせる）"""
+        if future is None:
+            self._done(speaker, index, audio_url, None)
+            return
+        # 取り消された合成（cancelled）は結果なしとして扱う
+        future.add_done_callback(lambda f: self._done(speaker, index, audio_url, f))
+
+    def end(self, speaker, sentences):
+        """話者のテキストが終わり、文の数が確定した"""
+        with self._lock:
+            self._totals[speaker] = sentences
+            messages = self._complete(speaker)
+        self._send(messages)
+
+    def _done(self, speaker, index, audio_url, future):
+        result = None
+        if future is not None and not future.cancelled() and future.exception() is None:
+            result = future.result()
+        with self._lock:
+            self._ready[speaker][index] = {
+                'speaker': speaker,
+                'index': index,
+                'audio_url': audio_url,
+                'duration': result['duration'] if result else None,
+                'timeline': result['timeline'] if result else None,
+            }
+            # 先の文が揃っている分だけ順に送る
+            messages = []
+            while self._next[speaker] in self._ready[speaker]:
+                ready = self._ready[speaker].pop(self._next[speaker])
+                self._durations[speaker] += ready['duration'] or 0.0
+                self._next[speaker] += 1
+                messages.append(('audio_ready', ready))
+            messages.extend(self._complete(speaker))
+        self._send(messages)
+
+    def _complete(self, speaker):
+        if self._totals.get(speaker) != self._next[speaker]:
+            return []
+        duration = round(self._durations[speaker], 3)
+        messages = [('audio_end', {'speaker': speaker, 'sentences': self._next[speaker], 'duration': duration})]
+        if speaker == 'A':
+            messages.append(('cue', {'speaker': 'B', 'after': 'A', 'after_seconds': duration}))
+        return messages
+
+    def _send(self, messages):
+        for message_type, payload in messages:
+            self.send(message_type, payload)
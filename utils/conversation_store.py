@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+from flask_sqlalchemy import SQLAlchemy
+
+from utils.keyword_matcher import message_keywords
+
+logger = logging.getLogger(__name__)
+
+# 会話履歴の保存設定
+CONVERSATION_STORE = os.environ.get("CONVERSATION_STORE", "memory")
+CONVERSATION_TTL_SECONDS = int(os.environ.get("CONVERSATION_TTL_SECONDS", str(24 * 60 * 60)))
+CONVERSATION_MAX_MESSAGES = int(os.environ.get("CONVERSATION_MAX_MESSAGES", "60"))
+CONVERSATION_MAX_SESSIONS = int(os.environ.get("CONVERSATION_MAX_SESSIONS", "10000"))
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///conversations.db")
+
+db = SQLAlchemy()
+
+
+class ConversationMessage(db.Model):
+    """会話履歴の1メッセージ"""
+    __tablename__ = 'conversation_messages'
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(64), index=True, nullable=False)
+    role = db.Column(db.String(16), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    keywords = db.Column(db.Text)  # 話題キーワード（JSON配列）
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True, nullable=False)
+
+
+class ConversationSummary(db.Model):
+    """履歴から外れた古い会話の要約（会話ごとに1行）"""
+    __tablename__ = 'conversation_summaries'
+
+    session_id = db.Column(db.String(64), primary_key=True)
+    text = db.Column(db.Text, nullable=False)
+    through = db.Column(db.Integer, nullable=False)  # 要約に含めた最後のメッセージID
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True, nullable=False)
+
+
+def _stored_message(msg):
+    """保存する形に揃える（話題キーワードは保存時に一度だけ抽出する）"""
+    return {'role': msg['role'], 'content': msg['content'], 'keywords': list(message_keywords(msg))}
+
+
+def _row_message(row):
+    message = {'role': row.role, 'content': row.content, 'seq': row.id}
+    if row.keywords is not None:
+        message['keywords'] = json.loads(row.keywords)
+    return message
+
+
+class MemoryConversationStore:
+    """プロセス内メモリに会話履歴を保持する（単一ワーカー向け）"""
+
+    def __init__(self, ttl_seconds=CONVERSATION_TTL_SECONDS, max_messages=CONVERSATION_MAX_MESSAGES, max_sessions=CONVERSATION_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # session_id -> (最終アクセス時刻, deque, 要約などの状態)
+
+    def _entry(self, session_id, create=False):
+        """期限切れを除いたエントリを返す（ロック取得済みで呼ぶ）"""
+        now = time.monotonic()
+        entry = self._sessions.get(session_id)
+        if entry is not None and now - entry[0] > self.ttl_seconds:
+            del self._sessions[session_id]
+            entry = None
+
+        if entry is None:
+            if not create:
+                return None
+            entry = (now, deque(maxlen=self.max_messages), {'next_seq': 1, 'summary': None})
+        else:
+            entry = (now, entry[1], entry[2])
+
+        self._sessions[session_id] = entry
+        self._sessions.move_to_end(session_id)
+
+        # セッション数の上限を超えたら最も古いものから破棄する
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return entry
+
+    def get_history(self, session_id):
+        with self._lock:
+            entry = self._entry(session_id)
+            return list(entry[1]) if entry else []
+
+    def append_messages(self, session_id, messages):
+        with self._lock:
+            entry = self._entry(session_id, create=True)
+            state = entry[2]
+            for msg in messages:
+                stored = _stored_message(msg)
+                stored['seq'] = state['next_seq']
+                state['next_seq'] += 1
+                entry[1].append(stored)
+
+    def get_summary(self, session_id):
+        """会話の要約 {'text', 'through'} を返す（なければ None）"""
+        with self._lock:
+            entry = self._entry(session_id)
+            return dict(entry[2]['summary']) if entry and entry[2]['summary'] else None
+
+    def set_summary(self, session_id, text, through):
+        """through 番までのメッセージを含む要約を保存する（古い要約では上書きしない）"""
+        with self._lock:
+            entry = self._entry(session_id)
+            if entry is None:
+                return
+            current = entry[2]['summary']
+            if current is None or through > current['through']:
+                entry[2]['summary'] = {'text': text, 'through': through}
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLConversationStore:
+    """SQLAlchemy（SQLite/PostgreSQL）に会話履歴を保存する（複数ワーカーで共有可能）"""
+
+    def __init__(self, app, ttl_seconds=CONVERSATION_TTL_SECONDS, max_messages=CONVERSATION_MAX_MESSAGES):
+        self.app = app
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        with app.app_context():
+            db.create_all()
+            # preload で fork するワーカーが接続を共有しないよう、起動時の接続は閉じておく
+            db.engine.dispose()
+
+    def _expired_before(self):
+        return datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+
+    def get_history(self, session_id):
+        # スレッドやイベントループからも呼べるよう、毎回アプリケーションコンテキストを張る
+        with self.app.app_context():
+            rows = (ConversationMessage.query
+                    .filter_by(session_id=session_id)
+                    .order_by(ConversationMessage.id.desc())
+                    .limit(self.max_messages)
+                    .all())
+            if rows and rows[0].created_at < self._expired_before():
+                # 最後の発言からTTLを過ぎたセッションは破棄する
+                self._delete(session_id)
+                return []
+            return [_row_message(row) for row in reversed(rows)]
+
+    def append_messages(self, session_id, messages):
+        with self.app.app_context():
+            for msg in messages:
+                stored = _stored_message(msg)
+                db.session.add(ConversationMessage(
+                    session_id=session_id,
+                    role=stored['role'],
+                    content=stored['content'],
+                    keywords=json.dumps(stored['keywords'], ensure_ascii=False)
+                ))
+            db.session.flush()
+
+            # 上限を超えた古い行を削除する
+            keep_from = (db.session.query(ConversationMessage.id)
+                         .filter_by(session_id=session_id)
+                         .order_by(ConversationMessage.id.desc())
+                         .offset(self.max_messages - 1)
+                         .limit(1)
+                         .scalar())
+            if keep_from is not None:
+                (ConversationMessage.query
+                 .filter(ConversationMessage.session_id == session_id, ConversationMessage.id < keep_from)
+                 .delete(synchronize_session=False))
+            db.session.commit()
+
+        # 期限切れの行はときどきまとめて掃除する
+        if random.random() < 0.01:
+            self.purge_expired()
+
+    def get_summary(self, session_id):
+        with self.app.app_context():
+            row = db.session.get(ConversationSummary, session_id)
+            return {'text': row.text, 'through': row.through} if row else None
+
+    def set_summary(self, session_id, text, through):
+        with self.app.app_context():
+            row = db.session.get(ConversationSummary, session_id)
+            if row is None:
+                db.session.add(ConversationSummary(session_id=session_id, text=text, through=through))
+            elif through > row.through:
+                row.text = text
+                row.through = through
+            db.session.commit()
+
+    def clear(self, session_id):
+        with self.app.app_context():
+            self._delete(session_id)
+
+    def _delete(self, session_id):
+        ConversationMessage.query.filter_by(session_id=session_id).delete(synchronize_session=False)
+        ConversationSummary.query.filter_by(session_id=session_id).delete(synchronize_session=False)
+        db.session.commit()
+
+    def purge_expired(self):
+        """TTLを過ぎた行をまとめて削除する"""
+        with self.app.app_context():
+            deleted = (ConversationMessage.query
+                       .filter(ConversationMessage.created_at < self._expired_before())
+                       .delete(synchronize_session=False))
+            (ConversationSummary.query
+             .filter(ConversationSummary.updated_at < self._expired_before())
+             .delete(synchronize_session=False))
+            db.session.commit()
+            return deleted
+
+
+def create_conversation_store(app):
+    """環境変数 CONVERSATION_STORE（memory / sql）に応じてストアを生成する"""
+    if CONVERSATION_STORE == "sql":
+        app.config.setdefault('SQLALCHEMY_DATABASE_URI', DATABASE_URL)
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {'pool_pre_ping': True})
+        db.init_app(app)
+        logger.info("Using SQL conversation store")
+        return SQLConversationStore(app)
+
+    logger.info("Using in-memory conversation store")
+    return MemoryConversationStore()
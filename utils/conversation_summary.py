@@ -0,0 +1,76 @@
+import os
+import logging
+import threading
+import contextvars
+
+from utils.history_window import HISTORY_TOKEN_BUDGET, history_tokens, select_recent_history, unsummarized
+from utils.openai_helper import summarize_conversation
+from utils.admission import AdmissionRejected, limiters, LLM_DEGRADE_AT
+from utils.metrics import span
+from utils.executors import LazyThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 古い会話の要約（0 で無効。その場合は予算に収まらない古い発言は単に使われない）
+HISTORY_SUMMARY = os.environ.get("HISTORY_SUMMARY", "1") != "0"
+
+# 未要約の履歴が予算のこの割合を超えたら要約し、新しい側の半分だけを残す
+# （次のターンで予算からあふれる前に要約が追いつくようにする）
+SUMMARIZE_AT = 0.75
+KEEP_RATIO = 0.5
+
+
+class ConversationSummarizer:
+    """応答を返した後に、履歴から外れる古い発言を会話ごとの要約に畳み込む"""
+
+    def __init__(self, budget=HISTORY_TOKEN_BUDGET, max_workers=2):
+        self.budget = budget
+        self._executor = LazyThreadPoolExecutor(max_workers, "summary")
+        self._lock = threading.Lock()
+        self._running = set()
+
+    def schedule(self, store, session_id):
+        """要約が必要なら裏で実行する（同じ会話の要約が実行中なら何もしない）"""
+        if not HISTORY_SUMMARY:
+            return
+        with self._lock:
+            if session_id in self._running:
+                return
+            self._running.add(session_id)
+        self._executor.submit(contextvars.copy_context().run, self._run, store, session_id)
+
+    def _run(self, store, session_id):
+        try:
+            self.summarize(store, session_id)
+        except AdmissionRejected as e:
+            logger.info("Skipped conversation summary while busy: %s", e)
+        except Exception as e:
+            logger.warning("Failed to summarize conversation: %s", e)
+        finally:
+            with self._lock:
+                self._running.discard(session_id)
+
+    def summarize(self, store, session_id):
+        """必要な場合だけ要約を更新する（更新したら True）"""
+        history = store.get_history(session_id)
+        summary = store.get_summary(session_id)
+        pending = unsummarized(history, summary)
+        if history_tokens(pending) <= self.budget * SUMMARIZE_AT:
+            return False
+        # 混雑中はユーザーへの応答を優先する
+        if limiters['global'].load() >= LLM_DEGRADE_AT:
+            return False
+
+        keep = select_recent_history(pending, int(self.budget * KEEP_RATIO))
+        fold = pending[:len(pending) - len(keep)]
+        if not fold or 'seq' not in fold[-1]:
+            return False
+
+        with span('summarize'):
+            text = summarize_conversation(summary['text'] if summary else None, fold)
+        store.set_summary(session_id, text, fold[-1]['seq'])
+        logger.debug("Folded %d messages into the conversation summary", len(fold))
+        return True
+
+
+summarizer = ConversationSummarizer()
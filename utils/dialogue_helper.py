@@ -0,0 +1,153 @@
+import random
+import logging
+
+from utils.openai_helper import CHARACTER_PROFILES
+
+logger = logging.getLogger(__name__)
+
+# キャラクター間の呼称マッピングを定義
+CHARACTER_NICKNAMES = {
+    # WhiteCUL から見た他のキャラクターの呼び方
+    ("WhiteCUL", "四国めたん"): "めたんちゃん",
+    ("WhiteCUL", "春日部つむぎ"): "つむぎ",
+    ("WhiteCUL", "雨晴はう"): "はうちゃん",
+
+    # 四国めたん から見た他のキャラクターの呼び方
+    ("四国めたん", "春日部つむぎ"): "つむぎさん",
+    ("四国めたん", "雨晴はう"): "はうさん",
+    ("四国めたん", "WhiteCUL"): "雪さん",
+
+    # 春日部つむぎ から見た他のキャラクターの呼び方
+    ("春日部つむぎ", "四国めたん"): "めたん先輩",
+    ("春日部つむぎ", "雨晴はう"): "はうちゃん",
+    ("春日部つむぎ", "WhiteCUL"): "雪さん",
+
+    # 雨晴はう から見た他のキャラクターの呼び方
+    ("雨晴はう", "四国めたん"): "めたんさん",
+    ("雨晴はう", "春日部つむぎ"): "つむぎちゃん",
+    ("雨晴はう", "WhiteCUL"): "ゆきさん",
+}
+
+def get_nickname(speaker_name, target_name):
+    """speaker_name から見た target_name の呼び方（表にない組み合わせは名前のまま）"""
+    return CHARACTER_NICKNAMES.get((speaker_name, target_name), target_name)
+
+
+def character_name(speaker_id, default):
+    profile = CHARACTER_PROFILES.get(speaker_id)
+    return profile['name'] if profile else default
+
+
+# ユーザーへの呼びかけ方（全パターン共通）
+SECOND_PERSON_INSTRUCTION = """重要：あなたがどのキャラクターであるかに応じて、ユーザーへの呼びかけ方を必ず守ってください：
+                - 四国めたんの場合は「アンタ」
+                - 雨晴はうの場合は「あなた」
+                - 春日部つむぎの場合は「きみ」
+                - WhiteCULの場合は「あなた」"""
+
+
+# 話者Aの回答を参照しないパターン
+INDEPENDENT_PATTERNS = frozenset({"C", "D"})
+
+
+def choose_response_pattern():
+    """話者Bの応答パターンを確率的に選択する
+
+    パターンA(30%): 話者Aの回答に同調
+    パターンB(10%): 話者Aの回答に反対
+    パターンC(40%): ユーザーの問いかけに独立して返答
+    パターンD(20%): 別の話題を提供
+    """
+    pattern_choice = random.random()
+    if pattern_choice < 0.3:
+        return "A"
+    elif pattern_choice < 0.4:
+        return "B"
+    elif pattern_choice < 0.8:
+        return "C"
+    return "D"
+
+
+def is_independent_pattern(pattern):
+    """話者Bの応答が話者Aの回答に依存しないパターンかどうか
+
+    パターンC（独立した返答）とD（別の話題）は話者Aのテキストを必要としないため、
+    話者Aと並行して生成できる。
+    """
+    return pattern in INDEPENDENT_PATTERNS
+
+
+def build_speaker_b_request(speaker_a, speaker_b, pattern):
+    """話者Bへの追加指示と話者A情報を組み立てる"""
+    speaker_a_name = character_name(speaker_a, "話者A")
+    speaker_b_name = character_name(speaker_b, "話者B")
+
+    # 適切な呼称を取得
+    speaker_a_nickname = get_nickname(speaker_b_name, speaker_a_name)
+
+    # 話者A情報を準備
+    speaker_a_info = {
+        'name': speaker_a_name,
+        'nickname': speaker_a_nickname
+    }
+
+    if pattern == "A":  # パターンA(30%): 同調
+        logger.debug("Using pattern A: Speaker B agrees with Speaker A")
+        instruction = f"""あなたは{speaker_a_nickname}の意見に同意または肯定する返答をしてください。
+                他のキャラクターとの会話では、{speaker_a_name}のことを「{speaker_a_nickname}」と呼んでください。
+                例: 「{speaker_a_nickname}の意見に賛成！」「{speaker_a_nickname}の考え方はいいね！」など
+                {speaker_a_nickname}の発言を引用しつつ、それに賛同する形で返答してください。
+
+                {SECOND_PERSON_INSTRUCTION}"""
+
+    elif pattern == "B":  # パターンB(10%): 反対
+        logger.debug("Using pattern B: Speaker B disagrees with Speaker A")
+        instruction = f"""あなたは{speaker_a_nickname}の意見に反対または異なる見解を述べる返答をしてください。
+                他のキャラクターとの会話では、{speaker_a_name}のことを「{speaker_a_nickname}」と呼んでください。
+                例: 「{speaker_a_nickname}と私の考えはちょっと違うかな～」「いや、私は～だと思うよ」など
+                {speaker_a_nickname}の発言を引用しつつ、それとは異なる視点や考えを丁寧に述べてください。
+
+                {SECOND_PERSON_INSTRUCTION}"""
+
+    elif pattern == "C":  # パターンC(40%): 独立した返答
+        logger.debug("Using pattern C: Speaker B gives independent response")
+        instruction = f"""あなたはユーザーの質問に独立して返答してください。
+                他のキャラクターとの会話が発生する場合は、{speaker_a_name}のことを「{speaker_a_nickname}」と呼んでください。
+                ユーザーの質問に直接答えることを主な目的としてください。
+
+                {SECOND_PERSON_INSTRUCTION}"""
+
+    else:  # パターンD(20%): 別の話題を提供
+        logger.debug("Using pattern D: Speaker B introduces a new topic")
+        instruction = f"""あなたはユーザーの質問とは少し離れた別の話題を提供してください。
+                他のキャラクターとの会話では、{speaker_a_name}のことを「{speaker_a_nickname}」と呼んでください。
+                例: 「ところでさ、～ってどう思う？」「その話もいいけど、私も最近思うことがあってさ」など
+                自然な会話の流れを損なわない程度に、新しい話題や視点を導入してください。
+                可能であれば、{speaker_a_nickname}に質問するような形で新しい話題を振ってみるのも良いでしょう。
+
+                {SECOND_PERSON_INSTRUCTION}"""
+
+    return instruction, speaker_a_info
+
+
+def build_exchange_instruction(speaker_a, speaker_b, pattern):
+    """話者A/Bをまとめて生成するときの指示（話者Bへのパターン別の指示と、お互いの呼び方）"""
+    instruction, speaker_a_info = build_speaker_b_request(speaker_a, speaker_b, pattern)
+    speaker_b_name = character_name(speaker_b, "話者B")
+    speaker_b_nickname = get_nickname(speaker_a_info['name'], speaker_b_name)
+
+    return f"""話者B（{speaker_b_name}）への指示:
+{instruction}
+
+話者A（{speaker_a_info['name']}）が{speaker_b_name}のことを話題に出す際は「{speaker_b_nickname}」と呼んでください。"""
+
+
+def build_room_members_instruction(speaker_id, members):
+    """ルームの参加者の一覧と、speaker_id から見たそれぞれの呼び方"""
+    speaker_name = character_name(speaker_id, "あなた")
+    member_names = [character_name(member, "他のキャラクター") for member in members if member != speaker_id]
+    member_list = "\n".join(f"- {name}（「{get_nickname(speaker_name, name)}」と呼ぶ）" for name in member_names)
+    return f"""この会話にはあなたの他に次のキャラクターが参加しています。話題に出す際や話しかける際は、それぞれ括弧内の呼び方を使ってください。
+{member_list}
+
+{SECOND_PERSON_INSTRUCTION}"""
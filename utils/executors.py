@@ -0,0 +1,40 @@
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+
+class LazyThreadPoolExecutor(Executor):
+    """初めて submit したときに ThreadPoolExecutor を作る
+
+    モジュールの読み込み時（preload ならマスタープロセス）にはスレッドプールを作らず、
+    fork した後のワーカーで初めて使うときに作る。fork 前に作られていても、子プロセスでは作り直す。
+    """
+
+    def __init__(self, max_workers, thread_name_prefix):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get(self):
+        executor = self._executor
+        if executor is not None and self._pid == os.getpid():
+            return executor
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.thread_name_prefix)
+                self._pid = os.getpid()
+            return self._executor
+
+    @property
+    def started(self):
+        """このプロセスでスレッドプールを作ったかどうか"""
+        return self._executor is not None and self._pid == os.getpid()
+
+    def submit(self, fn, /, *args, **kwargs):
+        return self._get().submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        if self.started:
+            self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
@@ -0,0 +1,48 @@
+import os
+
+# プロンプトに含める会話履歴のトークン数の目安（これを超える古い発言は要約に回す）
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "1500"))
+
+# 1メッセージあたりの役割やフォーマットの分
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    """トークン数の概算（日本語などの非ASCII文字は1文字≒1トークン、ASCIIは4文字≒1トークン）"""
+    ascii_chars = sum(1 for ch in text if ch < '\x80')
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def message_tokens(message):
+    return estimate_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_tokens(messages):
+    return sum(message_tokens(msg) for msg in messages)
+
+
+def unsummarized(conversation_history, summary=None):
+    """要約済み（seq が summary['through'] 以下）の発言を除いた履歴"""
+    through = summary['through'] if summary else 0
+    return [msg for msg in conversation_history if msg.get('seq', through + 1) > through]
+
+
+def select_recent_history(conversation_history, budget=HISTORY_TOKEN_BUDGET, summary=None):
+    """予算内に収まるだけ新しい順に発言を詰め、古い順に並べて返す
+
+    要約済みの発言は含めない。最新の1件は予算を超えても含め、
+    先頭はユーザーの発言から始まるようにする。
+    """
+    selected = []
+    total = 0
+    for msg in reversed(unsummarized(conversation_history, summary)):
+        cost = message_tokens(msg)
+        if selected and total + cost > budget:
+            break
+        selected.append(msg)
+        total += cost
+    selected.reverse()
+
+    while len(selected) > 1 and selected[0]['role'] != 'user':
+        selected.pop(0)
+    return selected
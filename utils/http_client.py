@@ -0,0 +1,144 @@
+import os
+import time
+import random
+import asyncio
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# 再試行の対象とするステータスコード
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+def _env(prefix, name, default, cast=float):
+    """{PREFIX}_{NAME} → LLM_{NAME} → 既定値 の順に設定を読む"""
+    for key in (f"{prefix}_{name}", f"LLM_{name}"):
+        value = os.environ.get(key)
+        if value:
+            return cast(value)
+    return default
+
+
+def load_provider_settings(prefix):
+    """プロバイダごとの接続設定を環境変数から読み込む"""
+    return {
+        'connect_timeout': _env(prefix, 'CONNECT_TIMEOUT', 5.0),
+        'read_timeout': _env(prefix, 'READ_TIMEOUT', 60.0),
+        'max_retries': _env(prefix, 'MAX_RETRIES', 2, int),
+        'backoff_base': _env(prefix, 'BACKOFF_BASE', 0.5),
+        'backoff_max': _env(prefix, 'BACKOFF_MAX', 8.0),
+        'pool_size': _env(prefix, 'POOL_SIZE', 10, int),
+    }
+
+
+def _backoff_delay(attempt, backoff_base, backoff_max, retry_after=None):
+    """再試行までの待ち時間（Retry-After を優先し、なければフルジッター）"""
+    if retry_after:
+        try:
+            return min(float(retry_after), backoff_max)
+        except ValueError:
+            pass
+    return random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt)))
+
+
+class ProviderHTTPClient:
+    """接続プールを共有し、タイムアウトとジッターつき再試行を行うHTTPクライアント"""
+
+    def __init__(self, name, base_url, connect_timeout=5.0, read_timeout=60.0, max_retries=2,
+                 backoff_base=0.5, backoff_max=8.0, pool_size=10):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # Keep-Alive で接続を使い回す（再試行は自前で行うため urllib3 側は無効）
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        return _backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after)
+
+    def post(self, path, headers=None, json=None, stream=False):
+        """POSTリクエストを送る。429/5xx と接続エラーは上限回数まで再試行する
+
+        応答待ちのタイムアウト（ReadTimeout）は再試行しない。相手は生成を続けているかもしれず、
+        再試行すると同じ生成をもう一度待つことになり、待ち時間が (max_retries + 1) 倍まで延びる。
+        """
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self.session.post(url, headers=headers, json=json, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.ConnectTimeout) as e:
+                elapsed = time.perf_counter() - started
+                logger.warning("%s request failed after %.3fs (attempt %s): %s", self.name, elapsed, attempt + 1, e)
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+
+            elapsed = time.perf_counter() - started
+            response.provider_elapsed = elapsed
+            logger.debug("%s request %s -> %s in %.3fs (attempt %s)", self.name, path, response.status_code, elapsed, attempt + 1)
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._backoff(attempt, response)
+                logger.warning("%s returned %s, retrying in %.2fs", self.name, response.status_code, delay)
+                response.close()
+                time.sleep(delay)
+                continue
+
+            return response
+
+
+class AsyncProviderHTTPClient:
+    """ProviderHTTPClient の非同期版（httpx.AsyncClient の接続プールを共有する）"""
+
+    def __init__(self, name, base_url, connect_timeout=5.0, read_timeout=60.0, max_retries=2,
+                 backoff_base=0.5, backoff_max=8.0, pool_size=10):
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # httpx は非同期モードでしか使わないので、初めてクライアントを作るときに読み込む
+        import httpx
+        # ProviderHTTPClient と同じく、再試行するのは接続できなかった場合だけ
+        self._connection_errors = (httpx.ConnectError, httpx.ConnectTimeout)
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def post(self, path, headers=None, json=None):
+        """POSTリクエストを送る。429/5xx と接続エラーは上限回数まで再試行する（応答待ちのタイムアウトは再試行しない）"""
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = await self.client.post(path, headers=headers, json=json)
+            except self._connection_errors as e:
+                elapsed = time.perf_counter() - started
+                logger.warning("%s request failed after %.3fs (attempt %s): %s", self.name, elapsed, attempt + 1, e)
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(_backoff_delay(attempt, self.backoff_base, self.backoff_max))
+                continue
+
+            elapsed = time.perf_counter() - started
+            logger.debug("%s request %s -> %s in %.3fs (attempt %s)", self.name, path, response.status_code, elapsed, attempt + 1)
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = _backoff_delay(attempt, self.backoff_base, self.backoff_max, response.headers.get('Retry-After'))
+                logger.warning("%s returned %s, retrying in %.2fs", self.name, response.status_code, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            return response
@@ -0,0 +1,121 @@
+import os
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# 話題キーワードの語彙ファイル（1行1語、# 以降はコメント）
+TOPIC_VOCABULARY_FILE = os.environ.get(
+    "TOPIC_VOCABULARY_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "attached_assets", "topic_keywords.txt")
+)
+
+# 語彙ファイルが読めない場合に使う最小限の語彙
+DEFAULT_TOPIC_WORDS = [
+    '仕事', '在宅', 'ワーク', '勉強', '学校', '料理', 'カレー', 'ラーメン',
+    '動画', '配信', 'YouTube', '漫画', 'アニメ', '映画', '音楽',
+    '買い物', 'コンビニ', 'セール', '節約', 'お金',
+    '天気', '雨', '梅雨', '暑い', '寒い',
+    '趣味', '読書', 'ゲーム', 'スポーツ',
+    '健康', '疲れ', '休憩', '睡眠'
+]
+
+# 相手に問いかけているとみなす表現
+QUESTION_PATTERNS = ['？', '?', '興味', 'どう', 'どんな', 'ある？', 'ない？', 'どっち', '知ってる']
+
+
+class KeywordMatcher:
+    """複数のキーワードをテキストの1回の走査で検出する（Aho-Corasick法）"""
+
+    def __init__(self, words):
+        self.words = list(dict.fromkeys(word for word in words if word))
+        self._goto = [{}]      # 状態 -> {文字: 次の状態}
+        self._fail = [0]       # 状態 -> 失敗時の遷移先
+        self._output = [[]]    # 状態 -> その状態で一致が確定する語のインデックス
+        for index, word in enumerate(self.words):
+            self._add(word, index)
+        self._build_failure_links()
+
+    def _add(self, word, index):
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append(index)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # 失敗先で確定する語も、この状態で一致したものとして扱う
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def _scan(self, text):
+        state = 0
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                yield output[state]
+
+    def find(self, text):
+        """テキストに含まれるキーワードを、出現順に重複なく返す"""
+        found = {}
+        for indices in self._scan(text):
+            for index in indices:
+                found.setdefault(index, None)
+        return [self.words[index] for index in found]
+
+    def contains_any(self, text):
+        """いずれかのキーワードを含むかどうか"""
+        for _ in self._scan(text):
+            return True
+        return False
+
+    def __len__(self):
+        return len(self.words)
+
+
+def load_vocabulary(path):
+    """語彙ファイルを読み込む。読めない場合は既定の語彙を返す"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            words = [line.split('#', 1)[0].strip() for line in f]
+    except OSError as e:
+        logger.warning("Could not read topic vocabulary %s: %s; using defaults", path, e)
+        return list(DEFAULT_TOPIC_WORDS)
+    return [word for word in words if word]
+
+
+topic_matcher = KeywordMatcher(load_vocabulary(TOPIC_VOCABULARY_FILE))
+question_matcher = KeywordMatcher(QUESTION_PATTERNS)
+logger.info("Loaded topic vocabulary: %s words", len(topic_matcher))
+
+
+def message_keywords(message):
+    """発言の話題キーワードを返す
+
+    結果は発言の 'keywords' に保存され、会話履歴と一緒に保持されるため、
+    同じ発言を再び走査することはない。
+    """
+    keywords = message.get('keywords')
+    if keywords is None:
+        keywords = topic_matcher.find(message['content'])
+        message['keywords'] = keywords
+    return keywords
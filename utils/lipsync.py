@@ -0,0 +1,174 @@
+import io
+import os
+import json
+import wave
+import shutil
+import logging
+import subprocess
+
+import numpy as np
+
+from utils.tts_helper import audio_cache
+
+logger = logging.getLogger(__name__)
+
+# 口の開き具合のタイムライン（1秒あたりのフレーム数）。0 で無効（クライアント側の解析に戻る）
+LIPSYNC_FPS = int(os.environ.get("LIPSYNC_FPS", "25"))
+# MP3 のデコードに使う ffmpeg（見つからなければ WAV だけ対応）
+LIPSYNC_FFMPEG = os.environ.get("LIPSYNC_FFMPEG", "ffmpeg")
+# 起動時に1回だけ探す（見つからなければ None）
+FFMPEG_PATH = shutil.which(LIPSYNC_FFMPEG)
+
+# タイムラインの値（0〜3）に対応する口の画像（<prefix>_mouse_<状態>.png）
+MOUTH_FRAMES = ['close', 'close_middle', 'open_middle', 'open']
+
+DECODE_SAMPLE_RATE = 16000
+# 発話の大きさの基準（クリップ内のRMSのこの百分位数）と、それ以下を無音とみなすRMS
+REFERENCE_PERCENTILE = 95
+SILENCE_RMS = 0.01
+# 基準に対する割合で4段階に分ける
+MOUTH_THRESHOLDS = [0.2, 0.45, 0.7]
+
+
+def decode_wav(data):
+    """WAV（PCM）をモノラルの float32 配列とサンプリングレートにする"""
+    with wave.open(io.BytesIO(data)) as f:
+        width = f.getsampwidth()
+        channels = f.getnchannels()
+        rate = f.getframerate()
+        frames = f.readframes(f.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise Exception(f"Unsupported WAV sample width: {width}")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, rate
+
+
+def is_wav(data):
+    return data[:4] == b'RIFF' and data[8:12] == b'WAVE'
+
+
+def can_decode(data):
+    """タイムラインを計算できる音声か（WAV か、ffmpeg があれば MP3 なども）"""
+    return FFMPEG_PATH is not None or is_wav(data)
+
+
+def decode_with_ffmpeg(data):
+    """ffmpeg で MP3 などをデコードする"""
+    if not FFMPEG_PATH:
+        raise Exception("ffmpeg is required to decode compressed audio")
+    result = subprocess.run(
+        [FFMPEG_PATH, '-v', 'error', '-i', 'pipe:0', '-f', 's16le', '-ac', '1', '-ar', str(DECODE_SAMPLE_RATE), 'pipe:1'],
+        input=data, capture_output=True, timeout=30
+    )
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return np.frombuffer(result.stdout, dtype='<i2').astype(np.float32) / 32768, DECODE_SAMPLE_RATE
+
+
+def decode_audio(data):
+    if is_wav(data):
+        return decode_wav(data)
+    return decode_with_ffmpeg(data)
+
+
+# MP3（Layer III）のフレームヘッダーの値
+MP3_BITRATES = {
+    'mpeg1': [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    'mpeg2': [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def mp3_duration(data):
+    """MP3のフレームを数えて再生時間（秒）を求める（VBRでもよい。解析できなければ None）"""
+    pos = 0
+    if data[:3] == b'ID3' and len(data) >= 10:
+        pos = 10 + ((data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9])
+    frames = 0
+    seconds = 0.0
+    while pos + 4 <= len(data):
+        b1, b2 = data[pos + 1], data[pos + 2]
+        version = (b1 >> 3) & 3
+        if data[pos] != 0xFF or (b1 & 0xE0) != 0xE0 or version == 1 or ((b1 >> 1) & 3) != 1:
+            break
+        bitrate = MP3_BITRATES['mpeg1' if version == 3 else 'mpeg2'][b2 >> 4]
+        sr_index = (b2 >> 2) & 3
+        if not bitrate or sr_index == 3:
+            break
+        rate = MP3_SAMPLE_RATES[version][sr_index]
+        samples = 1152 if version == 3 else 576
+        pos += samples // 8 * 1000 * bitrate // rate + ((b2 >> 1) & 1)
+        seconds += samples / rate
+        frames += 1
+    return seconds if frames else None
+
+
+def audio_duration(audio, timeline=None):
+    """音声の再生時間（秒）。タイムラインがあればその長さ、なければヘッダーから求める"""
+    if timeline:
+        return len(timeline['frames']) / timeline['fps']
+    if is_wav(audio):
+        try:
+            with wave.open(io.BytesIO(audio)) as f:
+                return f.getnframes() / f.getframerate()
+        except (wave.Error, EOFError):
+            return None
+    return mp3_duration(audio)
+
+
+def mouth_timeline(samples, rate, fps=LIPSYNC_FPS):
+    """フレームごとのRMSを求め、口の開き具合（0〜3）の配列にする"""
+    hop = rate / fps
+    count = int(np.ceil(len(samples) / hop)) if len(samples) else 0
+    if count == 0:
+        return np.zeros(0, dtype=np.uint8)
+
+    # 各フレームの区間 [starts[i], starts[i+1]) の二乗和を累積和からまとめて求める
+    starts = np.minimum((np.arange(count + 1) * hop).astype(np.int64), len(samples))
+    energy = np.concatenate(([0.0], np.cumsum(samples.astype(np.float64) ** 2)))
+    lengths = np.maximum(np.diff(starts), 1)
+    rms = np.sqrt((energy[starts[1:]] - energy[starts[:-1]]) / lengths)
+
+    # 1フレームだけのばたつきを抑える
+    if count >= 3:
+        rms = np.convolve(rms, [0.25, 0.5, 0.25], mode='same')
+
+    voiced = rms[rms > SILENCE_RMS]
+    if not len(voiced):
+        return np.zeros(count, dtype=np.uint8)
+    reference = np.percentile(voiced, REFERENCE_PERCENTILE)
+    levels = np.digitize(rms / reference, MOUTH_THRESHOLDS).astype(np.uint8)
+    levels[rms <= SILENCE_RMS] = 0
+    return levels
+
+
+def compute_timeline(audio, fps=LIPSYNC_FPS):
+    """音声のバイト列から {'fps', 'frames'} を作る（frames は 0〜3 の数字を並べた文字列）"""
+    samples, rate = decode_audio(audio)
+    levels = mouth_timeline(samples, rate, fps)
+    return {'fps': fps, 'frames': ''.join(map(str, levels.tolist()))}
+
+
+def get_lipsync_timeline(key, audio):
+    """音声（キャッシュキー key）のタイムラインを返す。音声と同じキャッシュに保存する
+
+    ffmpeg がなく MP3 をデコードできない場合は None（クライアント側の音声解析に任せる）。
+    """
+    if not LIPSYNC_FPS or not can_decode(audio):
+        return None
+    data = audio_cache.get_or_create(
+        f"{key}.lipsync{LIPSYNC_FPS}",
+        lambda: json.dumps(compute_timeline(audio)).encode('utf-8')
+    )
+    return json.loads(data)
+
+
+if LIPSYNC_FPS and not FFMPEG_PATH:
+    logger.warning("ffmpeg not found (%s), lip-sync timelines are only computed for WAV audio", LIPSYNC_FFMPEG)
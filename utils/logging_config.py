@@ -0,0 +1,197 @@
+import os
+import re
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import contextvars
+import logging.handlers
+from datetime import datetime, timezone
+from collections.abc import Mapping
+
+# ログ設定
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # json / text
+# プロンプトや応答本文のログを出す割合（例: "0.01" または "chat=0.05,chat_stream=0.01,*=0"）
+LOG_PAYLOAD_SAMPLE_RATE = os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", "0")
+# 本文ログでユーザーや応答のテキストを伏せる（0 で無効）
+LOG_REDACT_TEXT = os.environ.get("LOG_REDACT_TEXT", "1") != "0"
+
+# APIキーやトークンらしき文字列
+SECRET_PATTERN = re.compile(r'(sk-(?:ant-)?[A-Za-z0-9_\-]{8,}|Bearer\s+[A-Za-z0-9._\-]{8,})')
+# 本文ログで伏せるキー
+TEXT_KEYS = frozenset({'content', 'text', 'message', 'question', 'answer', 'system'})
+
+# LogRecord の標準属性（これ以外は extra としてJSONに含める）
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_payload_sampled = contextvars.ContextVar('payload_sampled', default=False)
+_listener = None
+
+
+def _parse_sample_rates(spec):
+    rates = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        route, sep, rate = item.rpartition('=')
+        rates[route if sep else '*'] = float(rate)
+    return rates
+
+
+PAYLOAD_SAMPLE_RATES = _parse_sample_rates(LOG_PAYLOAD_SAMPLE_RATE)
+
+
+def redact_secrets(text):
+    return SECRET_PATTERN.sub('<redacted>', text)
+
+
+def redact_payload(value, is_text=True):
+    """本文ログ用に会話テキストを伏せる（長さだけ残す）。role などの短い値はそのまま"""
+    if isinstance(value, dict):
+        return {key: redact_payload(item, key in TEXT_KEYS) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact_payload(item, is_text) for item in value]
+    if isinstance(value, str):
+        if LOG_REDACT_TEXT and is_text:
+            return f"<{len(value)} chars>"
+        return redact_secrets(value)
+    return value
+
+
+class RedactingFilter(logging.Filter):
+    """メッセージに含まれるAPIキーを伏せる（出力スレッドのハンドラーで動かす）"""
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = redact_secrets(message)
+        if redacted != message:
+            record.msg = redacted
+            record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1レコードのJSON形式"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _LazyPayload:
+    """実際に出力されるときだけ伏せ字処理とJSON化を行う"""
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        return json.dumps(redact_payload(self.payload), ensure_ascii=False, default=str)
+
+
+# 写し取らずにそのまま渡せる値
+_IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def _snapshot(value):
+    """ログの引数を、後から変更されても出力が変わらないように写し取る（文字列にはしない）"""
+    if isinstance(value, _IMMUTABLE_TYPES):
+        return value
+    if isinstance(value, _LazyPayload):
+        return _LazyPayload(_snapshot(value.payload))
+    if isinstance(value, (list, dict, set, tuple)):
+        try:
+            return copy.deepcopy(value)
+        except Exception:
+            return value
+    return value
+
+
+class SnapshotQueueHandler(logging.handlers.QueueHandler):
+    """レコードを整形せずにキューに積む
+
+    QueueHandler.prepare は呼び出し側のスレッドでメッセージを組み立てるので、引数を写し取るだけにする。
+    メッセージの組み立て・伏せ字処理・JSON化はすべて出力スレッド（QueueListener）で行う。
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if isinstance(record.args, Mapping):
+            record.args = {key: _snapshot(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(_snapshot(arg) for arg in record.args)
+        return record
+
+
+def begin_request_sampling(route):
+    """このリクエストで本文ログを出すかどうかをルートごとの割合で決める"""
+    rate = PAYLOAD_SAMPLE_RATES.get(route, PAYLOAD_SAMPLE_RATES.get('*', 0.0))
+    _payload_sampled.set(rate > 0 and random.random() < rate)
+
+
+def log_payload(logger, label, payload):
+    """プロンプトや応答本文をDEBUGで記録する（サンプリング対象のリクエストのみ）"""
+    if _payload_sampled.get() and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s: %s", label, _LazyPayload(payload))
+
+
+def setup_logging():
+    """ルートロガーをキュー経由の非同期出力に設定する（複数回呼んでも1回だけ）"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    # リクエスト処理スレッドは引数を写し取ってキューに積むだけで、整形・伏せ字処理・書き込みは専用スレッドが行う
+    log_queue = queue.SimpleQueue()
+    queue_handler = SnapshotQueueHandler(log_queue)
+    stream_handler.addFilter(RedactingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    # 外部ライブラリの詳細ログは抑える
+    for name in ('urllib3', 'httpx', 'httpcore', 'anthropic'):
+        logging.getLogger(name).setLevel(max(logging.INFO, root.level))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+    # 出力スレッドは fork で引き継がれない（preload のワーカーなど）。fork の前にキューを
+    # 書き出して止め、親と子のそれぞれで作り直す
+    os.register_at_fork(before=_stop_listener, after_in_parent=_restart_listener,
+                        after_in_child=_restart_listener)
+
+
+def _restart_listener():
+    global _listener
+    _listener = logging.handlers.QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener._thread is not None:
+        _listener.stop()
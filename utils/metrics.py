@@ -0,0 +1,175 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# レイテンシ用の既定バケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """メトリクスを保持し、Prometheusのテキスト形式で出力する"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        return ''.join(metric.render() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    """単調増加するカウンター"""
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class Histogram:
+    """累積バケットつきのヒストグラム"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}  # ラベル -> [バケットごとの件数, 合計, 件数]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = entry
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+# アプリケーションのメトリクス
+STAGE_SECONDS = Histogram(
+    'chat_stage_seconds', 'Time spent in each stage of a chat turn', ['stage']
+)
+LLM_REQUEST_SECONDS = Histogram(
+    'llm_request_seconds', 'LLM request latency (time to full response, or to first token for streams)', ['provider', 'mode']
+)
+LLM_ERRORS = Counter(
+    'llm_errors_total', 'LLM provider errors', ['provider', 'mode']
+)
+LLM_FALLBACKS = Counter(
+    'llm_fallbacks_total', 'Requests that fell back from one provider to another', ['from_provider', 'to_provider', 'reason']
+)
+EXCHANGE_FALLBACKS = Counter(
+    'chat_exchange_fallbacks_total', 'Joint A/B exchanges that fell back to separate calls', ['reason']
+)
+LLM_TOKENS = Counter(
+    'llm_tokens_total', 'LLM token usage by character', ['provider', 'speaker_id', 'kind']
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_seconds', 'HTTP request latency by endpoint and status (until the response starts)', ['endpoint', 'status']
+)
+
+
+@contextmanager
+def span(stage):
+    """処理段階の所要時間を chat_stage_seconds に記録する"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        logger.debug("Stage %s took %.3fs", stage, elapsed)
+
+
+def record_usage(provider, speaker_id, usage):
+    """トークン使用量をキャラクター別に加算する"""
+    for kind in ('prompt_tokens', 'completion_tokens', 'cached_tokens', 'cache_creation_tokens'):
+        amount = usage.get(kind) or 0
+        if amount:
+            LLM_TOKENS.inc(amount, provider=provider, speaker_id=speaker_id or 'unknown', kind=kind[:-len('_tokens')])
+
+
+def render_metrics():
+    """/metrics 用のテキストを返す"""
+    return REGISTRY.render()
@@ -0,0 +1,349 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from utils.metrics import Counter, LLM_ERRORS, LLM_FALLBACKS
+from utils.admission import AdmissionRejected
+from utils.executors import LazyThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# サーキットブレーカー: 連続 N 回失敗したプロバイダを一定時間スキップする
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+# ヘッジ: 1つ目のプロバイダがこの秒数内に応答（ストリーミングは最初のトークン）を返さなければ
+# 2つ目にも同時に問い合わせ、先に返した方を使う（0 で無効）
+LLM_HEDGE_AFTER_SECONDS = float(os.environ.get("LLM_HEDGE_AFTER_SECONDS", "0"))
+LLM_HEDGE_WORKERS = int(os.environ.get("LLM_HEDGE_WORKERS", "16"))
+
+BREAKER_TRANSITIONS = Counter(
+    'llm_breaker_transitions_total', 'Circuit breaker state changes', ['provider', 'state']
+)
+
+hedge_executor = LazyThreadPoolExecutor(LLM_HEDGE_WORKERS, "hedge")
+
+
+class CircuitBreaker:
+    """プロバイダごとのサーキットブレーカー（closed → open → half_open → closed）"""
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def _transition(self, state):
+        if self._state != state:
+            logger.warning("Circuit breaker for %s: %s -> %s", self.name, self._state, state)
+            self._state = state
+            BREAKER_TRANSITIONS.inc(provider=self.name, state=state)
+
+    def allow(self):
+        """このプロバイダに問い合わせてよいか。open 中でも待ち時間を過ぎれば1件だけ試す"""
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open':
+                return time.monotonic() - self._opened_at >= self.reset_timeout
+            return not self._probe_in_flight
+
+    def begin(self):
+        """問い合わせの開始を記録する（open の待ち時間を過ぎていれば試行中の half_open にする）"""
+        with self._lock:
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._transition('half_open')
+            if self._state == 'half_open':
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._transition('closed')
+
+    def record_skipped(self):
+        """混雑で呼び出さなかった場合（成功・失敗のどちらにも数えない）"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._transition('open')
+
+
+breakers = {
+    'anthropic': CircuitBreaker('anthropic'),
+    'openai': CircuitBreaker('openai'),
+}
+
+
+def _candidates(attempts):
+    """ブレーカーが閉じているプロバイダを優先順に返す（全て open なら先頭だけ試す）"""
+    allowed = [attempt for attempt in attempts if breakers[attempt[0]].allow()]
+    if not allowed:
+        logger.warning("All provider circuits are open; trying %s anyway", attempts[0][0])
+        return attempts[:1]
+    if allowed[0][0] != attempts[0][0]:
+        logger.warning("Circuit for %s is open; using %s", attempts[0][0], allowed[0][0])
+        LLM_FALLBACKS.inc(from_provider=attempts[0][0], to_provider=allowed[0][0], reason='circuit_open')
+    return allowed
+
+
+def _record(provider, mode, error=None):
+    if error is None:
+        breakers[provider].record_success()
+    elif isinstance(error, AdmissionRejected):
+        # 自分側の混雑による拒否はプロバイダの障害ではない
+        breakers[provider].record_skipped()
+    else:
+        breakers[provider].record_failure()
+        LLM_ERRORS.inc(provider=provider, mode=mode)
+
+
+def _fallback_reason(error):
+    return 'saturated' if isinstance(error, AdmissionRejected) else 'error'
+
+
+def _fallback_error(errors):
+    rejected = [error for _, error in errors if isinstance(error, AdmissionRejected)]
+    if errors and len(rejected) == len(errors):
+        # 全プロバイダが混雑で拒否した場合は 503 として返せるようそのまま送出する
+        return min(rejected, key=lambda error: error.retry_after)
+    details = '; '.join(f"{name}: {error}" for name, error in errors)
+    return Exception(f"All LLM providers failed ({details})")
+
+
+def call_with_resilience(attempts, mode='sync', hedge_after=LLM_HEDGE_AFTER_SECONDS):
+    """(プロバイダ名, 関数) のリストを優先順に試し、最初に成功した結果を返す"""
+    candidates = _candidates(attempts)
+    errors = []
+
+    if hedge_after and len(candidates) > 1:
+        return _hedged_call(candidates[:2], mode, hedge_after)
+
+    for index, (name, call) in enumerate(candidates):
+        breakers[name].begin()
+        try:
+            result = call()
+        except Exception as e:
+            logger.warning("%s request failed: %s", name, e)
+            _record(name, mode, e)
+            errors.append((name, e))
+            if index + 1 < len(candidates):
+                LLM_FALLBACKS.inc(from_provider=name, to_provider=candidates[index + 1][0], reason=_fallback_reason(e))
+            continue
+        _record(name, mode)
+        return result
+    raise _fallback_error(errors)
+
+
+def _hedged_call(candidates, mode, hedge_after):
+    (primary_name, primary), (secondary_name, secondary) = candidates
+
+    def run(name, call):
+        breakers[name].begin()
+        try:
+            result = call()
+        except Exception as e:
+            _record(name, mode, e)
+            raise
+        _record(name, mode)
+        return result
+
+    context = contextvars.copy_context()
+    futures = {hedge_executor.submit(context.copy().run, run, primary_name, primary): primary_name}
+    done, _ = wait(futures, timeout=hedge_after)
+    if not done or next(iter(done)).exception() is not None:
+        reason = 'hedge' if not done else 'error'
+        logger.info("Starting %s request (%s after %s)", secondary_name, reason, primary_name)
+        LLM_FALLBACKS.inc(from_provider=primary_name, to_provider=secondary_name, reason=reason)
+        futures[hedge_executor.submit(context.copy().run, run, secondary_name, secondary)] = secondary_name
+
+    errors = []
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # 遅れた方の結果は捨てる（スレッドは完了まで走るが応答には影響しない）
+                return future.result()
+            errors.append((futures[future], future.exception()))
+    raise _fallback_error(errors)
+
+
+def stream_with_resilience(attempts, mode='stream', hedge_after=LLM_HEDGE_AFTER_SECONDS):
+    """(プロバイダ名, ジェネレータ関数) のリストを優先順に試し、テキスト差分を順に返す
+
+    最初のトークンを返す前に失敗した場合だけ次のプロバイダに切り替える
+    （途中まで送出した後に切り替えると文章が重複するため）。
+    """
+    candidates = _candidates(attempts)
+    if hedge_after and len(candidates) > 1:
+        yield from _hedged_stream(candidates[:2], mode, hedge_after)
+        return
+
+    errors = []
+    for index, (name, factory) in enumerate(candidates):
+        emitted = False
+        breakers[name].begin()
+        try:
+            for delta in factory():
+                emitted = True
+                yield delta
+        except Exception as e:
+            _record(name, mode, e)
+            if emitted:
+                logger.error("%s stream interrupted: %s", name, e)
+                raise Exception(f"Failed to stream {name} response: {e}")
+            logger.warning("%s stream failed before first token: %s", name, e)
+            errors.append((name, e))
+            if index + 1 < len(candidates):
+                LLM_FALLBACKS.inc(from_provider=name, to_provider=candidates[index + 1][0], reason=_fallback_reason(e))
+            continue
+        _record(name, mode)
+        return
+    raise _fallback_error(errors)
+
+
+def _hedged_stream(candidates, mode, hedge_after):
+    """最初のトークンが先に届いたストリームを採用し、もう一方は読み捨てて止める"""
+    events = queue.Queue()
+    stop = {name: threading.Event() for name, _ in candidates}
+
+    def pump(name, factory):
+        breakers[name].begin()
+        try:
+            for delta in factory():
+                if stop[name].is_set():
+                    break
+                events.put((name, delta, None))
+        except Exception as e:
+            _record(name, mode, e)
+            events.put((name, None, e))
+            return
+        if not stop[name].is_set():
+            _record(name, mode)
+        events.put((name, None, None))
+
+    (primary_name, primary), (secondary_name, secondary) = candidates
+    context = contextvars.copy_context()
+    hedge_executor.submit(context.copy().run, pump, primary_name, primary)
+    started = {primary_name}
+    deadline = time.monotonic() + hedge_after
+    chosen = None
+    errors = []
+
+    try:
+        while True:
+            # まだ採用先が決まっていなければ、ヘッジの期限まで待つ
+            hedge_pending = chosen is None and secondary_name not in started
+            timeout = max(0.0, deadline - time.monotonic()) if hedge_pending else None
+            try:
+                name, delta, error = events.get(timeout=timeout)
+            except queue.Empty:
+                name, delta, error = None, None, None
+
+            if hedge_pending and (name is None or error is not None):
+                reason = 'hedge' if name is None else 'error'
+                logger.info("Starting %s stream (%s after %s)", secondary_name, reason, primary_name)
+                LLM_FALLBACKS.inc(from_provider=primary_name, to_provider=secondary_name, reason=reason)
+                hedge_executor.submit(context.copy().run, pump, secondary_name, secondary)
+                started.add(secondary_name)
+            if name is None:
+                continue
+
+            if chosen is None:
+                if error is not None:
+                    errors.append((name, error))
+                    if len(errors) == len(started) == len(candidates):
+                        raise _fallback_error(errors)
+                    continue
+                if delta is None:
+                    # 何も返さずに正常終了したストリーム
+                    chosen = name
+                    return
+                chosen = name
+                for other in stop:
+                    if other != chosen:
+                        stop[other].set()
+                logger.debug("Hedged stream chose %s", chosen)
+
+            if name != chosen:
+                continue
+            if error is not None:
+                raise Exception(f"Failed to stream {name} response: {error}")
+            if delta is None:
+                return
+            yield delta
+    finally:
+        for event in stop.values():
+            event.set()
+
+
+async def call_with_resilience_async(attempts, mode='async', hedge_after=LLM_HEDGE_AFTER_SECONDS):
+    """call_with_resilience の非同期版（(プロバイダ名, コルーチン関数) のリスト）。遅れた方はキャンセルする"""
+    candidates = _candidates(attempts)
+    errors = []
+
+    async def run(name, call):
+        breakers[name].begin()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _record(name, mode, e)
+            raise
+        _record(name, mode)
+        return result
+
+    if hedge_after and len(candidates) > 1:
+        (primary_name, primary), (secondary_name, secondary) = candidates[:2]
+        tasks = {asyncio.ensure_future(run(primary_name, primary)): primary_name}
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done or next(iter(done)).exception() is not None:
+            reason = 'hedge' if not done else 'error'
+            logger.info("Starting %s request (%s after %s)", secondary_name, reason, primary_name)
+            LLM_FALLBACKS.inc(from_provider=primary_name, to_provider=secondary_name, reason=reason)
+            tasks[asyncio.ensure_future(run(secondary_name, secondary))] = secondary_name
+
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append((tasks[task], task.exception()))
+        finally:
+            for task in pending:
+                task.cancel()
+        raise _fallback_error(errors)
+
+    for index, (name, call) in enumerate(candidates):
+        try:
+            return await run(name, call)
+        except Exception as e:
+            logger.warning("%s request failed: %s", name, e)
+            errors.append((name, e))
+            if index + 1 < len(candidates):
+                LLM_FALLBACKS.inc(from_provider=name, to_provider=candidates[index + 1][0], reason=_fallback_reason(e))
+    raise _fallback_error(errors)
@@ -0,0 +1,131 @@
+import os
+import logging
+import contextvars
+from concurrent.futures import CancelledError
+
+from utils.openai_helper import CHARACTER_PROFILES, get_chat_response, DEFAULT_MAX_TOKENS
+from utils.dialogue_helper import choose_response_pattern, is_independent_pattern, build_speaker_b_request, build_room_members_instruction
+from utils.admission import AdmissionRejected
+from utils.metrics import span
+from utils.executors import LazyThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 1つのルームに参加できるキャラクターの数
+ROOM_MAX_CHARACTERS = int(os.environ.get("ROOM_MAX_CHARACTERS", "5"))
+# ルームの応答生成に使うスレッド数（全ルームで共有。LLMの同時実行数は admission でも制限される）
+ROOM_WORKERS = int(os.environ.get("ROOM_WORKERS", "8"))
+
+room_executor = LazyThreadPoolExecutor(ROOM_WORKERS, "room")
+
+
+def validate_room(characters):
+    """参加キャラクター（UUIDのリスト）の検証（問題があればエラーメッセージを返す）"""
+    if not isinstance(characters, list) or len(characters) < 2:
+        return 'At least two characters must be specified'
+    if len(characters) > ROOM_MAX_CHARACTERS:
+        return f'At most {ROOM_MAX_CHARACTERS} characters can join a room'
+    if not all(isinstance(speaker_id, str) for speaker_id in characters):
+        return 'Characters must be speaker UUID strings'
+    if len(set(characters)) != len(characters):
+        return 'Characters must not be repeated'
+    unknown = [str(speaker_id) for speaker_id in characters if speaker_id not in CHARACTER_PROFILES]
+    if unknown:
+        return f"Unknown characters: {', '.join(unknown)}"
+    return None
+
+
+def plan_room_turn(characters):
+    """1ターンの生成順を決める
+
+    先頭のキャラクター（リード）がユーザーに答える。他のキャラクターは話者Bと同じように
+    応答パターンを選び、リードの回答を参照するパターン（同調・反対）だけリードの後に回す。
+    """
+    lead = characters[0]
+    plan = [{'speaker_id': lead, 'pattern': None, 'depends_on': None}]
+    for speaker_id in characters[1:]:
+        pattern = choose_response_pattern()
+        plan.append({
+            'speaker_id': speaker_id,
+            'pattern': pattern,
+            'depends_on': None if is_independent_pattern(pattern) else lead
+        })
+    return plan
+
+
+def _member_request(entry, characters):
+    """キャラクターへの追加指示とリードの情報"""
+    members = build_room_members_instruction(entry['speaker_id'], characters)
+    if entry['pattern'] is None:
+        return members, None
+    instruction, lead_info = build_speaker_b_request(characters[0], entry['speaker_id'], entry['pattern'])
+    return f"{instruction}\n\n{members}", lead_info
+
+
+def generate_room_replies(user_message, conversation_history, characters, turn, plan=None, degraded=False,
+                          max_tokens=DEFAULT_MAX_TOKENS, conversation_summary=None):
+    """ルームの1ターン分の応答を生成し、[{'speaker_id', 'name', 'content'}] を plan の順に返す
+
+    リードの回答を参照しないキャラクターはリードと同時に、参照するキャラクターはリードの回答が
+    届いた時点でまとめて生成するので、人数が増えても待ち時間はおよそ2回分で済む。
+    混雑で枠が取れなかったキャラクター（リード以外）は省略する。縮退時はリードだけが答える。
+    ターン（utils/turns.py）が取り消されたら、まだ始まっていない生成をやめて TurnCancelled を送出する。
+    """
+    plan = plan or plan_room_turn(characters)
+    if degraded:
+        plan = plan[:1]
+    lead = plan[0]
+
+    def generate(index, history):
+        entry = plan[index]
+        instruction, lead_info = _member_request(entry, characters)
+        # 同時に走る呼び出しをプロバイダに振り分ける
+        with span('room_lead' if index == 0 else 'room_member'):
+            return get_chat_response(
+                user_message, history, entry['speaker_id'], additional_instruction=instruction,
+                use_claude=(index % 2 == 1), speaker_a_info=lead_info, max_tokens=max_tokens,
+                conversation_summary=conversation_summary
+            )
+
+    def optional_generate(index, history):
+        try:
+            return generate(index, history)
+        except AdmissionRejected as e:
+            logger.warning("Skipping room member %s: %s", plan[index]['speaker_id'], e)
+            return None
+
+    def submit(index, history):
+        future = room_executor.submit(contextvars.copy_context().run, optional_generate, index, history)
+        turn.track(future)
+        return future
+
+    futures = {
+        index: submit(index, list(conversation_history))
+        for index in range(1, len(plan)) if plan[index]['depends_on'] is None
+    }
+    logger.debug("Room turn: %d characters, %d generated alongside the lead", len(plan), len(futures))
+
+    lead_response = generate(0, list(conversation_history))
+    turn.check()
+
+    # リードの回答を参照するキャラクターは、リードの回答を履歴に加えてから生成する
+    followed_history = list(conversation_history) + [
+        {"role": "user", "content": user_message},
+        {"role": "assistant", "content": lead_response['content']}
+    ]
+    for index in range(1, len(plan)):
+        if plan[index]['depends_on'] is not None:
+            futures[index] = submit(index, followed_history)
+
+    replies = [{'speaker_id': lead['speaker_id'], 'content': lead_response['content']}]
+    for index in sorted(futures):
+        try:
+            response = futures[index].result()
+        except CancelledError:
+            turn.check()
+            raise
+        if response is not None:
+            replies.append({'speaker_id': plan[index]['speaker_id'], 'content': response['content']})
+    for reply in replies:
+        reply['name'] = CHARACTER_PROFILES[reply['speaker_id']]['name']
+    return replies
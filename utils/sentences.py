@@ -0,0 +1,48 @@
+# 文の区切りとみなす文字と、区切りの直後に続けてよい閉じ括弧類
+SENTENCE_TERMINATORS = "。！？!?\n"
+SENTENCE_CLOSERS = "」』）)】〕\"'"
+
+
+class SentenceChunker:
+    """ストリーミングされたテキストを日本語の文単位に切り出す"""
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, delta):
+        """差分を追加し、完成した文のリストを返す"""
+        self._buffer += delta
+        sentences = []
+        start = 0
+        i = 0
+        length = len(self._buffer)
+        while i < length:
+            if self._buffer[i] in SENTENCE_TERMINATORS:
+                # 「！？」「。」」のような連続した区切り・閉じ括弧までを1文に含める
+                end = i + 1
+                while end < length and (self._buffer[end] in SENTENCE_TERMINATORS or self._buffer[end] in SENTENCE_CLOSERS):
+                    end += 1
+                if end == length:
+                    # 後続の差分で区切りが続く可能性があるため確定を待つ
+                    break
+                sentence = self._buffer[start:end].strip()
+                if sentence:
+                    sentences.append(sentence)
+                start = end
+                i = end
+                continue
+            i += 1
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """残りのテキストを最後の文として返す"""
+        remainder = self._buffer.strip()
+        self._buffer = ""
+        return [remainder] if remainder else []
+
+
+def split_sentences(text):
+    """まとまったテキストを文のリストにする"""
+    chunker = SentenceChunker()
+    return chunker.feed(text) + chunker.flush()
@@ -0,0 +1,114 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# VOICEVOXの話者データ（先に見つかったものを使う。ver0.15.5 のファイルは UTF-16）
+SPEAKER_DB_FILES = [path for path in (
+    os.environ.get("SPEAKER_DB_FILE"),
+    'attached_assets/voicevox_speakerID_ver0.15.5_1751981565407.json',
+    'attached_assets/voicebox_speakerID.json',
+) if path]
+
+# 立ち絵の表示位置（左側: 話者A、右側: 話者B）。ここにない話者は話者Aとして扱う
+CHARACTER_POSITIONS = {
+    "388f246b-8c41-4ac1-8e2d-5d79f3ff56d9": "A",  # ずんだもん
+    "35b2c544-660e-401e-b503-0e14c635303a": "A",  # 春日部つむぎ
+    "7ffcb7ce-00ec-4bdc-82cd-45a8889e43ff": "B",  # 四国めたん
+    "3474ee95-c274-47f9-aa1a-8322163d96f1": "B",  # 雨晴はう
+    "67d5d8da-acd7-4207-bb10-b5542d3a663b": "B",  # WhiteCUL
+}
+
+# リップシンク用の口の画像（static/assets/<prefix>_mouse_<状態>.png）
+MOUTH_IMAGE_PREFIXES = {
+    "7ffcb7ce-00ec-4bdc-82cd-45a8889e43ff": "metan",
+    "3474ee95-c274-47f9-aa1a-8322163d96f1": "hau",
+    "35b2c544-660e-401e-b503-0e14c635303a": "tsumugi",
+    "67d5d8da-acd7-4207-bb10-b5542d3a663b": "whiteCul",
+}
+
+
+def _decode(raw):
+    """BOMを見て UTF-16 / UTF-8 のどちらでも読めるようにする"""
+    if raw.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return raw.decode('utf-16')
+    return raw.decode('utf-8-sig')
+
+
+def load_speaker_file(path):
+    with open(path, 'rb') as f:
+        return json.loads(_decode(f.read()))
+
+
+class PrecomputedJSON:
+    """一度だけシリアライズ・gzip圧縮しておくJSONレスポンスの本文"""
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+
+
+class SpeakerRegistry:
+    """話者データを UUID・スタイルID・名前で引けるようにまとめたもの"""
+
+    def __init__(self, speakers):
+        self.speakers = speakers
+        self.by_uuid = {speaker['speaker_uuid']: speaker for speaker in speakers}
+        self.by_name = {speaker['name']: speaker for speaker in speakers}
+        self.by_style = {}
+        for speaker in speakers:
+            for style in speaker['styles']:
+                self.by_style[style['id']] = (speaker, style)
+
+        # /get-speakers と /speaker-styles の本文は起動時に作っておく
+        self.speakers_json = PrecomputedJSON([{
+            'speaker_uuid': speaker['speaker_uuid'],
+            'name': speaker['name'],
+            'styles': speaker['styles']
+        } for speaker in speakers])
+        self.styles_json = PrecomputedJSON({
+            str(style_id): {
+                'speaker_uuid': speaker['speaker_uuid'],
+                'name': speaker['name'],
+                'style': style['name'],
+                'position': self.position(speaker['speaker_uuid']),
+                'mouth': MOUTH_IMAGE_PREFIXES.get(speaker['speaker_uuid'])
+            } for style_id, (speaker, style) in self.by_style.items()
+        })
+
+    def get(self, speaker_uuid):
+        return self.by_uuid.get(speaker_uuid)
+
+    def find_by_name(self, name):
+        return self.by_name.get(name)
+
+    def speaker_for_style(self, style_id):
+        """スタイルIDから (話者, スタイル) を返す（なければ None）"""
+        return self.by_style.get(style_id)
+
+    def position(self, speaker_uuid):
+        """話者が位置A（左側）かB（右側）か"""
+        return CHARACTER_POSITIONS.get(speaker_uuid, "A")
+
+
+def load_speaker_registry(paths=SPEAKER_DB_FILES):
+    for path in paths:
+        try:
+            speakers = load_speaker_file(path)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            logger.error("Error loading VOICEVOX speaker data from %s: %s", path, e)
+            continue
+        logger.info("Loaded %d VOICEVOX speakers from %s", len(speakers), path)
+        return SpeakerRegistry(speakers)
+
+    logger.error("No VOICEVOX speaker data found (tried %s)", ', '.join(paths))
+    return SpeakerRegistry([])
+
+
+speaker_registry = load_speaker_registry()
@@ -0,0 +1,88 @@
+import os
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(ROOT_DIR, 'static')
+
+# tools/build_assets.py の出力先（ファイル名に内容のハッシュを含む）
+ASSET_DIST_DIR = os.environ.get("ASSET_DIST_DIR", os.path.join(STATIC_DIR, 'dist'))
+MANIFEST_NAME = 'manifest.json'
+
+# ファイル名が内容ごとに変わるので、ブラウザには無期限にキャッシュさせてよい
+ASSET_MAX_AGE = 31536000
+
+
+def source_digest(paths):
+    """元ファイル（static/ からの相対パス）の内容のハッシュ。ビルド後に元ファイルが変わったかの判定に使う"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(os.path.join(STATIC_DIR, path), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def _is_fresh(entry):
+    try:
+        return source_digest(entry['sources']) == entry['digest']
+    except OSError:
+        return False
+
+
+class AssetManifest:
+    """ビルド済みアセットの対応表（元ファイルが更新されていて古くなったものは使わない）"""
+
+    def __init__(self, data):
+        self.files = {}
+        self.precompressed = set()
+        self.characters = {}
+
+        stale = []
+        for path, entry in data.get('files', {}).items():
+            if not _is_fresh(entry):
+                stale.append(path)
+                continue
+            self.files[path] = entry['file']
+            if entry.get('gzip'):
+                self.precompressed.add(entry['file'])
+        for key, entry in data.get('characters', {}).items():
+            if not _is_fresh(entry):
+                stale.append(key)
+                continue
+            self.characters[key] = {
+                name: entry[name] for name in ('canvas', 'standing', 'atlas', 'atlas_size', 'frames')
+            }
+        if stale:
+            logger.warning("Built assets are out of date, serving originals for: %s "
+                           "(run python tools/build_assets.py)", ', '.join(stale))
+
+    def file(self, path):
+        """static/ からの相対パスに対応するビルド済みファイル名（なければ None）"""
+        return self.files.get(path)
+
+    def client_manifest(self):
+        """chat.js に渡す分（立ち絵とアトラス）"""
+        return {'characters': self.characters}
+
+
+def load_asset_manifest(dist_dir=ASSET_DIST_DIR):
+    path = os.path.join(dist_dir, MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        logger.info("No built assets found at %s, serving originals", path)
+        return AssetManifest({})
+    except Exception as e:
+        logger.error("Error loading asset manifest from %s: %s", path, e)
+        return AssetManifest({})
+
+    manifest = AssetManifest(data)
+    logger.info("Loaded asset manifest (%d files, %d characters)", len(manifest.files), len(manifest.characters))
+    return manifest
+
+
+asset_manifest = load_asset_manifest()
@@ -0,0 +1,221 @@
+import io
+import os
+import time
+import wave
+import zipfile
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import Counter, Histogram
+from utils.sentences import split_sentences
+from utils.executors import LazyThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 音声合成の送り先（tts.quest: 公開API、voicevox: 自前で動かす VOICEVOX エンジン）
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "tts.quest")
+# VOICEVOX エンジンのURL（カンマ区切りで複数指定すると空いているものに振り分ける）
+VOICEVOX_ENGINE_URLS = [
+    url.strip().rstrip('/')
+    for url in os.environ.get("VOICEVOX_ENGINE_URLS", "http://127.0.0.1:50021").split(',') if url.strip()
+]
+# エンジン1台あたりの同時リクエスト数（エンジンのCPUコア数に合わせる）
+VOICEVOX_ENGINE_CONCURRENCY = int(os.environ.get("VOICEVOX_ENGINE_CONCURRENCY", "2"))
+# ヘルスチェック（GET /version）の間隔（0 で無効。その場合は接続に失敗しても外さない）
+VOICEVOX_HEALTH_INTERVAL = float(os.environ.get("VOICEVOX_HEALTH_INTERVAL", "10"))
+# 全エンジンが埋まっているときに空きを待つ秒数
+VOICEVOX_QUEUE_TIMEOUT = float(os.environ.get("VOICEVOX_QUEUE_TIMEOUT", "10"))
+VOICEVOX_READ_TIMEOUT = float(os.environ.get("VOICEVOX_READ_TIMEOUT", "30"))
+
+TTS_ENGINE_SECONDS = Histogram(
+    'tts_engine_seconds', 'VOICEVOX engine request latency', ['engine', 'op']
+)
+TTS_ENGINE_ERRORS = Counter(
+    'tts_engine_errors_total', 'VOICEVOX engine request failures', ['engine', 'op']
+)
+
+
+def concat_wavs(chunks):
+    """同じ形式のWAVを順につなげて1つのWAVにする"""
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as out:
+        for i, chunk in enumerate(chunks):
+            with wave.open(io.BytesIO(chunk)) as f:
+                if i == 0:
+                    out.setparams(f.getparams())
+                out.writeframes(f.readframes(f.getnframes()))
+    return output.getvalue()
+
+
+class VoicevoxEngine:
+    """VOICEVOX エンジン1台（実行中のリクエスト数とヘルスチェックの結果を持つ）"""
+
+    def __init__(self, url, concurrency):
+        self.url = url
+        self.concurrency = concurrency
+        self.inflight = 0
+        self.served = 0
+        self.healthy = True
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency + 1, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def load(self):
+        return self.inflight / self.concurrency
+
+    def post(self, op, path, params, json):
+        started = time.perf_counter()
+        try:
+            response = self.session.post(f"{self.url}{path}", params=params, json=json,
+                                         timeout=(3, VOICEVOX_READ_TIMEOUT))
+        except requests.RequestException:
+            TTS_ENGINE_ERRORS.inc(engine=self.url, op=op)
+            raise
+        finally:
+            TTS_ENGINE_SECONDS.observe(time.perf_counter() - started, engine=self.url, op=op)
+        if not response.ok:
+            TTS_ENGINE_ERRORS.inc(engine=self.url, op=op)
+            raise Exception(f"VOICEVOX engine error ({op}): {response.status_code}")
+        return response
+
+    def check(self):
+        try:
+            return self.session.get(f"{self.url}/version", timeout=(2, 5)).ok
+        except requests.RequestException:
+            return False
+
+
+class VoicevoxEnginePool:
+    """複数の VOICEVOX エンジンに合成を振り分ける
+
+    リクエストごとに、正常なエンジンのうち負荷（実行中 / 同時実行数）が最も低いものを選ぶ。
+    全エンジンが上限に達していれば空きを待つ。接続できなかったエンジンは、ヘルスチェックが
+    通るまで振り分けの対象から外す。
+    """
+
+    # キャッシュキーに含める（tts.quest のMP3とは別の音声になる）
+    engine_params = {"engine": "voicevox", "format": "wav"}
+
+    def __init__(self, urls, concurrency=VOICEVOX_ENGINE_CONCURRENCY, health_interval=VOICEVOX_HEALTH_INTERVAL,
+                 queue_timeout=VOICEVOX_QUEUE_TIMEOUT):
+        if not urls:
+            raise Exception("No VOICEVOX engine URLs configured")
+        self.engines = [VoicevoxEngine(url, concurrency) for url in urls]
+        self.health_interval = health_interval
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._health_thread = None
+        # 文ごとの audio_query を並行して送るためのスレッド（同時実行数はエンジン側の枠で決まる）
+        self._executor = LazyThreadPoolExecutor(len(self.engines) * concurrency, "voicevox")
+
+    def available(self):
+        return any(engine.healthy for engine in self.engines)
+
+    def _start_health_checks(self):
+        # fork したワーカーでも動くように、最初に使われた時点で開始する
+        if self.health_interval <= 0 or self._health_thread is not None:
+            return
+        self._health_thread = threading.Thread(target=self._health_loop, name="voicevox-health", daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            for engine in self.engines:
+                healthy = engine.check()
+                if healthy != engine.healthy:
+                    logger.warning("VOICEVOX engine %s is now %s", engine.url, "healthy" if healthy else "unhealthy")
+                with self._cond:
+                    engine.healthy = healthy
+                    self._cond.notify_all()
+
+    def _mark_unhealthy(self, engine, error):
+        if self.health_interval <= 0:
+            return
+        logger.warning("VOICEVOX engine %s failed, removing it until the next health check: %s", engine.url, error)
+        with self._cond:
+            engine.healthy = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def acquire(self, exclude=()):
+        """最も空いている正常なエンジンの枠を1つ確保する"""
+        self._start_health_checks()
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            while True:
+                healthy = [engine for engine in self.engines if engine.healthy and engine not in exclude]
+                if not healthy:
+                    raise Exception("No healthy VOICEVOX engine available")
+                free = [engine for engine in healthy if engine.inflight < engine.concurrency]
+                if free:
+                    # 負荷が同じなら処理した件数の少ないものを選ぶ
+                    engine = min(free, key=lambda e: (e.load, e.served))
+                    engine.inflight += 1
+                    engine.served += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Exception("All VOICEVOX engines are busy")
+                self._cond.wait(remaining)
+        try:
+            yield engine
+        except (requests.ConnectionError, requests.Timeout) as e:
+            self._mark_unhealthy(engine, e)
+            raise
+        finally:
+            with self._cond:
+                engine.inflight -= 1
+                self._cond.notify()
+
+    def _post(self, op, path, params, json=None):
+        """空いているエンジンに送る（失敗したら別のエンジンで1回だけやり直す）"""
+        engine = None
+        try:
+            with self.acquire() as engine:
+                return engine.post(op, path, params, json)
+        except Exception as e:
+            # 枠が取れなかった場合や、他に正常なエンジンがない場合はそのまま失敗させる
+            if engine is None or not any(other.healthy for other in self.engines if other is not engine):
+                raise
+            logger.info("Retrying VOICEVOX %s on another engine: %s", op, e)
+        with self.acquire(exclude=(engine,)) as retry_engine:
+            return retry_engine.post(op, path, params, json)
+
+    def audio_query(self, text, style_id):
+        return self._post('audio_query', '/audio_query', {'text': text, 'speaker': style_id}).json()
+
+    def synthesize(self, text, style_id):
+        """テキストを合成してWAVのバイト列を返す
+
+        複数の文からなるテキストは、文ごとの audio_query を複数のエンジンで並行して行い、
+        合成は /multi_synthesis の1回にまとめてからつなげる。
+        """
+        sentences = split_sentences(text) or [text]
+        if len(sentences) == 1:
+            query = self.audio_query(sentences[0], style_id)
+            return self._post('synthesis', '/synthesis', {'speaker': style_id}, query).content
+
+        queries = list(self._executor.map(
+            lambda sentence: contextvars.copy_context().run(self.audio_query, sentence, style_id), sentences
+        ))
+        response = self._post('multi_synthesis', '/multi_synthesis', {'speaker': style_id}, queries)
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            chunks = [archive.read(name) for name in sorted(archive.namelist())]
+        return concat_wavs(chunks)
+
+
+def create_engine_pool():
+    """TTS_BACKEND=voicevox のときのエンジンプール（それ以外は None）"""
+    if TTS_BACKEND != 'voicevox':
+        return None
+    logger.info("Using %d VOICEVOX engine(s): %s", len(VOICEVOX_ENGINE_URLS), ', '.join(VOICEVOX_ENGINE_URLS))
+    return VoicevoxEnginePool(VOICEVOX_ENGINE_URLS)
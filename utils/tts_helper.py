@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import requests
+
+from utils.tts_backends import create_engine_pool
+
+logger = logging.getLogger(__name__)
+
+# TTS設定
+VOICEVOX_API_KEY = os.environ.get("VOICEVOX_API_KEY")
+TTS_QUEST_BASE_URL = os.environ.get("TTS_QUEST_BASE_URL", "https://api.tts.quest").rstrip('/')
+TTS_QUEST_SYNTHESIS_URL = f"{TTS_QUEST_BASE_URL}/v3/voicevox/synthesis"
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "voicevox_tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+TTS_MAX_TEXT_LENGTH = int(os.environ.get("TTS_MAX_TEXT_LENGTH", "1000"))
+
+# tts.quest のキュー待ち（retryAfter）と音声生成待ちの上限
+TTS_MAX_RETRIES = 5
+TTS_READY_TIMEOUT = 30
+TTS_POLL_INTERVAL = 0.5
+
+# 合成パラメータの既定値（キャッシュキーに含める）
+DEFAULT_ENGINE_PARAMS = {
+    "engine": "tts.quest",
+    "format": "mp3",
+}
+
+
+def tts_cache_key(text, style_id, engine_params=None):
+    """テキスト・スタイルID・合成パラメータから内容ベースのキャッシュキーを作る"""
+    params = dict(DEFAULT_ENGINE_PARAMS)
+    if engine_params:
+        params.update(engine_params)
+    payload = json.dumps(
+        {"text": text, "style_id": int(style_id), "params": params},
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AudioCache:
+    """ディスクに保存する音声キャッシュ（容量上限つきLRU、同一キーの同時リクエストは1回の合成にまとめる）"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> ファイルサイズ（古い順）
+        self._total_bytes = 0
+        self._inflight = {}  # key -> Future
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def _load_index(self):
+        """既存のキャッシュファイルを最終アクセス順に読み込む"""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.audio'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, name[:-len('.audio')], stat.st_size))
+
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+
+        logger.info("Loaded TTS cache index: %s entries, %s bytes", len(self._entries), self._total_bytes)
+        self._evict()
+
+    def _evict(self):
+        """容量上限を超えた分を古いものから削除する（ロック取得済みで呼ぶ）"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            logger.debug("Evicted TTS cache entry: %s", key)
+
+    def get(self, key):
+        """キャッシュ済みの音声を返す。存在しない場合は None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+
+        with self._lock:
+            if key not in self._entries:
+                # 別プロセスが書き込んだファイル
+                self._entries[key] = len(data)
+                self._total_bytes += len(data)
+            self._entries.move_to_end(key)
+        try:
+            # 再起動後もLRU順を復元できるように更新日時を進める
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """音声をキャッシュに書き込む（一時ファイル経由で置き換える）"""
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def get_or_create(self, key, producer):
+        """キャッシュを引き、なければ producer() で生成して保存する
+
+        同じキーの生成が進行中であれば、その結果を待って共有する。
+        """
+        reread = False
+        while True:
+            data = self.get(key)
+            if data is not None:
+                return data
+
+            with self._lock:
+                future = self._inflight.get(key)
+                # 読んだ後に前の生成が終わって保存されていれば、生成し直さずに読み直す
+                # （読み込みに失敗した側が索引から消している場合があるためファイルを確かめる）。
+                # ファイルがあっても読めない（権限・ディレクトリなど）場合に回り続けないよう、読み直しは1回だけ
+                if future is None and not reread and os.path.exists(self._path(key)):
+                    reread = True
+                    continue
+                is_owner = future is None
+                if is_owner:
+                    future = Future()
+                    self._inflight[key] = future
+            break
+
+        if not is_owner:
+            logger.debug("Waiting for in-flight TTS synthesis: %s", key)
+            return future.result()
+
+        try:
+            data = producer()
+            try:
+                self.put(key, data)
+            except OSError as e:
+                # 保存できなくても合成した音声は返す
+                logger.warning("Failed to write TTS cache entry %s: %s", key, e)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+def synthesize_tts_quest(text, style_id):
+    """tts.quest API で音声を合成し、MP3のバイト列を返す"""
+    if not VOICEVOX_API_KEY:
+        raise Exception("VOICEVOX API key not configured")
+
+    params = {
+        'key': VOICEVOX_API_KEY,
+        'speaker': style_id,
+        'text': text
+    }
+
+    # 合成を依頼（混雑時は retryAfter 秒後に再試行）
+    for attempt in range(TTS_MAX_RETRIES + 1):
+        response = requests.get(TTS_QUEST_SYNTHESIS_URL, params=params, timeout=(5, 30))
+        if not response.ok:
+            raise Exception(f"TTS API error: {response.status_code}")
+        result = response.json()
+
+        if result.get('retryAfter') is not None:
+            if attempt >= TTS_MAX_RETRIES:
+                raise Exception("最大リトライ回数を超えました")
+            logger.debug("TTS API busy, retrying after %s seconds", result['retryAfter'])
+            time.sleep(1 + result['retryAfter'])
+            continue
+
+        if result.get('errorMessage'):
+            raise Exception(result['errorMessage'])
+        if not result.get('mp3DownloadUrl'):
+            raise Exception("不明なサーバーエラー")
+        break
+
+    # 音声の生成完了を待つ
+    status_url = result.get('audioStatusUrl')
+    if status_url:
+        deadline = time.monotonic() + TTS_READY_TIMEOUT
+        while True:
+            status = requests.get(status_url, timeout=(5, 10)).json()
+            if status.get('isAudioError'):
+                raise Exception("音声生成中にエラーが発生しました")
+            if status.get('isAudioReady'):
+                break
+            if time.monotonic() > deadline:
+                raise Exception("音声生成がタイムアウトしました")
+            time.sleep(TTS_POLL_INTERVAL)
+
+    audio_response = requests.get(result['mp3DownloadUrl'], timeout=(5, 30))
+    if not audio_response.ok:
+        raise Exception(f"TTS audio download error: {audio_response.status_code}")
+    return audio_response.content
+
+
+audio_cache = AudioCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
+
+# TTS_BACKEND=voicevox なら自前の VOICEVOX エンジンで合成する（utils/tts_backends.py）
+engine_pool = create_engine_pool()
+
+
+def tts_available():
+    """音声合成が使えるかどうか"""
+    if engine_pool:
+        return engine_pool.available()
+    return bool(VOICEVOX_API_KEY)
+
+
+def audio_mimetype(data):
+    return 'audio/wav' if data[:4] == b'RIFF' else 'audio/mpeg'
+
+
+def audio_cache_key(text, style_id):
+    """使っている合成エンジンでの音声のキャッシュキー（/tts の ETag にもなる）"""
+    if engine_pool:
+        return tts_cache_key(text, style_id, engine_pool.engine_params)
+    return tts_cache_key(text, style_id)
+
+
+def get_tts_audio(text, style_id):
+    """音声を取得する（キャッシュ優先）。(キャッシュキー, 音声のバイト列) を返す
+
+    tts.quest ならMP3、VOICEVOX エンジンならWAV。
+    """
+    key = audio_cache_key(text, style_id)
+    if engine_pool:
+        return key, audio_cache.get_or_create(key, lambda: engine_pool.synthesize(text, style_id))
+    return key, audio_cache.get_or_create(key, lambda: synthesize_tts_quest(text, style_id))
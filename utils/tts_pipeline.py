@@ -0,0 +1,38 @@
+import os
+import logging
+
+from utils.tts_helper import get_tts_audio, TTS_MAX_TEXT_LENGTH
+from utils.lipsync import get_lipsync_timeline, audio_duration
+from utils.executors import LazyThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 文ごとの先行合成に使うスレッド数
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", "4"))
+tts_executor = LazyThreadPoolExecutor(TTS_WORKERS, "tts")
+
+
+def _synthesize_chunk(text, style_id):
+    """合成してキャッシュに入れ、{'duration', 'timeline'} を返す（失敗した場合は None）"""
+    try:
+        key, audio = get_tts_audio(text, style_id)
+    except Exception as e:
+        logger.warning("Prefetch synthesis failed for chunk: %s", e)
+        return None
+    try:
+        timeline = get_lipsync_timeline(key, audio)
+    except Exception as e:
+        logger.debug("Prefetch lip-sync timeline failed for chunk: %s", e)
+        timeline = None
+    return {'duration': audio_duration(audio, timeline), 'timeline': timeline}
+
+
+def submit_tts_chunk(text, style_id):
+    """文を先行して合成し、キャッシュを温める
+
+    クライアントが /tts を要求した時点で合成中であれば、その結果を待って共有する。
+    """
+    if len(text) > TTS_MAX_TEXT_LENGTH:
+        logger.warning("Skipping prefetch for chunk longer than %s characters", TTS_MAX_TEXT_LENGTH)
+        return None
+    return tts_executor.submit(_synthesize_chunk, text, style_id)
@@ -0,0 +1,172 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import itertools
+from concurrent.futures import Future
+
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# 同じ冪等キーのリクエストに同じ結果を返す期間（秒）。完了後もこの間は再実行しない
+TURN_IDEMPOTENCY_TTL = float(os.environ.get("TURN_IDEMPOTENCY_TTL", "60"))
+
+TURNS_CANCELLED = Counter(
+    'chat_turns_cancelled_total', 'Chat turns superseded by a newer message'
+)
+TURNS_COALESCED = Counter(
+    'chat_turns_coalesced_total', 'Duplicate chat requests answered by an earlier execution'
+)
+
+
+class TurnCancelled(Exception):
+    """新しいメッセージが届いたため、このターンの残りの処理をやめる"""
+
+
+class Turn:
+    """会話の1ターン。取り消されたら以降のLLM呼び出しと、まだ始まっていない音声合成をやめる"""
+
+    def __init__(self, conversation_id, turn_id):
+        self.conversation_id = conversation_id
+        self.id = turn_id
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._futures = []
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def track(self, future):
+        """取り消し時にまとめてキャンセルする処理を登録する"""
+        if future is None:
+            return
+        with self._lock:
+            if not self.cancelled:
+                self._futures.append(future)
+                return
+        future.cancel()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self._cancelled.set()
+            futures, self._futures = self._futures, []
+        dropped = sum(1 for future in futures if future.cancel())
+        TURNS_CANCELLED.inc()
+        logger.info("Cancelled turn %s (%d queued jobs dropped)", self.id, dropped)
+
+    def check(self):
+        """取り消されていれば TurnCancelled を送出する"""
+        if self.cancelled:
+            raise TurnCancelled(f"Turn {self.id} was superseded")
+
+
+class TurnRegistry:
+    """会話ごとの実行中のターンと、冪等キーごとの実行結果を持つ（プロセス内）"""
+
+    def __init__(self, idempotency_ttl=TURN_IDEMPOTENCY_TTL):
+        self.idempotency_ttl = idempotency_ttl
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._current = {}  # 会話ID -> Turn
+        self._requests = {}  # 冪等キー -> [Future または None, 期限（実行中は None）]
+
+    def begin(self, conversation_id):
+        """新しいターンを始める。同じ会話の前のターンが実行中なら取り消す"""
+        turn = Turn(conversation_id, next(self._ids))
+        with self._lock:
+            previous = self._current.get(conversation_id)
+            self._current[conversation_id] = turn
+        if previous is not None:
+            previous.cancel()
+        return turn
+
+    def finish(self, turn):
+        with self._lock:
+            if self._current.get(turn.conversation_id) is turn:
+                del self._current[turn.conversation_id]
+
+    def cancel_current(self, conversation_id):
+        with self._lock:
+            turn = self._current.pop(conversation_id, None)
+        if turn is not None:
+            turn.cancel()
+
+    def _expire(self, now):
+        """期限の切れた冪等キーを捨てる（ロック取得済みで呼ぶ）"""
+        expired = [key for key, (_, expires_at) in self._requests.items() if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._requests[key]
+
+    def _join(self, key):
+        """冪等キーの実行に加わる。(自分が実行するか, Future) を返す"""
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._requests.get(key)
+            if entry is None:
+                future = Future()
+                self._requests[key] = [future, None]
+                return True, future
+        TURNS_COALESCED.inc()
+        logger.debug("Coalescing duplicate request: %s", key)
+        return False, entry[0]
+
+    def _settle(self, key, future, result=None, error=None):
+        if error is not None:
+            # 失敗したリクエストはやり直せるようにキーを残さない
+            future.set_exception(error)
+            with self._lock:
+                self._requests.pop(key, None)
+            return
+        future.set_result(result)
+        with self._lock:
+            self._requests[key][1] = time.monotonic() + self.idempotency_ttl
+
+    def coalesce(self, key, producer):
+        """同じ冪等キーのリクエストは1回だけ実行し、結果を共有する"""
+        is_owner, future = self._join(key)
+        if not is_owner:
+            return future.result()
+        try:
+            result = producer()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def coalesce_async(self, key, producer):
+        """coalesce の非同期版（producer はコルーチン関数）"""
+        is_owner, future = self._join(key)
+        if not is_owner:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await producer()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    def claim(self, key):
+        """ストリーミングのターン用。初めてのキーなら True（重複なら False）"""
+        with self._lock:
+            self._expire(time.monotonic())
+            if key in self._requests:
+                TURNS_COALESCED.inc()
+                return False
+            self._requests[key] = [None, None]
+            return True
+
+    def release(self, key):
+        """claim したキーの期限を設定する（以降 TTL の間は重複として扱う）"""
+        with self._lock:
+            if key in self._requests:
+                self._requests[key][1] = time.monotonic() + self.idempotency_ttl
+
+
+turn_registry = TurnRegistry()
@@ -0,0 +1,89 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_thread = None
+_state = {
+    'warm': False,
+    'pid': None,  # 温めたプロセス（preload ならマスター）
+    'seconds': {},
+}
+_started = time.monotonic()
+
+
+def _reset_after_fork():
+    # fork 時に他のスレッドが持っていたロックを引き継がないようにする
+    global _lock, _thread
+    _lock = threading.Lock()
+    _thread = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _steps():
+    """(名前, 関数) の一覧。どれも読み取り専用のデータを作るだけで、スレッドや接続は作らない"""
+    from utils.openai_helper import CHARACTER_PROFILES, ANTHROPIC_API_KEY, build_persona_prefix, load_anthropic_sdk
+    from utils.calendar_context import calendar_context
+
+    def persona_prefixes():
+        for speaker_id in CHARACTER_PROFILES:
+            build_persona_prefix(speaker_id)
+
+    steps = [('calendar', calendar_context.now), ('persona_prefixes', persona_prefixes)]
+    if ANTHROPIC_API_KEY:
+        steps.append(('anthropic_sdk', load_anthropic_sdk))
+    return steps
+
+
+def warm_up():
+    """初回のリクエストで行う読み込みを先に済ませる（何度呼んでもよい）
+
+    gunicorn.conf.py では fork する前のマスタープロセスで呼び、ワーカーは温まった状態で始まる。
+    """
+    with _lock:
+        if _state['warm']:
+            return
+        started = time.perf_counter()
+        seconds = {}
+        for name, step in _steps():
+            step_started = time.perf_counter()
+            step()
+            seconds[name] = round(time.perf_counter() - step_started, 4)
+        _state.update(warm=True, pid=os.getpid(), seconds=seconds)
+    logger.info("Warm-up finished in %.3fs: %s", time.perf_counter() - started, seconds)
+
+
+def start_warm_up():
+    """温めを裏で始める（温め済み・実行中なら何もしない）"""
+    global _thread
+    with _lock:
+        if _state['warm'] or _thread is not None:
+            return
+        _thread = threading.Thread(target=_warm_up_in_background, name="warm-up", daemon=True)
+        _thread.start()
+
+
+def _warm_up_in_background():
+    global _thread
+    try:
+        warm_up()
+    except Exception as e:
+        logger.error("Warm-up failed: %s", e)
+    finally:
+        # 失敗したら次の問い合わせでやり直す
+        _thread = None
+
+
+def warmup_status():
+    """/healthz で返す温めの状態"""
+    return {
+        'warm': _state['warm'],
+        'preloaded': _state['warm'] and _state['pid'] != os.getpid(),
+        'warmup_seconds': _state['seconds'],
+        'uptime_seconds': round(time.monotonic() - _started, 3),
+    }